@@ -0,0 +1,234 @@
+import os
+import pickle
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Load cache settings from .env file
+load_dotenv()
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_DEFAULT_TTL = float(os.getenv("CACHE_DEFAULT_TTL", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "airp")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# --- Backend ---
+
+class InProcessBackend:
+    """Cache in memoria con TTL ed eviction LRU a dimensione limitata"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any, Tuple[str, ...]]]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key: str, value: Any, ttl: float, tags: Iterable[str] = ()):
+        tags = tuple(tags)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, set()):
+                    if key in self._entries:
+                        self._remove(key)
+                        removed += 1
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def _remove(self, key: str):
+        # Chiamato con il lock già acquisito
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class RedisBackend:
+    """Cache condivisa su Redis: i valori sono serializzati con pickle, i tag sono set Redis"""
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = CACHE_KEY_PREFIX, client: Any = None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:cache:{key}"
+
+    def _tag(self, tag: str) -> str:
+        return f"{self.prefix}:tag:{tag}"
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        raw = self.client.get(self._key(key))
+        if raw is None:
+            return False, None
+        return True, pickle.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: float, tags: Iterable[str] = ()):
+        redis_key = self._key(key)
+        ttl_ms = max(int(ttl * 1000), 1)
+        pipe = self.client.pipeline()
+        pipe.set(redis_key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), px=ttl_ms)
+        for tag in tags:
+            tag_key = self._tag(tag)
+            pipe.sadd(tag_key, redis_key)
+            # Il set scade con il membro più longevo: NX per il set appena creato, GT per allungarlo
+            # (Redis 7+), così i tag di chiavi mai invalidate non restano in Redis per sempre
+            pipe.pexpire(tag_key, ttl_ms, nx=True)
+            pipe.pexpire(tag_key, ttl_ms, gt=True)
+        pipe.execute()
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        removed = 0
+        for tag in tags:
+            tag_key = self._tag(tag)
+            keys = self.client.smembers(tag_key)
+            pipe = self.client.pipeline()
+            if keys:
+                pipe.delete(*keys)
+            pipe.delete(tag_key)
+            removed += pipe.execute()[0] if keys else 0
+        return removed
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f"{self.prefix}:*"))
+        if keys:
+            self.client.delete(*keys)
+
+# --- Cache con coalescenza delle richieste ---
+
+class _InFlight:
+    """Calcolo in corso per una chiave: gli altri chiamanti attendono il risultato"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class Cache:
+    """Facciata della cache usata da crud e dalle view"""
+
+    def __init__(self, backend: Any, default_ttl: float = CACHE_DEFAULT_TTL):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self._inflight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0}
+
+    def get_or_set(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = None, tags: Iterable[str] = ()) -> Any:
+        """
+        Ritorna il valore in cache per `key`, altrimenti lo calcola con `loader`.
+        Richieste concorrenti per la stessa chiave eseguono `loader` una sola volta.
+        """
+        found, value = self._backend_get(key)
+        if found:
+            self.stats['hits'] += 1
+            return value
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _InFlight()
+                self._inflight[key] = flight
+
+        if not leader:
+            self.stats['coalesced'] += 1
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        self.stats['misses'] += 1
+        try:
+            flight.value = loader()
+            self._backend_set(key, flight.value, self.default_ttl if ttl is None else ttl, tags)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def invalidate(self, *tags: str):
+        """Invalida tutte le chiavi associate ai tag indicati"""
+        try:
+            removed = self.backend.invalidate_tags(tags)
+            logger.debug(f"Cache invalidata per tag {tags}: {removed} chiavi")
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"Invalidazione cache fallita per tag {tags}: {e}")
+
+    def clear(self):
+        self.backend.clear()
+
+    def _backend_get(self, key: str) -> Tuple[bool, Any]:
+        # Un backend non raggiungibile degrada a cache miss invece di rompere la richiesta
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"Lettura cache fallita per {key}: {e}")
+            return False, None
+
+    def _backend_set(self, key: str, value: Any, ttl: float, tags: Iterable[str]):
+        try:
+            self.backend.set(key, value, ttl, tags)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"Scrittura cache fallita per {key}: {e}")
+
+
+def create_cache(backend_name: str = CACHE_BACKEND) -> Cache:
+    """Crea la cache in base a CACHE_BACKEND ('memory' o 'redis')"""
+    if backend_name == "redis":
+        try:
+            return Cache(RedisBackend())
+        except ImportError:
+            logger.warning("Pacchetto 'redis' non installato, uso la cache in memoria")
+    elif backend_name != "memory":
+        logger.warning(f"CACHE_BACKEND '{backend_name}' sconosciuto, uso la cache in memoria")
+    return Cache(InProcessBackend())
+
+
+# Istanza globale della cache
+cache = create_cache()
@@ -0,0 +1,134 @@
+import logging
+from contextvars import ContextVar
+from typing import Any, Callable
+
+from fastapi import HTTPException, Request, Response
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = {MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack"}
+
+# Formato di risposta scelto per la richiesta corrente
+_response_msgpack: ContextVar[bool] = ContextVar("response_msgpack", default=False)
+
+
+def accepts_msgpack(accept: str) -> bool:
+    """True se l'header Accept preferisce msgpack rispetto a JSON"""
+    best_msgpack, best_json = 0.0, 0.0
+    for part in accept.split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media_type.lower() in MSGPACK_MEDIA_TYPES:
+            best_msgpack = max(best_msgpack, quality)
+        elif media_type.lower() in ("application/json", "application/*", "*/*"):
+            best_json = max(best_json, quality)
+    return best_msgpack > 0 and best_msgpack >= best_json
+
+
+class MsgpackRequest(Request):
+    """Request che accetta body msgpack e/o compressi con zstd"""
+
+    async def body(self) -> bytes:
+        if not hasattr(self, "_body"):
+            body = await super().body()
+            if self.scope.get("airp.body_encoding") == "zstd":
+                try:
+                    body = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+                except zstandard.ZstdError as e:
+                    raise HTTPException(status_code=400, detail=f"Invalid zstd body: {e}")
+            self._body = body
+        return self._body
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            if self.scope.get("airp.body_format") == "msgpack":
+                try:
+                    self._json = msgpack.unpackb(await self.body(), raw=False)
+                except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+                    raise HTTPException(status_code=400, detail=f"Invalid msgpack body: {e}")
+            else:
+                return await super().json()
+        return self._json
+
+
+class NegotiatedResponse(JSONResponse):
+    """JSONResponse che serializza in msgpack quando il client lo preferisce"""
+
+    def render(self, content: Any) -> bytes:
+        if _response_msgpack.get():
+            self.media_type = MSGPACK_MEDIA_TYPE
+            return msgpack.packb(content, use_bin_type=True)
+        return super().render(content)
+
+
+def _rewrite_scope(scope: dict) -> dict:
+    """
+    Prepara lo scope per FastAPI: un body msgpack viene presentato come JSON
+    (il decoding vero avviene in MsgpackRequest.json) e Content-Encoding zstd viene rimosso.
+    """
+    headers = []
+    scope = dict(scope)
+    for name, value in scope["headers"]:
+        if name == b"content-type" and value.split(b";")[0].strip().decode("latin-1").lower() in MSGPACK_MEDIA_TYPES:
+            if msgpack is None:
+                raise HTTPException(status_code=415, detail="msgpack not supported by this server")
+            scope["airp.body_format"] = "msgpack"
+            value = b"application/json"
+        elif name == b"content-encoding" and value.strip().lower() == b"zstd":
+            if zstandard is None:
+                raise HTTPException(status_code=415, detail="zstd not supported by this server")
+            scope["airp.body_encoding"] = "zstd"
+            continue
+        headers.append((name, value))
+    scope["headers"] = headers
+    return scope
+
+
+class MsgpackRoute(APIRoute):
+    """
+    Route per gli endpoint dati: negozia application/msgpack in richiesta e risposta.
+    Le route con response_class esplicita (HTML) mantengono la loro risposta.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        # Una response_class esplicita disattiva il fast path JSON di FastAPI e passa da render()
+        if msgpack is not None and isinstance(kwargs.get("response_class", DefaultPlaceholder(None)), DefaultPlaceholder):
+            kwargs["response_class"] = NegotiatedResponse
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        original_route_handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            request = MsgpackRequest(_rewrite_scope(request.scope), request.receive)
+            use_msgpack = msgpack is not None and accepts_msgpack(request.headers.get("accept", ""))
+            token = _response_msgpack.set(use_msgpack)
+            try:
+                response = await original_route_handler(request)
+            finally:
+                _response_msgpack.reset(token)
+            if isinstance(response, NegotiatedResponse):
+                response.headers["Vary"] = "Accept"
+            return response
+
+        return route_handler
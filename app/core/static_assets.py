@@ -0,0 +1,156 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Optional
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Gli asset con fingerprint vengono scritti in <static>/build con un manifest
+BUILD_DIRNAME = "build"
+MANIFEST_NAME = "manifest.json"
+ASSET_EXTENSIONS = {".css", ".js", ".svg", ".json", ".html", ".txt"}
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Encoding precompressi in ordine di preferenza: (Accept-Encoding, suffisso file)
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# --- Build step ---
+
+def content_hash(data: bytes, length: int = 12) -> str:
+    return hashlib.sha256(data).hexdigest()[:length]
+
+def build_assets(static_dir: Path) -> Dict[str, str]:
+    """
+    Copia gli asset statici in <static>/build con il nome contenente l'hash del contenuto,
+    scrive le varianti .gz (e .br se il pacchetto brotli è installato) e il manifest.
+    Ritorna il manifest {percorso originale: percorso con hash}.
+    """
+    static_dir = Path(static_dir)
+    build_dir = static_dir / BUILD_DIRNAME
+    if build_dir.exists():
+        shutil.rmtree(build_dir)
+    build_dir.mkdir(parents=True)
+
+    manifest = {}
+    for source in sorted(static_dir.rglob("*")):
+        if not source.is_file() or build_dir in source.parents:
+            continue
+        if source.suffix not in ASSET_EXTENSIONS:
+            continue
+
+        data = source.read_bytes()
+        relative = source.relative_to(static_dir)
+        hashed = relative.with_name(f"{relative.stem}.{content_hash(data)}{relative.suffix}")
+        target = build_dir / hashed
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+
+        # mtime=0 rende l'output gzip riproducibile tra build
+        target.with_name(target.name + ".gz").write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            target.with_name(target.name + ".br").write_bytes(brotli.compress(data, quality=11))
+
+        manifest[relative.as_posix()] = f"{BUILD_DIRNAME}/{hashed.as_posix()}"
+        logger.info(f"Asset {relative} -> {hashed}")
+
+    if brotli is None:
+        logger.warning("Pacchetto 'brotli' non installato, generate solo le varianti gzip")
+
+    (build_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
+
+def load_manifest(static_dir: Path) -> Dict[str, str]:
+    manifest_path = Path(static_dir) / BUILD_DIRNAME / MANIFEST_NAME
+    try:
+        return json.loads(manifest_path.read_text())
+    except FileNotFoundError:
+        logger.info("Manifest asset non trovato, uso i file statici originali")
+        return {}
+
+# --- Helper per i template ---
+
+class AssetResolver:
+    """Risolve i percorsi statici nei nomi con hash, con fallback al file originale"""
+
+    def __init__(self, static_dir: Path, url_prefix: str = "/static"):
+        self.url_prefix = url_prefix.rstrip("/")
+        self.manifest = load_manifest(static_dir)
+
+    def __call__(self, path: str) -> str:
+        path = path.lstrip("/")
+        return f"{self.url_prefix}/{self.manifest.get(path, path)}"
+
+# --- Serving ---
+
+def _accepted_encodings(accept_encoding: str) -> set:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if token and params not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(token.lower())
+    return accepted
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles che per gli asset con fingerprint serve la variante .br/.gz
+    corrispondente ad Accept-Encoding, con Cache-Control immutable.
+    """
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        full_path = str(full_path)
+        if not self._is_fingerprinted(full_path):
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        request_headers = Headers(scope=scope)
+        accepted = _accepted_encodings(request_headers.get("accept-encoding", ""))
+        media_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+        headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+
+        encoded = self._lookup_encoded(full_path, accepted)
+        if encoded is not None:
+            encoded_path, encoded_stat, encoding = encoded
+            headers["Content-Encoding"] = encoding
+            response = FileResponse(encoded_path, status_code=status_code, stat_result=encoded_stat,
+                                    media_type=media_type, headers=headers)
+        else:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result,
+                                    media_type=media_type, headers=headers)
+
+        if self.is_not_modified(response.headers, request_headers):
+            return Response(status_code=304, headers={k: v for k, v in response.headers.items()
+                                                      if k in ("cache-control", "etag", "vary", "content-encoding")})
+        return response
+
+    def _is_fingerprinted(self, full_path: str) -> bool:
+        """Solo i file sotto <static>/build hanno l'hash nel nome, tranne il manifest"""
+        if self.directory is None:
+            return False
+        relative = Path(os.path.relpath(os.path.realpath(full_path), os.path.realpath(self.directory)))
+        return (len(relative.parts) > 1 and relative.parts[0] == BUILD_DIRNAME
+                and relative.parts[1:] != (MANIFEST_NAME,))
+
+    @staticmethod
+    def _lookup_encoded(full_path: str, accepted: set) -> Optional[tuple]:
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            try:
+                encoded_stat = os.stat(full_path + suffix)
+            except FileNotFoundError:
+                continue
+            return full_path + suffix, encoded_stat, encoding
+        return None
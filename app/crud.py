@@ -1,9 +1,66 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from typing import List, Optional
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import and_, case, delete, event, func, insert, select, update
 
 # Importa i modelli e gli schemi usando alias per chiarezza
 from .models import project as project_model, source as source_model, entity as entity_model
 from .schemas import project as project_schema, source as source_schema, entity as entity_schema
+from .core.cache import cache
+from .services import near_duplicates
+
+# Tag di invalidazione della cache
+PROJECTS_TAG = "projects"
+STATS_TAG = "stats"
+SEARCH_TAG = "search"
+
+def project_tag(project_id: int) -> str:
+    return f"project:{project_id}"
+
+# Tag in attesa del commit del chiamante (funzioni chiamate con commit=False)
+PENDING_TAGS_KEY = "cache_pending_tags"
+
+def _invalidate(db: Session, commit: bool, *tags: str):
+    """
+    Invalida i tag a dati già committati: subito se la funzione ha fatto commit, altrimenti
+    al commit della sessione. Invalidando prima, un lettore concorrente potrebbe rimettere
+    in cache lo stato precedente al commit.
+    """
+    if commit:
+        cache.invalidate(*tags)
+    else:
+        db.info.setdefault(PENDING_TAGS_KEY, set()).update(tags)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_pending_tags(session: Session):
+    tags = session.info.pop(PENDING_TAGS_KEY, None)
+    if tags:
+        cache.invalidate(*tags)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_tags(session: Session):
+    # Le modifiche annullate non hanno toccato i dati in cache
+    session.info.pop(PENDING_TAGS_KEY, None)
+
+# Colonne restituite da INSERT/UPDATE ... RETURNING, mappate direttamente sugli schemi di risposta
+PROJECT_COLUMNS = (
+    project_model.Project.id,
+    project_model.Project.name,
+    project_model.Project.description,
+    project_model.Project.created_at,
+)
+SOURCE_COLUMNS = (
+    source_model.Source.id,
+    source_model.Source.title,
+    source_model.Source.url,
+    source_model.Source.content,
+    source_model.Source.created_at,
+    source_model.Source.project_id,
+    source_model.Source.etag,
+    source_model.Source.last_modified,
+    source_model.Source.fetched_at,
+    source_model.Source.content_hash,
+    source_model.Source.duplicate_of,
+)
 
 # --- CRUD per i Progetti ---
 
@@ -13,64 +70,263 @@ def get_project(db: Session, project_id: int):
 def get_projects(db: Session, skip: int = 0, limit: int = 100):
     return db.query(project_model.Project).offset(skip).limit(limit).all()
 
-def create_project(db: Session, project: project_schema.ProjectCreate):
-    db_project = project_model.Project(name=project.name, description=project.description)
-    db.add(db_project)
-    db.commit()
-    db.refresh(db_project)
-    return db_project
+def get_project_summaries(db: Session, skip: int = 0, limit: int = 100) -> List[project_schema.ProjectSummary]:
+    """Lista progetti con i conteggi delle fonti calcolati nel database, senza caricare i contenuti"""
+    Project = project_model.Project
+    Source = source_model.Source
+    has_content = and_(Source.content.isnot(None), Source.content != '')
+    rows = db.query(
+        Project.id, Project.name, Project.description, Project.created_at,
+        func.count(Source.id).label("source_count"),
+        func.count(case((has_content, Source.id))).label("sources_with_content"),
+    ).outerjoin(Source, Source.project_id == Project.id).group_by(Project.id).order_by(Project.id).offset(skip).limit(limit).all()
+    return [project_schema.ProjectSummary(**row._mapping) for row in rows]
+
+def get_project_summaries_cached(db: Session, skip: int = 0, limit: int = 100):
+    # In cache solo la proiezione con i conteggi: fonti e contenuti restano fuori
+    return cache.get_or_set(
+        f"projects:summary:{skip}:{limit}",
+        lambda: [summary.model_dump() for summary in get_project_summaries(db, skip=skip, limit=limit)],
+        tags=[PROJECTS_TAG],
+    )
+
+def count_sources_for_project(db: Session, project_id: int) -> int:
+    return cache.get_or_set(
+        f"project:{project_id}:source_count",
+        lambda: db.query(func.count(source_model.Source.id)).filter(source_model.Source.project_id == project_id).scalar(),
+        tags=[project_tag(project_id)],
+    )
 
-def update_project(db: Session, project_id: int, project_update: project_schema.ProjectUpdate):
+def get_dashboard_stats(db: Session) -> dict:
+    def load():
+        total_projects = db.query(func.count(project_model.Project.id)).scalar()
+        total_sources = db.query(func.count(source_model.Source.id)).scalar()
+        sources_with_content = db.query(func.count(source_model.Source.id)).filter(
+            source_model.Source.content.isnot(None),
+            source_model.Source.content != ''
+        ).scalar()
+        return {
+            "total_projects": total_projects,
+            "total_sources": total_sources,
+            "sources_with_content": sources_with_content,
+            "sources_without_content": total_sources - sources_with_content
+        }
+    return cache.get_or_set("stats:dashboard", load, tags=[STATS_TAG])
+
+def create_project(db: Session, project: project_schema.ProjectCreate, commit: bool = True):
+    # Un solo round trip: INSERT ... RETURNING al posto di add/commit/refresh
+    row = db.execute(
+        insert(project_model.Project)
+        .values(name=project.name, description=project.description)
+        .returning(*PROJECT_COLUMNS)
+    ).one()
+    if commit:
+        db.commit()
+    _invalidate(db, commit, PROJECTS_TAG, STATS_TAG)
+    # Un progetto appena creato non ha fonti
+    return project_schema.Project(**row._mapping)
+
+def update_project(db: Session, project_id: int, project_update: project_schema.ProjectUpdate, commit: bool = True):
+    update_data = project_update.dict(exclude_unset=True)
+    if not update_data:
+        return get_project(db, project_id)
+    row = db.execute(
+        update(project_model.Project)
+        .where(project_model.Project.id == project_id)
+        .values(**update_data)
+        .returning(*PROJECT_COLUMNS)
+    ).one_or_none()
+    if row is None:
+        return None
+    if commit:
+        db.commit()
+    # Il nome del progetto compare anche nei risultati di ricerca in cache
+    _invalidate(db, commit, PROJECTS_TAG, SEARCH_TAG, project_tag(project_id))
+    sources = db.query(source_model.Source).options(
+        selectinload(source_model.Source.entities)
+    ).filter(source_model.Source.project_id == project_id).all()
+    return project_schema.Project(**row._mapping, sources=sources)
+
+def delete_project(db: Session, project_id: int):
     db_project = get_project(db, project_id)
     if not db_project:
         return None
-    update_data = project_update.dict(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(db_project, key, value)
+    # Le fonti non vengono caricate (passive_deletes): le elimina ON DELETE CASCADE nel database
+    deleted_project = project_schema.Project(
+        id=db_project.id,
+        name=db_project.name,
+        description=db_project.description,
+        created_at=db_project.created_at,
+    )
+    db.delete(db_project)
     db.commit()
-    db.refresh(db_project)
-    return db_project
+    cache.invalidate(PROJECTS_TAG, STATS_TAG, SEARCH_TAG, project_tag(project_id))
+    return deleted_project
 
-def delete_project(db: Session, project_id: int):
-    db_project = get_project(db, project_id)
-    if db_project:
-        db.delete(db_project)
-        db.commit()
-    return db_project
+def delete_project_sources_batch(db: Session, project_id: int, batch_size: int = 1000) -> int:
+    """Elimina un blocco di fonti del progetto lato server, ritorna il numero di righe eliminate"""
+    batch_ids = db.query(source_model.Source.id).filter(
+        source_model.Source.project_id == project_id
+    ).limit(batch_size).scalar_subquery()
+    deleted = db.query(source_model.Source).filter(
+        source_model.Source.id.in_(batch_ids)
+    ).delete(synchronize_session=False)
+    db.commit()
+    # Conteggi delle fonti e statistiche scendono a ogni blocco, non solo alla fine della cancellazione
+    if deleted:
+        cache.invalidate(PROJECTS_TAG, STATS_TAG, SEARCH_TAG, project_tag(project_id))
+    return deleted
 
 # --- CRUD per le Fonti ---
 
 def get_source(db: Session, source_id: int):
     return db.query(source_model.Source).filter(source_model.Source.id == source_id).first()
 
+def delete_source(db: Session, source_id: int):
+    """Elimina una fonte; le sue copie passano a un nuovo originale invece di restare fuori dall'indice"""
+    db_source = get_source(db, source_id)
+    if db_source is None:
+        return None
+    deleted_source = source_schema.Source.model_validate(db_source)
+    near_duplicates.release_copies(db, [source_id])
+    db.execute(delete(source_model.Source).where(source_model.Source.id == source_id))
+    db.commit()
+    cache.invalidate(PROJECTS_TAG, STATS_TAG, SEARCH_TAG, project_tag(deleted_source.project_id))
+    return deleted_source
+
 def get_sources_for_project(db: Session, project_id: int, skip: int = 0, limit: int = 100):
-    return db.query(source_model.Source).filter(source_model.Source.project_id == project_id).offset(skip).limit(limit).all()
+    # Entità caricate con una query per blocco, non una per fonte
+    return db.query(source_model.Source).options(
+        selectinload(source_model.Source.entities)
+    ).filter(source_model.Source.project_id == project_id).offset(skip).limit(limit).all()
 
-def create_project_source(db: Session, source: source_schema.SourceCreate, project_id: int):
-    db_source = source_model.Source(**source.dict(), project_id=project_id)
-    db.add(db_source)
-    db.commit()
-    db.refresh(db_source)
-    return db_source
+def create_project_source(db: Session, source: source_schema.SourceCreate, project_id: int, commit: bool = True):
+    row = db.execute(
+        insert(source_model.Source)
+        .values(**source.dict(), project_id=project_id)
+        .returning(*SOURCE_COLUMNS)
+    ).one()
+    if commit:
+        db.commit()
+    _invalidate(db, commit, PROJECTS_TAG, STATS_TAG, SEARCH_TAG, project_tag(project_id))
+    # Una fonte appena creata non ha entità
+    return source_schema.Source(**row._mapping)
+
+def create_project_sources_bulk(db: Session, sources: List[source_schema.SourceCreate], project_id: int, commit: bool = True):
+    """Inserisce più fonti con un solo INSERT ... RETURNING"""
+    if not sources:
+        return []
+    rows = db.execute(
+        insert(source_model.Source).returning(*SOURCE_COLUMNS),
+        [{**source.dict(), "project_id": project_id} for source in sources]
+    ).all()
+    if commit:
+        db.commit()
+    _invalidate(db, commit, PROJECTS_TAG, STATS_TAG, SEARCH_TAG, project_tag(project_id))
+    return [source_schema.Source(**row._mapping) for row in rows]
 
-def update_source_content(db: Session, source_id: int, content: str):
-    db_source = get_source(db, source_id=source_id)
-    if not db_source:
+def update_source_content(db: Session, source_id: int, content: str, commit: bool = True,
+                          validators: Optional[dict] = None):
+    # validators: etag, last_modified, fetched_at, content_hash del download che ha prodotto il contenuto
+    # (e url se la pagina si è spostata con un redirect permanente)
+    # Firma SimHash e confronto con le altre fonti del progetto (duplicate_of per i quasi-duplicati):
+    # una SELECT legge firma e duplicate_of precedenti e gli originali candidati, la firma viaggia
+    # nell'UPDATE del contenuto e solo un nuovo originale aggiunge le sue bande all'indice
+    signature = near_duplicates.simhash(content)
+    state = near_duplicates.load_source_state(db, source_id, signature)
+    if state is None:
         return None
-    db_source.content = content
-    db.commit()
-    db.refresh(db_source)
-    return db_source
+    project_id, previous_simhash, previous_duplicate_of, candidates = state
+    values = dict(content=content, **(validators or {}))
+    plan = {}
+    if signature != previous_simhash:
+        plan[source_id] = {"simhash": signature, "duplicate_of": near_duplicates.choose_original(signature, candidates)}
+        values.update(plan[source_id])
+    row = db.execute(
+        update(source_model.Source)
+        .where(source_model.Source.id == source_id)
+        .values(**values)
+        .returning(*SOURCE_COLUMNS)
+    ).one_or_none()
+    if row is None:
+        return None
+    near_duplicates.apply_index(db, [(source_id, project_id, content, previous_simhash, previous_duplicate_of)], plan)
+    if commit:
+        db.commit()
+    _invalidate(db, commit, PROJECTS_TAG, STATS_TAG, SEARCH_TAG, project_tag(row.project_id))
+    entities = db.query(entity_model.Entity).filter(entity_model.Entity.source_id == source_id).all()
+    return source_schema.Source(**row._mapping, entities=entities)
+
+def update_sources_content_bulk(db: Session, updates: List[source_schema.SourceContentUpdate], commit: bool = True):
+    """
+    Aggiorna contenuto e validatori di più fonti in una sola transazione (UPDATE per chiave primaria).
+    Firma SimHash e duplicate_of viaggiano nello stesso UPDATE; l'indice dei quasi-duplicati costa
+    una SELECT, un DELETE e un INSERT per lotto.
+    """
+    ids = [item.id for item in updates]
+    if not ids:
+        return source_schema.SourceBulkUpdateResult()
+    current = {row.id: row for row in db.execute(
+        select(source_model.Source.id, source_model.Source.project_id,
+               source_model.Source.simhash, source_model.Source.duplicate_of)
+        .where(source_model.Source.id.in_(ids))
+    ).all()}
+    rows = [item.dict(exclude_unset=True) for item in updates if item.id in current]
+    duplicates = {}
+    if rows:
+        indexed = [(row["id"], current[row["id"]].project_id, row["content"], *current[row["id"]][2:]) for row in rows]
+        plan = near_duplicates.plan_index(db, indexed)
+        # Le fonti con firma invariata riscrivono i valori attuali: tutte le righe hanno le stesse colonne
+        # e l'UPDATE per chiave primaria resta un solo executemany
+        for row in rows:
+            source = current[row["id"]]
+            row.update(plan.get(row["id"], {"simhash": source.simhash, "duplicate_of": source.duplicate_of}))
+        db.execute(update(source_model.Source), rows)
+        near_duplicates.apply_index(db, indexed, plan)
+        duplicates = near_duplicates.duplicates_found(indexed, plan)
+    if commit:
+        db.commit()
+    _invalidate(db, commit, PROJECTS_TAG, STATS_TAG, SEARCH_TAG, *{project_tag(source.project_id) for source in current.values()})
+    return source_schema.SourceBulkUpdateResult(
+        updated=[row["id"] for row in rows],
+        missing=[source_id for source_id in ids if source_id not in current],
+        duplicates=duplicates,
+    )
+
+def get_near_duplicate_clusters(db: Session, project_id: int) -> List[source_schema.NearDuplicateCluster]:
+    return [source_schema.NearDuplicateCluster(**cluster) for cluster in near_duplicates.duplicate_clusters(db, project_id)]
 
 # --- Funzione di Ricerca ---
 
 def search_sources_content(db: Session, query: str, skip: int = 0, limit: int = 100):
     search_query = func.websearch_to_tsquery('italian', query)
+    # I quasi-duplicati non vengono indicizzati: compare solo la fonte originale
     return db.query(source_model.Source).filter(
         source_model.Source.content.isnot(None),
+        source_model.Source.duplicate_of.is_(None),
         func.to_tsvector('italian', source_model.Source.content).op('@@')(search_query)
     ).offset(skip).limit(limit).all()
 
+def search_sources_content_cached(db: Session, query: str, skip: int = 0, limit: int = 100):
+    return cache.get_or_set(
+        f"search:{query}:{skip}:{limit}",
+        lambda: [source_schema.Source.model_validate(s).model_dump() for s in search_sources_content(db, query, skip=skip, limit=limit)],
+        tags=[SEARCH_TAG],
+    )
+
+def search_sources_text(db: Session, query: str):
+    """Fonti originali che contengono il testo (senza distinzione di maiuscole), con il nome del progetto"""
+    Source = source_model.Source
+    Project = project_model.Project
+    return db.query(
+        Source.id, Source.title, Source.url, Source.content, Source.created_at,
+        Source.project_id, Project.name.label("project_name"),
+    ).join(Project, Project.id == Source.project_id).filter(
+        Source.content.isnot(None),
+        Source.duplicate_of.is_(None),
+        func.lower(Source.content).contains(query.lower(), autoescape=True),
+    ).order_by(Project.id, Source.id).all()
+
 # --- Funzioni CRUD per le Entità ---
 
 def create_source_entity(db: Session, entity: entity_schema.EntityCreate, source_id: int):
@@ -81,4 +337,29 @@ def create_source_entity(db: Session, entity: entity_schema.EntityCreate, source
     db.add(db_entity)
     db.commit()
     db.refresh(db_entity)
+    cache.invalidate(PROJECTS_TAG, SEARCH_TAG)
     return db_entity
+
+def create_source_entities_bulk(db: Session, entities: List[entity_schema.EntityCreate], source_id: int,
+                                commit: bool = True) -> int:
+    """
+    Inserisce con un solo INSERT le entità che la fonte non ha ancora, ritorna quante ne ha create.
+    Le etichette che non sono membri di EntityType vengono ignorate (la colonna è un Enum).
+    """
+    seen = set(db.query(entity_model.Entity.text, entity_model.Entity.label).filter(
+        entity_model.Entity.source_id == source_id
+    ).all())
+    seen = {(text, label.name if label is not None else None) for text, label in seen}
+    rows = []
+    for entity in entities:
+        key = (entity.text, entity.label)
+        if key in seen or entity.label not in entity_model.EntityType.__members__:
+            continue
+        seen.add(key)
+        rows.append({"text": entity.text, "label": entity_model.EntityType[entity.label], "source_id": source_id})
+    if rows:
+        db.execute(insert(entity_model.Entity), rows)
+    if commit:
+        db.commit()
+    _invalidate(db, commit, PROJECTS_TAG, SEARCH_TAG)
+    return len(rows)
@@ -1,8 +1,7 @@
 import uvicorn
 import time
-from fastapi import FastAPI, Depends, HTTPException, Query, Request, Form, File, UploadFile
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Form, File, UploadFile, BackgroundTasks
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from typing import List, Optional
@@ -10,8 +9,12 @@ from pathlib import Path
 import pandas as pd
 
 from .core.database import get_db
+from .core.cache import cache
+from .core.static_assets import PrecompressedStaticFiles, AssetResolver
+from .core.msgpack_transport import MsgpackRoute
 from . import crud
-from .schemas import project as project_schema, source as source_schema
+from .schemas import project as project_schema, source as source_schema, entity as entity_schema
+from .services import project_deletion
 
 # Create FastAPI app instance
 app = FastAPI(
@@ -19,6 +22,8 @@ app = FastAPI(
     description="Backend API for the research platform",
     version="2.0.0"
 )
+# Gli endpoint dati negoziano application/msgpack (richiesta e risposta) oltre a JSON
+app.router.route_class = MsgpackRoute
 
 # Setup template e static files
 static_dir = Path("app/static")
@@ -26,8 +31,10 @@ templates_dir = Path("app/templates")
 static_dir.mkdir(exist_ok=True)
 templates_dir.mkdir(exist_ok=True)
 
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
+app.mount("/static", PrecompressedStaticFiles(directory=static_dir), name="static")
 templates = Jinja2Templates(directory=templates_dir)
+# I template referenziano gli asset con {{ asset_url('css/...') }} per usare i nomi con hash
+templates.env.globals["asset_url"] = AssetResolver(static_dir)
 
 # === API ENDPOINTS ===
 
@@ -37,7 +44,7 @@ def search_in_sources(q: str = Query(..., min_length=3), db: Session = Depends(g
     """
     Esegue una ricerca full-text nel contenuto di tutte le fonti.
     """
-    results = crud.search_sources_content(db=db, query=q)
+    results = crud.search_sources_content_cached(db=db, query=q)
     return results
 
 # --- Endpoints per PROGETTI ---
@@ -63,12 +70,42 @@ def update_project_endpoint(project_id: int, project: project_schema.ProjectUpda
         raise HTTPException(status_code=404, detail="Project not found")
     return db_project
 
-@app.delete("/projects/{project_id}", response_model=project_schema.Project, tags=["Projects"])
-def delete_project_endpoint(project_id: int, db: Session = Depends(get_db)):
-    db_project = crud.delete_project(db, project_id=project_id)
+@app.delete("/projects/{project_id}", response_model=project_schema.Project, tags=["Projects"],
+            responses={202: {"model": project_schema.ProjectDeletionStatus}})
+def delete_project_endpoint(project_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    db_project = crud.get_project(db, project_id=project_id)
     if db_project is None: 
         raise HTTPException(status_code=404, detail="Project not found")
-    return db_project
+
+    # I progetti grandi vengono eliminati a blocchi in background
+    total_sources = crud.count_sources_for_project(db, project_id=project_id)
+    if total_sources > project_deletion.DELETE_BACKGROUND_THRESHOLD:
+        job = project_deletion.start_deletion_job(db, project_id, total_sources)
+        if job is None:
+            raise HTTPException(status_code=409, detail="Project deletion already in progress")
+        background_tasks.add_task(project_deletion.run_deletion_job, project_id)
+        return JSONResponse(status_code=202, content=job.model_dump(mode="json"))
+
+    return crud.delete_project(db, project_id=project_id)
+
+@app.get("/projects/{project_id}/deletion", response_model=project_schema.ProjectDeletionStatus, tags=["Projects"])
+def read_project_deletion_status(project_id: int, db: Session = Depends(get_db)):
+    """
+    Stato di avanzamento della cancellazione in background di un progetto.
+    """
+    job = project_deletion.get_deletion_status(db, project_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No deletion job for this project")
+    return job
+
+@app.get("/projects/{project_id}/duplicates", response_model=List[source_schema.NearDuplicateCluster], tags=["Projects"])
+def read_project_duplicates(project_id: int, db: Session = Depends(get_db)):
+    """
+    Gruppi di quasi-duplicati del progetto (pagine mirror, articoli ripubblicati), rilevati al salvataggio dei contenuti.
+    """
+    if crud.get_project(db, project_id=project_id) is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return crud.get_near_duplicate_clusters(db, project_id)
 
 # --- Endpoints per le FONTI ---
 @app.post("/projects/{project_id}/sources/", response_model=source_schema.Source, tags=["Sources"])
@@ -78,6 +115,14 @@ def create_source_for_project_endpoint(project_id: int, source: source_schema.So
         raise HTTPException(status_code=404, detail="Project not found")
     return crud.create_project_source(db=db, source=source, project_id=project_id)
 
+@app.post("/projects/{project_id}/sources/bulk", response_model=List[source_schema.Source], tags=["Sources"])
+def create_sources_bulk_for_project_endpoint(project_id: int, sources: List[source_schema.SourceCreate],
+                                             db: Session = Depends(get_db)):
+    """Crea più fonti del progetto con un solo INSERT (importazione da file)"""
+    if crud.get_project(db, project_id=project_id) is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return crud.create_project_sources_bulk(db, sources, project_id)
+
 @app.get("/projects/{project_id}/sources/", response_model=List[source_schema.Source], tags=["Sources"])
 def read_sources_for_project_endpoint(project_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     db_project = crud.get_project(db, project_id=project_id)
@@ -85,13 +130,44 @@ def read_sources_for_project_endpoint(project_id: int, skip: int = 0, limit: int
         raise HTTPException(status_code=404, detail="Project not found")
     return crud.get_sources_for_project(db=db, project_id=project_id, skip=skip, limit=limit)
 
+@app.get("/sources/{source_id}", response_model=source_schema.Source, tags=["Sources"])
+def read_source_endpoint(source_id: int, db: Session = Depends(get_db)):
+    db_source = crud.get_source(db, source_id=source_id)
+    if db_source is None:
+        raise HTTPException(status_code=404, detail="Source not found")
+    return db_source
+
+@app.post("/sources/{source_id}/entities", response_model=dict, tags=["Sources"])
+def create_source_entities_endpoint(source_id: int, entities: List[entity_schema.EntityCreate],
+                                    db: Session = Depends(get_db)):
+    """Aggiunge le entità estratte da una fonte (quelle già presenti vengono ignorate)"""
+    if crud.get_source(db, source_id=source_id) is None:
+        raise HTTPException(status_code=404, detail="Source not found")
+    return {"created": crud.create_source_entities_bulk(db, entities, source_id=source_id)}
+
+# Prima di PUT /sources/{source_id}, che altrimenti intercetterebbe il percorso
+@app.put("/sources/bulk", response_model=source_schema.SourceBulkUpdateResult, tags=["Sources"])
+def update_sources_content_bulk_endpoint(updates: List[source_schema.SourceContentUpdate], db: Session = Depends(get_db)):
+    """Aggiorna il contenuto di più fonti in una richiesta (writer a lotti del crawler)"""
+    return crud.update_sources_content_bulk(db, updates)
+
 @app.put("/sources/{source_id}", response_model=source_schema.Source, tags=["Sources"])
 def update_source_content_endpoint(source_id: int, source_update: source_schema.SourceUpdate, db: Session = Depends(get_db)):
-    db_source = crud.update_source_content(db, source_id=source_id, content=source_update.content)
+    db_source = crud.update_source_content(
+        db, source_id=source_id, content=source_update.content,
+        validators=source_update.dict(exclude={"content"}, exclude_unset=True)
+    )
     if db_source is None: 
         raise HTTPException(status_code=404, detail="Source not found")
     return db_source
 
+@app.delete("/sources/{source_id}", response_model=source_schema.Source, tags=["Sources"])
+def delete_source_endpoint(source_id: int, db: Session = Depends(get_db)):
+    db_source = crud.delete_source(db, source_id=source_id)
+    if db_source is None:
+        raise HTTPException(status_code=404, detail="Source not found")
+    return db_source
+
 # --- API Stats Endpoint ---
 @app.get("/api/stats", response_model=dict, tags=["API"])
 async def get_dashboard_stats(db: Session = Depends(get_db)):
@@ -99,18 +175,8 @@ async def get_dashboard_stats(db: Session = Depends(get_db)):
     Restituisce le statistiche della dashboard in formato JSON.
     """
     try:
-        projects = crud.get_projects(db)
-        total_projects = len(projects)
-        total_sources = sum(len(p.sources) for p in projects)
-        sources_with_content = sum(1 for p in projects for s in p.sources if s.content)
-
-        return {
-            "total_projects": total_projects,
-            "total_sources": total_sources,
-            "sources_with_content": sources_with_content,
-            "sources_without_content": total_sources - sources_with_content,
-            "timestamp": int(time.time())
-        }
+        stats = crud.get_dashboard_stats(db)
+        return {**stats, "timestamp": int(time.time())}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -127,17 +193,8 @@ async def dashboard_main(request: Request, db: Session = Depends(get_db)):
     Dashboard principale con statistiche e overview progetti.
     """
     try:
-        projects = crud.get_projects(db)
-        total_projects = len(projects)
-        total_sources = sum(len(p.sources) for p in projects)
-        sources_with_content = sum(1 for p in projects for s in p.sources if s.content)
-
-        stats = {
-            "total_projects": total_projects,
-            "total_sources": total_sources,
-            "sources_with_content": sources_with_content,
-            "sources_without_content": total_sources - sources_with_content
-        }
+        projects = crud.get_project_summaries_cached(db)
+        stats = crud.get_dashboard_stats(db)
 
         return templates.TemplateResponse("dashboard_modern.html", {
             "request": request,
@@ -163,7 +220,7 @@ async def view_projects(request: Request, db: Session = Depends(get_db)):
     Pagina gestione progetti con lista completa.
     """
     try:
-        projects = crud.get_projects(db)
+        projects = crud.get_project_summaries_cached(db)
         return templates.TemplateResponse("projects.html", {
             "request": request,
             "projects": projects,
@@ -208,57 +265,62 @@ async def view_project_detail(request: Request, project_id: int, db: Session = D
     except Exception as e:
         return HTMLResponse(f"<h1>Error: {str(e)}</h1>", status_code=500)
 
+def _search_projects_content(db: Session, q: str) -> List[dict]:
+    """Ricerca testuale nelle fonti dei progetti con snippet evidenziato"""
+    results = []
+    # I quasi-duplicati sono esclusi dalla query: nei risultati compare solo la fonte originale
+    for source in crud.search_sources_text(db, q):
+        # Create snippet with highlighted search term
+        content = source.content
+        query_pos = content.lower().find(q.lower())
+        
+        if query_pos != -1:
+            start = max(0, query_pos - 100)
+            end = min(len(content), query_pos + 200)
+            snippet = content[start:end]
+            
+            # Highlight search term (basic)
+            snippet = snippet.replace(
+                q, 
+                f'<mark style="background: #ffd700; color: #000;">{q}</mark>'
+            )
+            
+            if start > 0:
+                snippet = "..." + snippet
+            if end < len(content):
+                snippet = snippet + "..."
+        else:
+            snippet = content[:200] + "..." if len(content) > 200 else content
+        
+        results.append({
+            'title': source.title or source.url,
+            'project_id': source.project_id,
+            'project_name': source.project_name,
+            'source_id': source.id,
+            'url': source.url,
+            'snippet': snippet,
+            'created_at': source.created_at,
+            'tags': []  # Add tags if available in your schema
+        })
+    return results
+
 @app.get("/search/view", response_class=HTMLResponse, tags=["Frontend"])
 async def search_page(request: Request, q: str = None, db: Session = Depends(get_db)):
     """
     Pagina ricerca avanzata con risultati.
     """
     try:
-        projects = crud.get_projects(db)
+        projects = crud.get_project_summaries_cached(db)
         results = []
         search_time = 0
         
         if q and len(q) >= 3:
-            # Perform search logic
             start_time = time.time()
-            
-            # Search in all sources
-            for project in projects:
-                for source in project.sources:
-                    if source.content and q.lower() in source.content.lower():
-                        # Create snippet with highlighted search term
-                        content = source.content
-                        query_pos = content.lower().find(q.lower())
-                        
-                        if query_pos != -1:
-                            start = max(0, query_pos - 100)
-                            end = min(len(content), query_pos + 200)
-                            snippet = content[start:end]
-                            
-                            # Highlight search term (basic)
-                            snippet = snippet.replace(
-                                q, 
-                                f'<mark style="background: #ffd700; color: #000;">{q}</mark>'
-                            )
-                            
-                            if start > 0:
-                                snippet = "..." + snippet
-                            if end < len(content):
-                                snippet = snippet + "..."
-                        else:
-                            snippet = content[:200] + "..." if len(content) > 200 else content
-                        
-                        results.append({
-                            'title': source.name or source.url,
-                            'project_id': project.id,
-                            'project_name': project.name,
-                            'source_id': source.id,
-                            'url': source.url,
-                            'snippet': snippet,
-                            'created_at': source.created_at,
-                            'tags': []  # Add tags if available in your schema
-                        })
-            
+            results = cache.get_or_set(
+                f"search:view:{q}",
+                lambda: _search_projects_content(db, q),
+                tags=[crud.SEARCH_TAG]
+            )
             search_time = round(time.time() - start_time, 3)
         
         return templates.TemplateResponse("search_modern.html", {
@@ -406,6 +468,7 @@ async def import_excel_file(file: UploadFile = File(...), project_name: str = Fo
         imported_count = 0
         skipped_count = 0
         error_count = 0
+        sources_to_create = []
         
         for index, row in df.iterrows():
             try:
@@ -418,19 +481,18 @@ async def import_excel_file(file: UploadFile = File(...), project_name: str = Fo
                     continue
 
                 # Create source
-                source_data = source_schema.SourceCreate(
-                    name=title,
-                    url=url,
-                    project_id=project.id
-                )
-                
-                crud.create_project_source(db, source_data, project.id)
-                imported_count += 1
+                sources_to_create.append(source_schema.SourceCreate(
+                    title=title,
+                    url=url
+                ))
                 
             except Exception as e:
                 error_count += 1
                 print(f"Error importing row {index}: {str(e)}")
 
+        # Un solo INSERT ... RETURNING e un solo commit per tutte le fonti
+        imported_count = len(crud.create_project_sources_bulk(db, sources_to_create, project.id))
+
         return HTMLResponse(f"""
         <html>
             <body style="font-family: Arial; padding: 20px; background: #1a1a1a; color: white;">
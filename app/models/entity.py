@@ -14,5 +14,5 @@ class Entity(Base):
     id = Column(Integer, primary_key=True, index=True)
     text = Column(String, index=True)
     label = Column(Enum(EntityType))
-    source_id = Column(Integer, ForeignKey('sources.id'))
+    source_id = Column(Integer, ForeignKey('sources.id', ondelete='CASCADE'))
     source = relationship("Source", back_populates="entities")
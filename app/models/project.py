@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Float, Text
 from sqlalchemy.orm import relationship, declarative_base
 import datetime
 
@@ -13,4 +13,24 @@ class Project(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     # Relazione: Un progetto ha molte fonti
-    sources = relationship("Source", back_populates="project", cascade="all, delete-orphan")
+    # passive_deletes: la cancellazione delle fonti è delegata a ON DELETE CASCADE nel database
+    sources = relationship("Source", back_populates="project", cascade="all, delete-orphan", passive_deletes=True)
+
+class ProjectDeletionJob(Base):
+    """
+    Stato della cancellazione in background di un progetto, visibile a tutti i worker.
+    Senza chiave esterna: la riga resta dopo la cancellazione del progetto.
+    """
+    __tablename__ = 'project_deletion_jobs'
+
+    project_id = Column(Integer, primary_key=True)
+    status = Column(String, nullable=False)
+    total_sources = Column(Integer, nullable=False)
+    deleted_sources = Column(Integer, nullable=False, default=0)
+    progress = Column(Float, nullable=False, default=0.0)
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Lease del worker che esegue la cancellazione, rinnovata a ogni batch: se il worker muore
+    # scade e la cancellazione può essere riavviata
+    lease_expires_at = Column(DateTime, nullable=True)
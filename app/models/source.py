@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 import datetime
 from .project import Base
@@ -10,7 +10,24 @@ class Source(Base):
     url = Column(String, nullable=True)
     content = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    project_id = Column(Integer, ForeignKey('projects.id'))
+    # Validatori HTTP dell'ultimo download, per il re-crawl condizionale
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    fetched_at = Column(DateTime, nullable=True)
+    content_hash = Column(String(64), nullable=True)
+    # Firma SimHash del contenuto e fonte originale di cui questa pagina è un quasi-duplicato
+    simhash = Column(BigInteger, nullable=True)
+    duplicate_of = Column(Integer, ForeignKey('sources.id', ondelete='SET NULL'), nullable=True, index=True)
+    project_id = Column(Integer, ForeignKey('projects.id', ondelete='CASCADE'))
     project = relationship("Project", back_populates="sources")
     # Relazione: Una fonte ha molte entità
-    entities = relationship("Entity", back_populates="source", cascade="all, delete-orphan")
+    entities = relationship("Entity", back_populates="source", cascade="all, delete-orphan", passive_deletes=True)
+
+class SourceSimhashBand(Base):
+    """Indice LSH delle firme SimHash: una riga per banda delle sole fonti originali"""
+    __tablename__ = 'source_simhash_bands'
+    source_id = Column(Integer, ForeignKey('sources.id', ondelete='CASCADE'), primary_key=True)
+    band = Column(Integer, primary_key=True)
+    value = Column(Integer, nullable=False)
+    project_id = Column(Integer, nullable=False)
+    __table_args__ = (Index('ix_source_simhash_bands_lookup', 'project_id', 'band', 'value'),)
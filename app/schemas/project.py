@@ -23,3 +23,23 @@ class Project(ProjectBase):
     sources: List[Source] = []
 
     model_config = ConfigDict(from_attributes=True)
+
+# Riga della lista progetti per view e cache: conteggi al posto di fonti e contenuti
+class ProjectSummary(ProjectBase):
+    id: int
+    created_at: datetime.datetime
+    source_count: int = 0
+    sources_with_content: int = 0
+
+# Stato di una cancellazione di progetto eseguita in background
+class ProjectDeletionStatus(BaseModel):
+    project_id: int
+    status: str
+    total_sources: int
+    deleted_sources: int = 0
+    progress: float = 0.0
+    error: Optional[str] = None
+    started_at: Optional[datetime.datetime] = None
+    finished_at: Optional[datetime.datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
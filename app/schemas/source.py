@@ -1,6 +1,6 @@
 from pydantic import BaseModel, ConfigDict
 import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 from .entity import Entity # Importa lo schema Entity
 
 class SourceBase(BaseModel):
@@ -13,10 +13,42 @@ class SourceCreate(SourceBase):
 
 class SourceUpdate(BaseModel):
     content: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: Optional[datetime.datetime] = None
+    content_hash: Optional[str] = None
+    url: Optional[str] = None  # nuova URL dopo un redirect permanente
+
+class SourceContentUpdate(SourceUpdate):
+    """Elemento di un aggiornamento a lotti: la fonte e il suo nuovo contenuto"""
+    id: int
+
+class SourceBulkUpdateResult(BaseModel):
+    updated: List[int] = []
+    missing: List[int] = []  # fonti non più esistenti (es. progetto cancellato)
+    duplicates: Dict[int, int] = {}  # quasi-duplicati rilevati: id fonte -> id fonte originale
 
 class Source(SourceBase):
     id: int
     project_id: int
     created_at: datetime.datetime
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: Optional[datetime.datetime] = None
+    content_hash: Optional[str] = None
+    duplicate_of: Optional[int] = None  # fonte originale se la pagina è un quasi-duplicato
     entities: List[Entity] = [] # Aggiunge la lista di entità
     model_config = ConfigDict(from_attributes=True)
+
+class NearDuplicate(BaseModel):
+    source_id: int
+    title: str
+    url: Optional[str] = None
+    distance: Optional[int] = None  # distanza di Hamming tra le firme SimHash
+
+class NearDuplicateCluster(BaseModel):
+    """Fonte originale e i suoi quasi-duplicati"""
+    source_id: int
+    title: str
+    url: Optional[str] = None
+    duplicates: List[NearDuplicate] = []
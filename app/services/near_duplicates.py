@@ -0,0 +1,355 @@
+import os
+import re
+import hashlib
+import logging
+from collections import Counter
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, bindparam, case, delete, insert, or_, select, update
+from sqlalchemy.orm import Session, aliased
+
+from ..models import source as source_model
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# Firma SimHash a 64 bit sugli shingle di parole del contenuto pulito
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3
+# Sotto questa lunghezza la firma non è significativa e la fonte non viene confrontata
+MIN_WORDS = int(os.getenv("NEAR_DUPLICATE_MIN_WORDS", "30"))
+# Distanza di Hamming massima tra due firme perché le pagine siano quasi-duplicati
+MAX_DISTANCE = int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", "6"))
+# Indice LSH: la firma è divisa in BANDS bande da BAND_BITS bit e ogni originale entra nell'indice con
+# i valori esatti delle sue bande. La ricerca prova, per ogni banda, anche i valori che differiscono di
+# al più PROBE_RADIUS bit (multi-probe): due firme entro MAX_DISTANCE hanno per forza una banda con al
+# più ceil((MAX_DISTANCE + 1) / BANDS) - 1 bit diversi (principio dei cassetti), quindi con il raggio
+# predefinito il richiamo è esatto. Con 4 bande da 16 bit ogni sonda trova in media N/65536 candidati
+# (contro N/512 delle bande da 9 bit necessarie senza sonde), al prezzo di BANDS × (1 + 16) sonde con
+# raggio 1. Un raggio minore riduce le sonde ma garantisce solo le distanze fino a
+# BANDS × (PROBE_RADIUS + 1) - 1 bit: oltre, le copie vengono trovate solo in parte.
+BANDS = 4
+BAND_BITS = SIMHASH_BITS // BANDS
+EXACT_PROBE_RADIUS = max(-(-(MAX_DISTANCE + 1) // BANDS) - 1, 0)
+PROBE_RADIUS = min(int(os.getenv("NEAR_DUPLICATE_PROBE_RADIUS", str(EXACT_PROBE_RADIUS))), EXACT_PROBE_RADIUS)
+# Valori cercati per SELECT: i lotti grandi vengono divisi (limite di parametri dei driver)
+MAX_LOOKUP_VALUES = 5000
+
+_MASK = (1 << SIMHASH_BITS) - 1
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def simhash(text: Optional[str]) -> Optional[int]:
+    """Firma SimHash del testo (intero con segno, per colonne BIGINT); None se il testo è troppo corto"""
+    words = _WORD_RE.findall((text or "").lower())
+    if len(words) < max(MIN_WORDS, SHINGLE_SIZE):
+        return None
+    shingles = Counter(" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1))
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles]
+    weights = list(shingles.values())
+    if numpy is not None:
+        bits = (numpy.array(hashes, dtype=numpy.uint64)[:, None] >> numpy.arange(SIMHASH_BITS, dtype=numpy.uint64)) & numpy.uint64(1)
+        totals = ((bits.astype(numpy.int64) * 2 - 1) * numpy.array(weights, dtype=numpy.int64)[:, None]).sum(axis=0).tolist()
+    else:
+        totals = [0] * SIMHASH_BITS
+        for value, weight in zip(hashes, weights):
+            for bit in range(SIMHASH_BITS):
+                totals[bit] += weight if value >> bit & 1 else -weight
+    signature = sum(1 << bit for bit, total in enumerate(totals) if total > 0)
+    return signature - (1 << SIMHASH_BITS) if signature >> (SIMHASH_BITS - 1) else signature
+
+def hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & _MASK).count("1")
+
+def bands(signature: int) -> List[Tuple[int, int]]:
+    """Coppie (banda, valore) con cui la firma entra nell'indice LSH"""
+    unsigned = signature & _MASK
+    band_mask = (1 << BAND_BITS) - 1
+    return [(band, (unsigned >> (band * BAND_BITS)) & band_mask) for band in range(BANDS)]
+
+# Maschere XOR dei valori vicini di una banda (entro PROBE_RADIUS bit), compreso il valore stesso
+_PROBE_MASKS = [sum(1 << bit for bit in flipped)
+                for radius in range(PROBE_RADIUS + 1) for flipped in combinations(range(BAND_BITS), radius)]
+
+def probes(signature: int) -> List[Tuple[int, int]]:
+    """Coppie (banda, valore) da cercare nell'indice per trovare le firme entro MAX_DISTANCE"""
+    return [(band, value ^ mask) for band, value in bands(signature) for mask in _PROBE_MASKS]
+
+def _band_filter(keys: Iterable[Tuple[int, int]]):
+    """Condizione SQL sulle coppie (banda, valore), raggruppate per banda"""
+    Band = source_model.SourceSimhashBand
+    values_by_band: Dict[int, Set[int]] = {}
+    for band, value in keys:
+        values_by_band.setdefault(band, set()).add(value)
+    return or_(*[and_(Band.band == band, Band.value.in_(values)) for band, values in values_by_band.items()])
+
+def _load_candidates(db: Session, keys: Set[Tuple[int, int, int]], exclude: Set[int]) -> Dict[Tuple[int, int, int], List[Tuple[int, int]]]:
+    """
+    Originali già indicizzati che hanno in una banda uno dei valori cercati: una SELECT per tutto il lotto
+    (più di una solo oltre MAX_LOOKUP_VALUES valori). Ritorna {(progetto, banda, valore): [(id fonte, firma)]}.
+    """
+    Band = source_model.SourceSimhashBand
+    Source = source_model.Source
+    ordered = sorted(keys)
+    candidates: Dict[Tuple[int, int, int], List[Tuple[int, int]]] = {}
+    for start in range(0, len(ordered), MAX_LOOKUP_VALUES):
+        chunk = ordered[start:start + MAX_LOOKUP_VALUES]
+        rows = db.execute(
+            select(Band.project_id, Band.band, Band.value, Source.id, Source.simhash)
+            .join(Source, Source.id == Band.source_id)
+            .where(
+                Band.project_id.in_({project_id for project_id, _, _ in chunk}),
+                Band.source_id.notin_(exclude),
+                Source.duplicate_of.is_(None),
+                _band_filter((band, value) for _, band, value in chunk),
+            )
+        ).all()
+        for project_id, band, value, source_id, signature in rows:
+            # la SELECT combina progetti e bande del lotto: restano solo le chiavi cercate davvero
+            if signature is not None and (project_id, band, value) in keys:
+                candidates.setdefault((project_id, band, value), []).append((source_id, signature))
+    return candidates
+
+def choose_original(signature: int, candidates: Iterable[Tuple[int, int]]) -> Optional[int]:
+    """Originale più vicino (a parità di distanza il più vecchio) tra i candidati (id, firma) entro la soglia"""
+    best = None
+    for candidate_id, candidate_signature in candidates:
+        distance = hamming(signature, candidate_signature)
+        if distance <= MAX_DISTANCE and (best is None or (distance, candidate_id) < best):
+            best = (distance, candidate_id)
+    return best[1] if best is not None else None
+
+_source_state_queries = {}
+
+def _source_state_query(with_candidates: bool):
+    """
+    SELECT di load_source_state, costruita una volta: i valori delle sonde sono parametri "expanding"
+    (uno per banda), così SQLAlchemy riusa la compilazione a ogni salvataggio
+    """
+    query = _source_state_queries.get(with_candidates)
+    if query is None:
+        Source = source_model.Source
+        Band = source_model.SourceSimhashBand
+        Me = aliased(Source)
+        Original = aliased(Source)
+        query = select(Me.project_id, Me.simhash, Me.duplicate_of)
+        if with_candidates:
+            probed = or_(*[and_(Band.band == band, Band.value.in_(bindparam(f"probe_{band}", expanding=True)))
+                           for band in range(BANDS)])
+            query = (
+                select(Me.project_id, Me.simhash, Me.duplicate_of, Original.id, Original.simhash)
+                .select_from(Me)
+                .outerjoin(Band, and_(Band.project_id == Me.project_id, Band.source_id != Me.id, probed))
+                .outerjoin(Original, and_(Original.id == Band.source_id, Original.duplicate_of.is_(None)))
+            )
+        query = _source_state_queries[with_candidates] = query.where(Me.id == bindparam("source_id"))
+    return query
+
+def load_source_state(db: Session, source_id: int, signature: Optional[int]):
+    """
+    Progetto, simhash e duplicate_of attuali della fonte e originali candidati per la nuova firma, con una
+    sola SELECT (la fonte in LEFT JOIN con l'indice). Ritorna (project_id, simhash, duplicate_of,
+    [(id, firma)]) oppure None se la fonte non esiste.
+    """
+    params = {"source_id": source_id}
+    if signature is not None:
+        for band, value in bands(signature):
+            params[f"probe_{band}"] = [value ^ mask for mask in _PROBE_MASKS]
+    rows = db.execute(_source_state_query(signature is not None), params).all()
+    if not rows:
+        return None
+    project_id, previous_simhash, previous_duplicate_of = rows[0][:3]
+    candidates = {row[3]: row[4] for row in rows if len(row) > 3 and row[3] is not None and row[4] is not None}
+    return project_id, previous_simhash, previous_duplicate_of, list(candidates.items())
+
+def plan_index(db: Session, sources: Iterable[Tuple[int, int, Optional[str], Optional[int], Optional[int]]]) -> Dict[int, dict]:
+    """
+    Calcola in Python le firme delle fonti (id, project_id, contenuto, simhash e duplicate_of attuali) e cerca
+    gli originali di tutto il lotto con una sola SELECT sull'indice. Le fonti sono elaborate in ordine, così
+    anche le copie all'interno dello stesso lotto vengono trovate.
+    Ritorna {id fonte: {"simhash", "duplicate_of"}} solo per le fonti la cui firma è cambiata.
+    """
+    changed = []
+    for source_id, project_id, content, previous_simhash, previous_duplicate_of in sources:
+        signature = simhash(content)
+        if signature != previous_simhash:
+            changed.append((source_id, project_id, signature))
+    if not changed:
+        return {}
+    plan = _match(db, changed, {source_id for source_id, _, _ in changed})
+    found = sum(1 for values in plan.values() if values["duplicate_of"] is not None)
+    if found:
+        logger.info(f"{found} quasi-duplicati rilevati su {len(plan)} fonti con firma cambiata")
+    return plan
+
+def _match(db: Session, signatures: List[Tuple[int, int, Optional[int]]], exclude: Set[int]) -> Dict[int, dict]:
+    """
+    Originale di ogni firma (id, project_id, firma) tra quelli indicizzati e quelli che la precedono nel
+    lotto; le fonti in `exclude` non sono candidati. Ritorna {id: {"simhash", "duplicate_of"}}.
+    """
+    keys = {(project_id, band, value) for _, project_id, signature in signatures if signature is not None
+            for band, value in probes(signature)}
+    index = _load_candidates(db, keys, exclude) if keys else {}
+    plan = {}
+    for source_id, project_id, signature in signatures:
+        original = None
+        if signature is not None:
+            original = choose_original(signature, (
+                candidate for band, value in probes(signature)
+                for candidate in index.get((project_id, band, value), ())
+            ))
+            if original is None:
+                # originale: entra nell'indice in memoria per le fonti successive del lotto
+                for band, value in bands(signature):
+                    index.setdefault((project_id, band, value), []).append((source_id, signature))
+        plan[source_id] = {"simhash": signature, "duplicate_of": original}
+    return plan
+
+def apply_index(db: Session, sources: Iterable[Tuple[int, int, Optional[str], Optional[int], Optional[int]]],
+                plan: Dict[int, dict]):
+    """
+    Aggiorna l'indice LSH per le fonti di `plan` (scritte dal chiamante): un DELETE ... IN delle vecchie bande,
+    un INSERT di quelle degli originali e, se serve, un UPDATE che sposta le copie sull'originale.
+    """
+    if not plan:
+        return
+    Band = source_model.SourceSimhashBand
+    Source = source_model.Source
+    previous = {source_id: (project_id, previous_simhash, previous_duplicate_of)
+                for source_id, project_id, _, previous_simhash, previous_duplicate_of in sources}
+    # solo gli originali con una firma hanno bande (e possono avere copie)
+    indexed = [source_id for source_id in plan
+               if previous[source_id][1] is not None and previous[source_id][2] is None]
+    if indexed:
+        db.execute(delete(Band).where(Band.source_id.in_(indexed)))
+    new_bands = [
+        {"source_id": source_id, "project_id": previous[source_id][0], "band": band, "value": value}
+        for source_id, values in plan.items() if values["simhash"] is not None and values["duplicate_of"] is None
+        for band, value in bands(values["simhash"])
+    ]
+    if new_bands:
+        db.execute(insert(Band), new_bands)
+    # le copie che puntavano a una fonte diventata quasi-duplicato passano all'originale, così i gruppi restano piatti
+    demoted = {source_id: plan[source_id]["duplicate_of"] for source_id in indexed
+               if plan[source_id]["duplicate_of"] is not None}
+    if demoted:
+        db.execute(
+            update(Source)
+            .where(Source.duplicate_of.in_(demoted))
+            .values(duplicate_of=case(demoted, value=Source.duplicate_of))
+        )
+
+def duplicates_found(sources: Iterable[Tuple[int, int, Optional[str], Optional[int], Optional[int]]],
+                     plan: Dict[int, dict]) -> Dict[int, int]:
+    """{id fonte: id originale} per le fonti del lotto che dopo l'aggiornamento sono quasi-duplicati"""
+    duplicates = {}
+    for source_id, _, _, _, previous_duplicate_of in sources:
+        original = plan[source_id]["duplicate_of"] if source_id in plan else previous_duplicate_of
+        if original is not None:
+            duplicates[source_id] = original
+    return duplicates
+
+def _rematch(db: Session, rows: List[Tuple[int, int, int]], exclude: Set[int]) -> int:
+    """
+    Cerca di nuovo l'originale delle fonti (id, project_id, firma), in ordine: la prima senza originale
+    diventa l'originale delle successive. Ritorna quante fonti restano quasi-duplicati.
+    """
+    if not rows:
+        return 0
+    plan = _match(db, rows, exclude | {source_id for source_id, _, _ in rows})
+    db.execute(update(source_model.Source),
+               [{"id": source_id, "duplicate_of": values["duplicate_of"]} for source_id, values in plan.items()])
+    # Firma invariata, e nessuna delle fonti è nell'indice: apply_index aggiunge solo le bande degli originali
+    apply_index(db, [(source_id, project_id, None, None, None) for source_id, project_id, _ in rows], plan)
+    return sum(1 for values in plan.values() if values["duplicate_of"] is not None)
+
+def release_copies(db: Session, original_ids: Iterable[int]) -> int:
+    """
+    Da chiamare prima di cancellare delle fonti: le loro copie perderebbero l'originale (ON DELETE SET NULL)
+    senza rientrare nell'indice. Ogni gruppo promuove a originale la copia più vecchia e le altre vengono
+    riassegnate (all'originale promosso o a un altro vicino). Ritorna quante fonti restano copie.
+    """
+    original_ids = set(original_ids)
+    if not original_ids:
+        return 0
+    Source = source_model.Source
+    copies = db.execute(
+        select(Source.id, Source.project_id, Source.simhash)
+        .where(Source.duplicate_of.in_(original_ids), Source.id.notin_(original_ids))
+        .order_by(Source.id)
+    ).all()
+    return _rematch(db, [tuple(row) for row in copies], original_ids)
+
+def reindex_orphans(db: Session, project_id: Optional[int] = None) -> int:
+    """
+    Copie rimaste senza originale (cancellato fuori da release_copies, ON DELETE SET NULL): hanno una firma
+    ma non sono né copie né nell'indice. Le riassegna come release_copies; ritorna quante ne ha trovate.
+    """
+    Source = source_model.Source
+    Band = source_model.SourceSimhashBand
+    query = (
+        select(Source.id, Source.project_id, Source.simhash)
+        .where(Source.simhash.isnot(None), Source.duplicate_of.is_(None),
+               ~select(Band.source_id).where(Band.source_id == Source.id).exists())
+        .order_by(Source.id)
+    )
+    if project_id is not None:
+        query = query.where(Source.project_id == project_id)
+    orphans = [tuple(row) for row in db.execute(query).all()]
+    if orphans:
+        _rematch(db, orphans, set())
+        logger.info(f"{len(orphans)} fonti senza originale reindicizzate")
+    return len(orphans)
+
+def rebuild_index(db: Session) -> int:
+    """
+    Ricostruisce le bande di tutti gli originali dalle firme salvate (dopo un cambio di BANDS o BAND_BITS)
+    e reindicizza le copie rimaste senza originale. Ritorna il numero di originali indicizzati.
+    """
+    Source = source_model.Source
+    Band = source_model.SourceSimhashBand
+    originals = db.execute(
+        select(Source.id, Source.project_id, Source.simhash)
+        .where(Source.simhash.isnot(None), Source.duplicate_of.is_(None))
+    ).all()
+    db.execute(delete(Band))
+    rows = [{"source_id": source_id, "project_id": project_id, "band": band, "value": value}
+            for source_id, project_id, signature in originals for band, value in bands(signature)]
+    if rows:
+        db.execute(insert(Band), rows)
+    reindex_orphans(db)
+    return len(originals)
+
+def index_is_current(db: Session) -> bool:
+    """False se l'indice contiene bande di uno schema precedente (più bande di BANDS)"""
+    Band = source_model.SourceSimhashBand
+    return db.execute(select(Band.source_id).where(Band.band >= BANDS).limit(1)).first() is None
+
+def duplicate_clusters(db: Session, project_id: int) -> List[dict]:
+    """Gruppi di quasi-duplicati del progetto: ogni fonte originale con le sue copie, i gruppi più grandi per primi"""
+    Source = source_model.Source
+    Original = aliased(Source)
+    rows = db.execute(
+        select(
+            Original.id, Original.title, Original.url, Original.simhash,
+            Source.id.label("copy_id"), Source.title.label("copy_title"),
+            Source.url.label("copy_url"), Source.simhash.label("copy_simhash"),
+        )
+        .join(Original, Source.duplicate_of == Original.id)
+        .where(Source.project_id == project_id)
+        .order_by(Original.id, Source.id)
+    ).all()
+    clusters: Dict[int, dict] = {}
+    for row in rows:
+        cluster = clusters.setdefault(row.id, {
+            "source_id": row.id, "title": row.title, "url": row.url, "duplicates": [],
+        })
+        distance = hamming(row.simhash, row.copy_simhash) if row.simhash is not None and row.copy_simhash is not None else None
+        cluster["duplicates"].append({
+            "source_id": row.copy_id, "title": row.copy_title, "url": row.copy_url, "distance": distance,
+        })
+    return sorted(clusters.values(), key=lambda c: (-len(c["duplicates"]), c["source_id"]))
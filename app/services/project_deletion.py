@@ -0,0 +1,102 @@
+import os
+import time
+import datetime
+import logging
+from typing import Optional
+
+from sqlalchemy import insert, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..core.database import SessionLocal
+from .. import crud
+from ..models.project import ProjectDeletionJob
+from ..schemas import project as project_schema
+
+logger = logging.getLogger(__name__)
+
+# Oltre questa soglia di fonti la cancellazione di un progetto viene eseguita in background
+DELETE_BACKGROUND_THRESHOLD = int(os.getenv("PROJECT_DELETE_BACKGROUND_THRESHOLD", "1000"))
+DELETE_BATCH_SIZE = int(os.getenv("PROJECT_DELETE_BATCH_SIZE", "1000"))
+# Pausa tra i batch per non monopolizzare il database
+DELETE_BATCH_PAUSE = float(os.getenv("PROJECT_DELETE_BATCH_PAUSE", "0.05"))
+# Durata della lease del job, rinnovata a ogni batch (secondi)
+DELETE_LEASE_SECONDS = 300
+
+FINISHED_STATUSES = ("completed", "failed")
+
+# Stato e lease dei job stanno in project_deletion_jobs: ogni worker uvicorn vede lo stesso stato
+# e una sola cancellazione per progetto può essere in corso
+
+def _lease_expiry() -> datetime.datetime:
+    return datetime.datetime.utcnow() + datetime.timedelta(seconds=DELETE_LEASE_SECONDS)
+
+def get_deletion_status(db: Session, project_id: int) -> Optional[project_schema.ProjectDeletionStatus]:
+    job = db.get(ProjectDeletionJob, project_id)
+    return project_schema.ProjectDeletionStatus.model_validate(job) if job is not None else None
+
+def start_deletion_job(db: Session, project_id: int, total_sources: int) -> Optional[project_schema.ProjectDeletionStatus]:
+    """Registra una nuova cancellazione; ritorna None se ce n'è già una in corso per il progetto"""
+    values = dict(status="pending", total_sources=total_sources, deleted_sources=0, progress=0.0,
+                  error=None, started_at=None, finished_at=None, lease_expires_at=_lease_expiry())
+    # Un job concluso o con la lease scaduta (worker terminato) viene sostituito; l'UPDATE
+    # condizionale e la chiave primaria fanno sì che un solo worker lo ottenga
+    claimed = db.execute(
+        update(ProjectDeletionJob)
+        .where(ProjectDeletionJob.project_id == project_id)
+        .where(or_(ProjectDeletionJob.status.in_(FINISHED_STATUSES),
+                   ProjectDeletionJob.lease_expires_at < datetime.datetime.utcnow()))
+        .values(**values)
+    ).rowcount
+    try:
+        if not claimed:
+            db.execute(insert(ProjectDeletionJob).values(project_id=project_id, **values))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    return get_deletion_status(db, project_id)
+
+def _save_progress(db: Session, project_id: int, **values):
+    db.execute(
+        update(ProjectDeletionJob)
+        .where(ProjectDeletionJob.project_id == project_id)
+        .values(**values)
+    )
+    db.commit()
+
+def run_deletion_job(project_id: int, batch_size: int = DELETE_BATCH_SIZE):
+    """Elimina le fonti del progetto a blocchi, poi il progetto; aggiorna lo stato del job"""
+    db = SessionLocal()
+    try:
+        job = db.get(ProjectDeletionJob, project_id)
+        total_sources, deleted_sources = job.total_sources, 0
+        _save_progress(db, project_id, status="running", started_at=datetime.datetime.utcnow(),
+                       lease_expires_at=_lease_expiry())
+        logger.info(f"Cancellazione progetto {project_id}: {total_sources} fonti in batch da {batch_size}")
+
+        while True:
+            deleted = crud.delete_project_sources_batch(db, project_id, batch_size=batch_size)
+            if deleted == 0:
+                break
+            deleted_sources += deleted
+            _save_progress(db, project_id, deleted_sources=deleted_sources,
+                           progress=min(deleted_sources / max(total_sources, 1), 1.0),
+                           lease_expires_at=_lease_expiry())
+            logger.debug(f"Cancellazione progetto {project_id}: {deleted_sources}/{total_sources}")
+            time.sleep(DELETE_BATCH_PAUSE)
+
+        crud.delete_project(db, project_id)
+        _save_progress(db, project_id, status="completed", progress=1.0,
+                       finished_at=datetime.datetime.utcnow(), lease_expires_at=None)
+        logger.info(f"Cancellazione progetto {project_id} completata ({deleted_sources} fonti)")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Errore nella cancellazione del progetto {project_id}: {e}")
+        try:
+            _save_progress(db, project_id, status="failed", error=str(e),
+                           finished_at=datetime.datetime.utcnow(), lease_expires_at=None)
+        except Exception as save_error:
+            logger.error(f"Stato della cancellazione del progetto {project_id} non salvato: {save_error}")
+    finally:
+        db.close()
@@ -0,0 +1,266 @@
+# async_crawler.py
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from utils import (progress_tracker, conditional_headers, detect_encoding, is_text_content_type,
+                   http_error_kind, FetchEvent, FetchResult, READ_CHUNK_SIZE)
+from config import config
+from host_scheduler import fair_interleave, interleave_by_host
+from improved_crawler import AdvancedCrawler, CrawlResult
+from crawl_frontier import CrawlFrontier
+from crawl_concurrency import AsyncSlots, create_controller
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def classify_client_error(error: Exception) -> str:
+    """Come classify_fetch_error di utils, per le eccezioni di aiohttp"""
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(error, aiohttp.ClientResponseError):
+        return http_error_kind(error.status)
+    if isinstance(error, aiohttp.ClientConnectionError):
+        return "connection"
+    return "error"
+
+class AsyncCrawler(AdvancedCrawler):
+    """
+    Crawler asyncio: migliaia di download contemporanei limitati da un semaforo globale
+    e da uno per host. L'estrazione del testo gira in un pool di thread separato, così il
+    parsing non blocca l'event loop, e i testi vengono salvati a lotti dalla fase di scrittura
+    (BatchWriter) come negli altri motori. Produce gli stessi CrawlResult e le stesse
+    statistiche di AdvancedCrawler.
+    """
+
+    def __init__(self, max_concurrency: int = config.crawler.async_max_concurrency,
+                 per_host_concurrency: int = config.crawler.async_per_host_concurrency,
+                 parse_workers: int = config.crawler.parse_workers,
+                 frontier: Optional[CrawlFrontier] = None):
+        if aiohttp is None:
+            raise RuntimeError("Il motore async richiede aiohttp: pip install aiohttp")
+        super().__init__(max_workers=parse_workers, frontier=frontier)
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        # Il limite globale parte da un ottavo di max_concurrency e cresce finché gli host reggono
+        self.concurrency = create_controller(max(max_concurrency // 8, 1), maximum=max_concurrency)
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        # Fonti il cui testo è nel writer: il risultato arriva a salvataggio avvenuto
+        self._write_waiters: Dict[int, asyncio.Future] = {}
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = (urlsplit(url).hostname or "").lower()
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host_concurrency)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def fetch(self, session: "aiohttp.ClientSession", url: str, etag: Optional[str] = None,
+                    last_modified: Optional[str] = None) -> FetchResult:
+        """Scarica una URL con retry e backoff, equivalente a WebScraper.fetch (stessi FetchEvent)"""
+        target = self.scraper.resolve_redirect(url)
+        if target is not None:
+            url = target
+
+        cached, entry = self.scraper.cache_lookup(url, etag, last_modified)
+        if cached is not None:
+            cached.moved_to = cached.moved_to or target
+            return cached
+
+        if not self.scraper.circuit_breaker.allow(url):
+            return self.scraper.circuit_open_result(url)
+
+        # robots.txt dell'host che riceve la richiesta (dopo la riscrittura di un redirect noto)
+        await asyncio.get_running_loop().run_in_executor(None, self.scraper.host_scheduler.ensure_robots, url)
+
+        timing = {}
+        if entry is not None and not (etag or last_modified):
+            result = await self._fetch(session, url, entry.etag, entry.last_modified, timing)
+        else:
+            result = await self._fetch(session, url, etag, last_modified, timing)
+        result = self.scraper.cache_response(url, result, entry, etag, last_modified)
+        if result.moved_to is None:
+            result.moved_to = target
+        # Latenza della richiesta, esclusa l'attesa degli slot e del rate limit dell'host
+        elapsed = time.monotonic() - timing['started'] if 'started' in timing else 0.0
+        self.scraper.notify_fetch(FetchEvent(url=url, status_code=result.status_code, elapsed=elapsed,
+                                             error=result.error, size=result.size))
+        return result
+
+    async def _fetch(self, session: "aiohttp.ClientSession", url: str, etag: Optional[str],
+                     last_modified: Optional[str], timing: Dict) -> FetchResult:
+        max_length = config.scraping.max_content_length
+        status_code, error = None, "error"
+
+        for attempt in range(config.scraping.retry_attempts + 1):
+            last_attempt = attempt == config.scraping.retry_attempts
+            try:
+                # Prima il posto per l'host e il suo rate limit, poi quello globale:
+                # le fonti in attesa di un host occupato non sottraggono slot agli altri host
+                async with self._host_semaphore(url):
+                    await self.scraper.host_scheduler.wait_async(url)
+                    async with self._slots:
+                        timing['started'] = time.monotonic()
+                        async with session.get(url, headers=conditional_headers(etag, last_modified)) as response:
+                            status_code = response.status
+                            if response.status in RETRY_STATUSES and not last_attempt:
+                                logger.debug(f"HTTP {response.status} per {url}, nuovo tentativo")
+                                error = http_error_kind(response.status)
+                            else:
+                                response.raise_for_status()
+
+                                result = FetchResult(
+                                    url=url,
+                                    status_code=response.status,
+                                    etag=response.headers.get('etag'),
+                                    last_modified=response.headers.get('last-modified'),
+                                    moved_to=self.scraper.remember_redirects(
+                                        [(hop.status, str(hop.url)) for hop in response.history], str(response.url)
+                                    )
+                                )
+                                if result.not_modified:
+                                    return result
+
+                                # Scarta binari e pagine troppo grandi guardando solo gli header
+                                content_type = response.headers.get('content-type')
+                                if not is_text_content_type(content_type):
+                                    logger.warning(f"Contenuto non testuale ({content_type}): {url}")
+                                    return FetchResult.failed(url, status_code, "non_text")
+
+                                content_length = response.headers.get('content-length')
+                                if content_length and content_length.isdigit() and int(content_length) > max_length:
+                                    logger.warning(f"Contenuto troppo grande ({content_length} bytes): {url}")
+                                    return FetchResult.failed(url, status_code, "too_large")
+
+                                buffer = bytearray()
+                                async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+                                    buffer += chunk
+                                    if len(buffer) >= max_length:
+                                        logger.warning(f"Contenuto troppo grande, troncato a {max_length} bytes: {url}")
+                                        break
+                                body = bytes(buffer[:max_length])
+                                result.size = len(body)
+                                result.content = body.decode(detect_encoding(content_type, body), errors="replace")
+                                return result
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = classify_client_error(e)
+                if last_attempt or isinstance(e, aiohttp.ClientResponseError):
+                    logger.error(f"Failed to scrape {url}: {e}")
+                    return FetchResult.failed(url, getattr(e, 'status', status_code), error)
+                logger.debug(f"Errore di rete per {url}: {e}, nuovo tentativo")
+
+            # Backoff esponenziale come la Retry di urllib3 usata da WebScraper
+            await asyncio.sleep(config.scraping.retry_delay * (2 ** attempt))
+
+        return FetchResult.failed(url, status_code, error)
+
+    async def _crawl_one(self, session: "aiohttp.ClientSession", executor: ThreadPoolExecutor,
+                         source: Dict) -> CrawlResult:
+        start_time = time.time()
+        source_id = source['id']
+        try:
+            loop = asyncio.get_running_loop()
+            etag, last_modified = self.conditional_validators(source)
+            fetch_result = await self.fetch(session, source['url'], etag=etag, last_modified=last_modified)
+            # Registrato prima del parsing: il writer può salvare il testo prima che questo task riprenda
+            written = self._write_waiters[source_id] = loop.create_future()
+            result = await loop.run_in_executor(executor, self.process_fetch, source, fetch_result, start_time)
+            if result is not None:
+                self._write_waiters.pop(source_id, None)
+                return result
+            return await written
+        except Exception as e:
+            self._write_waiters.pop(source_id, None)
+            logger.error(f"Errore nello scraping della fonte {source_id}: {e}")
+            return CrawlResult(
+                source_id=source_id,
+                success=False,
+                error=str(e),
+                processing_time=time.time() - start_time,
+                reason="exception"
+            )
+
+    async def _crawl_all(self, sources: List[Dict], tracker) -> List[CrawlResult]:
+        # Slot globali dal controller adattivo (self.concurrency), al posto di un semaforo fisso
+        self._slots = AsyncSlots(self.concurrency)
+        self._host_semaphores = {}
+        results = []
+
+        # Limita i task creati (e quindi la memoria) a un multiplo della concorrenza
+        window = asyncio.Semaphore(self.max_concurrency * 4)
+        pending = set()
+
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.per_host_concurrency,
+                                         ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=config.scraping.timeout)
+        headers = {'User-Agent': config.scraping.user_agent}
+
+        loop = asyncio.get_running_loop()
+
+        def on_written(item, saved: bool, error: Optional[str]):
+            # Thread del writer: il risultato torna al task della fonte nell'event loop
+            result = self.written_result(item, saved, error)
+            written = self._write_waiters.pop(item.source_id, None)
+            if written is not None:
+                loop.call_soon_threadsafe(written.set_result, result)
+
+        def on_done(task: asyncio.Task):
+            window.release()
+            result = task.result()
+            results.append(result)
+            self._record_result(result, tracker)
+            # Le fonti mancanti sono tutte nel writer: inutile attendere che il lotto si riempia
+            if len(results) + self.writer.pending >= len(sources):
+                self.writer.flush()
+
+        # Con la coda del writer piena i thread di parsing attendono in submit(), non l'event loop
+        self._write_waiters = {}
+        self.writer = self.create_writer(on_written).start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers) as session:
+                    for source in sources:
+                        await window.acquire()
+                        task = asyncio.create_task(self._crawl_one(session, executor, source))
+                        pending.add(task)
+                        task.add_done_callback(pending.discard)
+                        task.add_done_callback(on_done)
+
+                    if pending:
+                        await asyncio.wait(pending)
+        finally:
+            self.writer.close()
+            self.writer = None
+
+        return results
+
+    def crawl_sources_parallel(self, sources: List[Dict]) -> List[CrawlResult]:
+        """Crawl asincrono delle fonti con lo stesso filtro e le stesse statistiche del crawler a thread"""
+        sources_to_process = [s for s in sources if not self.should_skip_source(s)]
+        total_to_process = len(sources_to_process)
+
+        logger.info(f"Fonti da processare: {total_to_process} su {len(sources)} totali")
+
+        if total_to_process == 0:
+            logger.info("Nessuna fonte da processare")
+            return []
+
+        logger.info(f"Crawling asincrono: {self.concurrency.current_limit} richieste contemporanee "
+                    f"(massimo {self.max_concurrency}), {self.per_host_concurrency} per host")
+
+        with progress_tracker(total_to_process, "Crawling fonti (async)") as tracker:
+            # Alterna gli host così la finestra di task non si riempie di un solo dominio,
+            # e i progetti secondo i loro pesi
+            ordered = fair_interleave(interleave_by_host(sources_to_process), self.project_weights)
+            return asyncio.run(self._crawl_all(ordered, tracker))
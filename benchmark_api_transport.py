@@ -0,0 +1,105 @@
+# benchmark_api_transport.py
+"""
+Confronto tra JSON, MessagePack e MessagePack+zstd sui payload tipici dell'API:
+byte trasmessi e tempo CPU di codifica + decodifica (lato client e lato server).
+
+Utilizzo: python benchmark_api_transport.py [dimensione_contenuto_kb] [iterazioni]
+"""
+import sys
+import json
+import time
+import random
+from typing import Any, Callable, Dict, List, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+WORDS = [
+    "ricerca", "università", "città", "perché", "così", "l'analisi", "\"dati\"", "modello",
+    "progetto", "fonte", "contenuto", "entità", "Milano", "Roma", "società", "già", "più",
+    "intelligenza", "artificiale", "—", "€", "tab\tseparato", "riga\nnuova", "C:\\percorso",
+]
+
+def generate_text(size_bytes: int, seed: int = 42) -> str:
+    """Testo con accenti, virgolette, backslash e a capo: i casi costosi per l'escaping JSON"""
+    rng = random.Random(seed)
+    parts, length = [], 0
+    while length < size_bytes:
+        word = rng.choice(WORDS)
+        parts.append(word)
+        length += len(word.encode("utf-8")) + 1
+    return " ".join(parts)
+
+def build_payloads(content_kb: int) -> Dict[str, Any]:
+    content = generate_text(content_kb * 1024)
+    source = {
+        "id": 1, "title": "Fonte di esempio", "url": "https://example.com/articolo",
+        "content": content, "project_id": 1, "created_at": "2025-06-18T20:57:57", "entities": [],
+    }
+    return {
+        f"PUT /sources (contenuto {content_kb} KB)": {"content": content},
+        f"GET /projects/ (20 fonti da {content_kb} KB)": [{
+            "id": 1, "name": "Progetto", "description": None, "created_at": "2025-06-18T20:57:57",
+            "sources": [dict(source, id=i) for i in range(20)],
+        }],
+    }
+
+def codecs() -> List[Tuple[str, Callable[[Any], bytes], Callable[[bytes], Any]]]:
+    result = [("json", lambda o: json.dumps(o).encode("utf-8"), lambda b: json.loads(b))]
+    if msgpack is not None:
+        result.append(("msgpack", lambda o: msgpack.packb(o, use_bin_type=True), lambda b: msgpack.unpackb(b, raw=False)))
+        if zstandard is not None:
+            compressor = zstandard.ZstdCompressor(level=3)
+            decompressor = zstandard.ZstdDecompressor()
+            result.append((
+                "msgpack+zstd",
+                lambda o: compressor.compress(msgpack.packb(o, use_bin_type=True)),
+                lambda b: msgpack.unpackb(decompressor.decompress(b), raw=False),
+            ))
+    return result
+
+def measure(encode: Callable, decode: Callable, payload: Any, iterations: int) -> Dict[str, float]:
+    body = encode(payload)
+    assert decode(body) == payload, "Il round trip non preserva il payload"
+
+    start = time.process_time()
+    for _ in range(iterations):
+        encode(payload)
+    encode_us = (time.process_time() - start) / iterations * 1e6
+
+    start = time.process_time()
+    for _ in range(iterations):
+        decode(body)
+    decode_us = (time.process_time() - start) / iterations * 1e6
+
+    return {"bytes": len(body), "encode_us": encode_us, "decode_us": decode_us}
+
+def main():
+    content_kb = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    if msgpack is None:
+        print("⚠️  Pacchetto 'msgpack' non installato: confronto disponibile solo per JSON")
+    elif zstandard is None:
+        print("⚠️  Pacchetto 'zstandard' non installato: variante compressa esclusa")
+
+    for name, payload in build_payloads(content_kb).items():
+        print(f"\n=== {name} ===")
+        print(f"{'Formato':<14} {'Byte':>12} {'vs JSON':>9} {'Encode µs':>11} {'Decode µs':>11} {'Totale µs':>11}")
+        baseline = None
+        for codec_name, encode, decode in codecs():
+            r = measure(encode, decode, payload, iterations)
+            total = r["encode_us"] + r["decode_us"]
+            baseline = baseline or r["bytes"]
+            print(f"{codec_name:<14} {r['bytes']:>12,} {r['bytes'] / baseline:>8.0%} "
+                  f"{r['encode_us']:>11.0f} {r['decode_us']:>11.0f} {total:>11.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,463 @@
+# benchmark_crawler.py
+"""
+Benchmark riproducibile dei motori di crawling (threads, async, pipeline) contro un web
+sintetico locale. Un server di fixture per host (127.0.0.1 ... 127.0.0.N, stessa porta) serve
+un corpus generato con latenza, dimensione delle pagine, errori 5xx, raffiche di 429 e body
+lenti configurabili. Ogni motore gira in un processo separato con un repository in memoria,
+così si misura il crawler e non l'API: pagine/s, p50/p99 del download, CPU per pagina e
+picco di RSS.
+
+Ogni motore viene eseguito --repeat volte e si riporta la mediana. Con --save i risultati
+vengono scritti in JSON; con --baseline vengono confrontati con un run precedente dello stesso
+scenario e il comando esce con codice 1 se un motore peggiora oltre --threshold (pagine/s più
+basse, p50 del download, CPU per pagina o RSS più alti).
+
+Utilizzo: python benchmark_crawler.py [--engines threads,async,pipeline] [--pages 400] [--hosts 8]
+                                      [--repeat 3] [--save risultati.json] [--baseline risultati.json]
+Gli indirizzi 127.0.0.N oltre il primo sono disponibili di default su Linux (con --hosts 1 ovunque).
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import resource
+import statistics
+import threading
+import subprocess
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from benchmark_extractors import generate_page
+from repository import Repository
+
+BENCHMARK_PROJECT_ID = 1
+ENGINES = ("threads", "async", "pipeline")
+
+# Configurazione imposta ai processi di benchmark: niente file di stato, cache o report tra un run e l'altro
+ISOLATED_ENV = {
+    "CRAWLER_FRONTIER_PATH": "",
+    "CRAWLER_SCHEDULE_PATH": "",
+    "CRAWLER_REPORT_DIR": "",
+    "CRAWLER_DEAD_LETTER_PATH": "",
+    "CRAWLER_METRICS_PORT": "0",
+    "CRAWLER_RECRAWL": "false",
+    "SCRAPING_REDIRECT_MAP_PATH": "",
+    "SCRAPING_HTTP_CACHE_MODE": "off",
+}
+# Valori di partenza modificabili dall'ambiente (es. SCRAPING_RATE_LIMIT=1 per misurare la cortesia)
+DEFAULT_ENV = {
+    "SCRAPING_RATE_LIMIT": "0",
+    "SCRAPING_RETRY_DELAY": "0.2",
+    "LOG_LEVEL": "WARNING",
+}
+
+# Metriche confrontate con la baseline: True se un valore più alto è un miglioramento.
+# Il p99 del download viene solo riportato: lo decidono le pagine lente e i Retry-After del server
+REGRESSION_METRICS = {
+    "pages_per_sec": True,
+    "p50_fetch_ms": False,
+    "cpu_ms_per_page": False,
+    "peak_rss_mb": False,
+}
+
+# --- Web sintetico ---
+
+class FixtureWeb:
+    """
+    Corpus generato e comportamento dei server: latenza log-normale (mediana, sigma),
+    dimensioni log-normali delle pagine, una quota di 503, finestre periodiche in cui ogni
+    richiesta riceve 429 con Retry-After e pagine il cui body arriva a velocità limitata.
+    """
+
+    def __init__(self, pages: int, hosts: int, seed: int = 42, latency_ms: float = 30.0,
+                 latency_sigma: float = 0.5, page_kb: float = 40.0, page_sigma: float = 0.6,
+                 error_rate: float = 0.01, burst_every: float = 0.0, burst_length: float = 1.0,
+                 slow_rate: float = 0.01, slow_kbps: float = 64.0):
+        self.hosts = hosts
+        self.latency = latency_ms / 1000
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.slow_kbps = slow_kbps
+        self.rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.counters: Counter = Counter()
+        self._counters_lock = threading.Lock()
+        self.servers: List[ThreadingHTTPServer] = []
+        self.started_at = time.monotonic()
+
+        # Corpus e pagine lente dipendono solo dal seed: stesso scenario, stessi byte
+        self.corpus: List[bytes] = []
+        self.slow = set()
+        for index in range(pages):
+            rng = random.Random(seed * 1_000_003 + index)
+            size = int(page_kb * 1024 * math.exp(page_sigma * rng.gauss(0, 1)))
+            self.corpus.append(self._build_page(rng, size))
+            if rng.random() < slow_rate:
+                self.slow.add(index)
+
+    @staticmethod
+    def _build_page(rng: random.Random, size: int) -> bytes:
+        html = generate_page(rng)
+        while len(html) < size:
+            extra = generate_page(rng).split("<main>", 1)[1].split("</main>", 1)[0]
+            html = html.replace("</main>", f"<section>{extra}</section></main>", 1)
+        return html.encode("utf-8")
+
+    def url(self, index: int, port: int) -> str:
+        return f"http://127.0.0.{index % self.hosts + 1}:{port}/page/{index}.html"
+
+    def count(self, name: str):
+        with self._counters_lock:
+            self.counters[name] += 1
+
+    def random(self) -> float:
+        with self._rng_lock:
+            return self.rng.random()
+
+    def sample_latency(self) -> float:
+        if self.latency_sigma <= 0:
+            return self.latency
+        with self._rng_lock:
+            return self.latency * math.exp(self.latency_sigma * self.rng.gauss(0, 1))
+
+    def in_burst(self) -> Optional[float]:
+        """Secondi alla fine della raffica di 429 in corso, None fuori dalle raffiche"""
+        if self.burst_every <= 0:
+            return None
+        phase = (time.monotonic() - self.started_at) % self.burst_every
+        return self.burst_length - phase if phase < self.burst_length else None
+
+    def start(self, port: int = 0) -> int:
+        """Avvia un server per host sulla stessa porta (0 = scelta dal sistema); ritorna la porta"""
+        handler = type("FixtureHandler", (_FixtureHandler,), {"web": self})
+        for host in range(1, self.hosts + 1):
+            server = _FixtureServer((f"127.0.0.{host}", port), handler)
+            port = server.server_address[1]
+            threading.Thread(target=server.serve_forever, name=f"fixture-{host}", daemon=True).start()
+            self.servers.append(server)
+        return port
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.servers = []
+
+    def restart_clock(self):
+        """Le raffiche di 429 ripartono da zero: ogni motore le incontra negli stessi istanti del run"""
+        self.started_at = time.monotonic()
+
+    def reset_counters(self) -> Dict[str, int]:
+        with self._counters_lock:
+            counters, self.counters = dict(self.counters), Counter()
+        return counters
+
+class _FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # il motore async apre centinaia di connessioni insieme
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, come un server reale
+    web: FixtureWeb = None
+
+    def do_GET(self):
+        web = self.web
+        web.count("requests")
+        if self.path == "/robots.txt":
+            return self._reply(200, b"User-agent: *\nAllow: /\n", "text/plain")
+
+        try:
+            index = int(self.path.rsplit("/", 1)[-1].split(".")[0])
+            body = web.corpus[index]
+        except (ValueError, IndexError):
+            return self._reply(404, b"not found", "text/plain")
+
+        time.sleep(web.sample_latency())
+        burst_left = web.in_burst()
+        if burst_left is not None:
+            web.count("http_429")
+            return self._reply(429, b"too many requests", "text/plain",
+                               {"Retry-After": str(max(1, math.ceil(burst_left)))})
+        if web.random() < web.error_rate:
+            web.count("http_503")
+            return self._reply(503, b"unavailable", "text/plain")
+
+        if index in web.slow:
+            web.count("slow")
+            return self._drip(body)
+        web.count("pages")
+        self._reply(200, body, "text/html; charset=utf-8")
+
+    def _send_headers(self, status: int, length: int, content_type: str, headers: Optional[Dict] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(length))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def _reply(self, status: int, body: bytes, content_type: str, headers: Optional[Dict] = None):
+        try:
+            self._send_headers(status, len(body), content_type, headers)
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # il client ha chiuso (timeout): niente da fare
+
+    def _drip(self, body: bytes, chunk: int = 4096):
+        """Body a velocità limitata (slow_kbps): il download resta aperto a lungo"""
+        try:
+            self._send_headers(200, len(body), "text/html; charset=utf-8")
+            for offset in range(0, len(body), chunk):
+                self.wfile.write(body[offset:offset + chunk])
+                self.wfile.flush()
+                time.sleep(chunk / (self.web.slow_kbps * 1024))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+# --- Processo di un motore ---
+
+class BenchmarkRepository(Repository):
+    """Repository in memoria: le fonti del corpus, i salvataggi vengono solo contati"""
+    name = "benchmark"
+
+    def __init__(self, sources: List[Dict]):
+        self.sources = sources
+        self.saved = set()
+        self._lock = threading.Lock()
+
+    def check_health(self) -> bool:
+        return True
+
+    def list_projects(self, limit: int = 2000) -> Optional[List[Dict]]:
+        return [{"id": BENCHMARK_PROJECT_ID, "name": "benchmark", "description": None, "created_at": None}]
+
+    def create_project(self, name: str, description: Optional[str] = None) -> Optional[Dict]:
+        return None
+
+    def get_project_sources(self, project_id: int, limit: int = 5000) -> Optional[List[Dict]]:
+        return [dict(source) for source in self.sources[:limit]]
+
+    def get_source(self, source_id: int) -> Optional[Dict]:
+        return next((dict(source) for source in self.sources if source["id"] == source_id), None)
+
+    def create_source(self, project_id: int, title: str, url: Optional[str]) -> Optional[Dict]:
+        return None
+
+    def create_sources_bulk(self, project_id: int, sources: List[Dict]) -> Optional[List[Dict]]:
+        return None
+
+    def update_source_content(self, source_id: int, content: str,
+                              validators: Optional[Dict] = None) -> Optional[Dict]:
+        with self._lock:
+            self.saved.add(source_id)
+        return {"id": source_id, "content": content, **(validators or {})}
+
+    def update_sources_content_bulk(self, updates: List[Dict]) -> Optional[Dict]:
+        with self._lock:
+            self.saved.update(update["id"] for update in updates)
+        return {"updated": [update["id"] for update in updates], "missing": [], "duplicates": {}}
+
+    def get_duplicate_clusters(self, project_id: int) -> Optional[List[Dict]]:
+        return []
+
+    def add_entities(self, source_id: int, entities: List[Dict]) -> Optional[int]:
+        return None
+
+def run_engine(engine: str, urls: List[str]) -> Dict:
+    """Crawl del corpus con il motore richiesto; gira nel processo figlio"""
+    if engine == "async":
+        try:
+            import aiohttp  # noqa: F401
+        except ImportError:
+            return {"error": "aiohttp non installato"}
+    from improved_crawler import create_crawler
+
+    sources = [{"id": i + 1, "title": f"pagina {i}", "url": url, "content": None} for i, url in enumerate(urls)]
+    crawler = create_crawler(engine)
+    repo = BenchmarkRepository(sources)
+    crawler.repo = repo
+    fetch_seconds: List[float] = []
+    crawler.scraper.add_fetch_listener(lambda event: fetch_seconds.append(event.elapsed))
+
+    cpu_start = os.times()
+    start = time.perf_counter()
+    crawler.crawl_project(BENCHMARK_PROJECT_ID)
+    elapsed = time.perf_counter() - start
+    # Chiude il pool di parsing del motore pipeline: la CPU dei processi terminati è nei campi children
+    crawler.close()
+    cpu_end = os.times()
+    cpu = sum(cpu_end[i] - cpu_start[i] for i in range(4))
+
+    pages = len(repo.saved)
+    fetch_seconds.sort()
+    return {
+        "pages": pages,
+        "failed": crawler.stats['failed'],
+        "seconds": elapsed,
+        "pages_per_sec": pages / elapsed,
+        "p50_fetch_ms": statistics.median(fetch_seconds) * 1000 if fetch_seconds else 0.0,
+        "p99_fetch_ms": fetch_seconds[max(math.ceil(len(fetch_seconds) * 0.99) - 1, 0)] * 1000 if fetch_seconds else 0.0,
+        "cpu_ms_per_page": cpu * 1000 / max(pages, 1),
+        # ru_maxrss è in KB su Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "worker_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+def run_engine_process(engine: str, urls: List[str], workers: Optional[int]) -> Dict:
+    """Esegue il motore in un processo nuovo: RSS e CPU non risentono dei motori precedenti"""
+    env = {**DEFAULT_ENV, **os.environ, **ISOLATED_ENV}
+    if workers:
+        env["MAX_CRAWLER_WORKERS"] = str(workers)
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--engine-run", engine],
+        input=json.dumps(urls), capture_output=True, text=True, env=env
+    )
+    sys.stderr.write(completed.stderr)
+    if completed.returncode != 0 or not completed.stdout.strip():
+        return {"error": f"processo terminato con codice {completed.returncode}"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def median_runs(runs: List[Dict]) -> Dict:
+    """Mediana di ogni metrica sulle ripetizioni (il primo errore se un run non è riuscito)"""
+    failed = [run for run in runs if "error" in run]
+    if failed:
+        return failed[0]
+    return {key: statistics.median(run.get(key, 0) for run in runs) for key in runs[0]}
+
+# --- Confronto e report ---
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Regressioni oltre la soglia (frazione) rispetto alla baseline, motore per motore"""
+    regressions = []
+    for engine, current in results.items():
+        previous = baseline.get("engines", {}).get(engine)
+        if not previous or "error" in current or "error" in previous:
+            continue
+        for metric, higher_is_better in REGRESSION_METRICS.items():
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f"{engine}: {metric} {before:.2f} -> {after:.2f} ({change:+.0%})")
+    return regressions
+
+def print_results(results: Dict, server: Dict[str, Dict]):
+    print(f"\n{'Motore':<10} {'Pagine/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'CPU ms/p':>9} {'RSS MB':>8} "
+          f"{'Salvate':>8} {'Fallite':>8} {'Richieste':>9} {'429':>5} {'503':>5}")
+    print("-" * 100)
+    for engine, r in results.items():
+        if "error" in r:
+            print(f"{engine:<10} non eseguito: {r['error']}")
+            continue
+        served = server.get(engine, {})
+        print(f"{engine:<10} {r['pages_per_sec']:>9.1f} {r['p50_fetch_ms']:>8.1f} {r['p99_fetch_ms']:>8.1f} "
+              f"{r['cpu_ms_per_page']:>9.2f} {r['peak_rss_mb']:>8.1f} {r['pages']:>8.0f} {r['failed']:>8.0f} "
+              f"{served.get('requests', 0):>9.0f} {served.get('http_429', 0):>5.0f} {served.get('http_503', 0):>5.0f}")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark dei motori di crawling su un web sintetico locale")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="motori da misurare, separati da virgola")
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--hosts", type=int, default=8, help="host distinti (127.0.0.1 ... 127.0.0.N)")
+    parser.add_argument("--workers", type=int, help="MAX_CRAWLER_WORKERS dei motori threads e pipeline")
+    parser.add_argument("--repeat", type=int, default=3, help="run per motore: si riporta la mediana")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="latenza mediana del server")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="dispersione log-normale (0 = fissa)")
+    parser.add_argument("--page-kb", type=float, default=40.0, help="dimensione mediana delle pagine")
+    parser.add_argument("--page-sigma", type=float, default=0.6)
+    parser.add_argument("--error-rate", type=float, default=0.01, help="quota di risposte 503")
+    parser.add_argument("--burst-every", type=float, default=0.0,
+                        help="ogni quanti secondi inizia una raffica di 429 (0 = nessuna)")
+    parser.add_argument("--burst-length", type=float, default=1.0, help="durata di una raffica di 429 (secondi)")
+    parser.add_argument("--slow-rate", type=float, default=0.01, help="quota di pagine con body lento")
+    parser.add_argument("--slow-kbps", type=float, default=64.0, help="velocità dei body lenti (KB/s)")
+    parser.add_argument("--save", metavar="FILE", help="salva i risultati in JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="risultati JSON di un run precedente da confrontare")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="peggioramento massimo tollerato rispetto alla baseline (frazione)")
+    parser.add_argument("--engine-run", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if args.engine_run:
+        # Processo figlio: le URL arrivano su stdin, il risultato esce come ultima riga JSON
+        print(json.dumps(run_engine(args.engine_run, json.loads(sys.stdin.read()))))
+        return
+
+    scenario = {key: getattr(args, key) for key in (
+        "pages", "hosts", "workers", "seed", "latency_ms", "latency_sigma", "page_kb", "page_sigma",
+        "error_rate", "burst_every", "burst_length", "slow_rate", "slow_kbps"
+    )}
+    engines = [engine.strip() for engine in args.engines.split(",") if engine.strip()]
+    unknown = [engine for engine in engines if engine not in ENGINES]
+    if unknown:
+        sys.exit(f"Motori sconosciuti: {', '.join(unknown)} (disponibili: {', '.join(ENGINES)})")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("scenario") != scenario:
+            print(f"❌ Scenario diverso dalla baseline {args.baseline}: confronto non significativo")
+            print(f"   baseline: {baseline.get('scenario')}\n   attuale:  {scenario}")
+            sys.exit(2)
+
+    web = FixtureWeb(args.pages, args.hosts, seed=args.seed, latency_ms=args.latency_ms,
+                     latency_sigma=args.latency_sigma, page_kb=args.page_kb, page_sigma=args.page_sigma,
+                     error_rate=args.error_rate, burst_every=args.burst_every, burst_length=args.burst_length,
+                     slow_rate=args.slow_rate, slow_kbps=args.slow_kbps)
+    try:
+        port = web.start()
+    except OSError as e:
+        sys.exit(f"Impossibile avviare i server di fixture su 127.0.0.1-{args.hosts}: {e} (provare --hosts 1)")
+    size_mb = sum(len(page) for page in web.corpus) / 1e6
+    print(f"Corpus: {args.pages} pagine ({size_mb:.1f} MB) su {args.hosts} host, porta {port}; "
+          f"latenza mediana {args.latency_ms:.0f} ms, {len(web.slow)} pagine lente")
+
+    urls = [web.url(index, port) for index in range(args.pages)]
+    results, server = {}, {}
+    try:
+        for engine in engines:
+            print(f"  {engine}...", flush=True)
+            runs, served = [], []
+            for _ in range(args.repeat):
+                web.reset_counters()
+                web.restart_clock()
+                runs.append(run_engine_process(engine, urls, args.workers))
+                served.append(web.reset_counters())
+            results[engine] = median_runs(runs)
+            server[engine] = {key: statistics.median(counters.get(key, 0) for counters in served)
+                              for key in {key for counters in served for key in counters}}
+    finally:
+        web.stop()
+
+    print_results(results, server)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"scenario": scenario, "engines": results, "server": server}, f, indent=2)
+        print(f"\nRisultati salvati in {args.save}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ Regressioni oltre il {args.threshold:.0%} rispetto a {args.baseline}:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print(f"\n✅ Nessuna regressione oltre il {args.threshold:.0%} rispetto a {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# benchmark_crud_writes.py
+"""
+Microbenchmark dei percorsi di scrittura di app/crud.py:
+implementazione precedente (read + write + commit + refresh) contro INSERT/UPDATE ... RETURNING.
+
+Utilizzo: DATABASE_URL=postgresql://... python benchmark_crud_writes.py [iterazioni] [batch_commit]
+"""
+import sys
+import time
+import statistics
+from typing import Callable, Dict, List
+
+from sqlalchemy import event
+
+from app.core.database import engine, SessionLocal
+from app import crud
+from app.models.project import Base
+from app.models import project as project_model, source as source_model, entity as entity_model  # noqa: F401 (registra i modelli)
+from app.schemas import project as project_schema, source as source_schema
+
+# --- Implementazione precedente, mantenuta come riferimento ---
+
+def legacy_create_project(db, project):
+    db_project = project_model.Project(name=project.name, description=project.description)
+    db.add(db_project)
+    db.commit()
+    db.refresh(db_project)
+    return project_schema.Project.model_validate(db_project)
+
+def legacy_update_project(db, project_id, project_update):
+    db_project = crud.get_project(db, project_id)
+    for key, value in project_update.dict(exclude_unset=True).items():
+        setattr(db_project, key, value)
+    db.commit()
+    db.refresh(db_project)
+    return project_schema.Project.model_validate(db_project)
+
+def legacy_create_project_source(db, source, project_id):
+    db_source = source_model.Source(**source.dict(), project_id=project_id)
+    db.add(db_source)
+    db.commit()
+    db.refresh(db_source)
+    return source_schema.Source.model_validate(db_source)
+
+def legacy_update_source_content(db, source_id, content):
+    db_source = crud.get_source(db, source_id=source_id)
+    db_source.content = content
+    db.commit()
+    db.refresh(db_source)
+    return source_schema.Source.model_validate(db_source)
+
+# --- Misura ---
+
+class StatementCounter:
+    """Conta le istruzioni SQL inviate al database"""
+
+    def __init__(self):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+def measure(name: str, operation: Callable[[int], None], iterations: int, counter: StatementCounter,
+            db=None, batch_commit: int = 0) -> Dict:
+    latencies: List[float] = []
+    statements_before = counter.count
+    start = time.perf_counter()
+    for i in range(iterations):
+        op_start = time.perf_counter()
+        operation(i)
+        if batch_commit and (i + 1) % batch_commit == 0:
+            db.commit()
+        latencies.append((time.perf_counter() - op_start) * 1000)
+    if batch_commit:
+        db.commit()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "name": name,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "ops_per_sec": iterations / elapsed,
+        "statements_per_op": (counter.count - statements_before) / iterations,
+    }
+
+def print_results(results: List[Dict]):
+    print(f"\n{'Operazione':<42} {'p50 ms':>9} {'p95 ms':>9} {'op/s':>9} {'SQL/op':>7}")
+    print("-" * 80)
+    for r in results:
+        print(f"{r['name']:<42} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['ops_per_sec']:>9.1f} {r['statements_per_op']:>7.2f}")
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    batch_commit = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    Base.metadata.create_all(bind=engine)
+    counter = StatementCounter()
+    db = SessionLocal()
+    content = "Lorem ipsum dolor sit amet. " * 200
+    results = []
+    created_project_ids = []
+
+    try:
+        bench_project = crud.create_project(db, project_schema.ProjectCreate(name="benchmark_crud_writes"))
+        pid = bench_project.id
+        created_project_ids.append(pid)
+        source_ids = [crud.create_project_source(db, source_schema.SourceCreate(title=f"bench {i}"), pid).id
+                      for i in range(iterations)]
+
+        def new_project(create: Callable):
+            def operation(i):
+                project = create(db, project_schema.ProjectCreate(name=f"bench {i}", description="benchmark"))
+                created_project_ids.append(project.id)
+            return operation
+
+        results.append(measure("create_project (prima)", new_project(legacy_create_project), iterations, counter))
+        results.append(measure("create_project (RETURNING)", new_project(crud.create_project), iterations, counter))
+
+        # Progetto con poche fonti: la risposta di update_project include le fonti
+        update_pid = crud.create_project(db, project_schema.ProjectCreate(name="benchmark_crud_writes_update")).id
+        created_project_ids.append(update_pid)
+        for i in range(10):
+            crud.create_project_source(db, source_schema.SourceCreate(title=f"bench update {i}"), update_pid)
+        update = project_schema.ProjectUpdate(description="benchmark aggiornato")
+        results.append(measure("update_project (prima)", lambda i: legacy_update_project(db, update_pid, update), iterations, counter))
+        results.append(measure("update_project (RETURNING)", lambda i: crud.update_project(db, update_pid, update), iterations, counter))
+
+        def new_source(i):
+            return source_schema.SourceCreate(title=f"bench source {i}", url=f"https://example.com/{i}")
+
+        results.append(measure("create_project_source (prima)", lambda i: legacy_create_project_source(db, new_source(i), pid), iterations, counter))
+        results.append(measure("create_project_source (RETURNING)", lambda i: crud.create_project_source(db, new_source(i), pid), iterations, counter))
+        results.append(measure(f"create_project_source (commit ogni {batch_commit})",
+                               lambda i: crud.create_project_source(db, new_source(i), pid, commit=False),
+                               iterations, counter, db=db, batch_commit=batch_commit))
+
+        results.append(measure("update_source_content (prima)", lambda i: legacy_update_source_content(db, source_ids[i], content), iterations, counter))
+        results.append(measure("update_source_content (RETURNING)", lambda i: crud.update_source_content(db, source_ids[i], content), iterations, counter))
+        results.append(measure(f"update_source_content (commit ogni {batch_commit})",
+                               lambda i: crud.update_source_content(db, source_ids[i], content, commit=False),
+                               iterations, counter, db=db, batch_commit=batch_commit))
+
+        print_results(results)
+    finally:
+        # Pulizia dei dati generati dal benchmark
+        db.rollback()
+        if created_project_ids:
+            db.query(source_model.Source).filter(
+                source_model.Source.project_id.in_(created_project_ids)
+            ).delete(synchronize_session=False)
+            db.query(project_model.Project).filter(
+                project_model.Project.id.in_(created_project_ids)
+            ).delete(synchronize_session=False)
+            db.commit()
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmark_extractors.py
+"""
+Confronto tra i backend di estrazione del testo (text_extractors.py) su un corpus HTML fisso:
+pagine al secondo, MB/s ed equivalenza dell'output rispetto al percorso BeautifulSoup.
+
+Utilizzo: python benchmark_extractors.py [cartella_html] [iterazioni]
+Senza cartella viene usato un corpus sintetico riproducibile di 200 pagine.
+"""
+import sys
+import time
+import random
+import difflib
+from pathlib import Path
+from typing import Dict, List
+
+from text_extractors import EXTRACTORS, available_extractors, get_extractor
+
+PARAGRAPH_WORDS = [
+    "ricerca", "università", "città", "perché", "analisi", "dati", "modello", "progetto",
+    "fonte", "contenuto", "entità", "Milano", "Roma", "società", "intelligenza", "artificiale",
+    "&amp;", "&nbsp;", "&egrave;", "&#8364;", "l'articolo", "«citazione»", "—",
+]
+
+def generate_page(rng: random.Random) -> str:
+    """Pagina con la struttura tipica di un sito: menu, script, tabelle, commenti, spazi irregolari"""
+    def paragraph(words: int) -> str:
+        return " ".join(rng.choice(PARAGRAPH_WORDS) for _ in range(words))
+
+    body = []
+    for section in range(rng.randint(3, 12)):
+        body.append(f"<h2>Sezione {section}</h2>")
+        for _ in range(rng.randint(2, 8)):
+            body.append(f"<p>{paragraph(rng.randint(20, 120))} <a href='/l{section}'>link</a>  <b>{paragraph(3)}</b></p>")
+        if rng.random() < 0.3:
+            rows = "".join(f"<tr><td>{paragraph(2)}</td><td>{rng.randint(0, 999)}</td></tr>" for _ in range(rng.randint(3, 15)))
+            body.append(f"<table>{rows}</table>")
+        if rng.random() < 0.3:
+            body.append(f"<!-- {paragraph(5)} --><script>var s{section} = '{paragraph(10)}';</script>")
+        body.append("\n   \n\t" * rng.randint(0, 3))
+    return (
+        "<!DOCTYPE html><html lang='it'><head><meta charset='utf-8'>"
+        f"<title>{paragraph(6)}</title><style>body {{ color: #333; }}</style>"
+        "<script src='/app.js'></script></head><body>"
+        f"<header><h1>{paragraph(4)}</h1></header>"
+        f"<nav><ul>{''.join(f'<li><a href=/m{i}>{paragraph(2)}</a></li>' for i in range(rng.randint(5, 30)))}</ul></nav>"
+        f"<main><article>{''.join(body)}</article></main>"
+        f"<aside>{paragraph(30)}</aside><iframe src='/ad'></iframe>"
+        f"<footer>{paragraph(15)}</footer></body></html>"
+    )
+
+def load_corpus(directory: str = None, pages: int = 200) -> List[str]:
+    if directory:
+        corpus = [p.read_text(encoding="utf-8", errors="replace") for p in sorted(Path(directory).glob("*.htm*"))]
+        if not corpus:
+            sys.exit(f"Nessun file .html in {directory}")
+        return corpus
+    rng = random.Random(42)
+    return [generate_page(rng) for _ in range(pages)]
+
+def measure(name: str, corpus: List[str], iterations: int) -> Dict[str, float]:
+    extractor = get_extractor(name)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for html in corpus:
+            extractor.extract(html)
+    elapsed = time.perf_counter() - start
+    total_bytes = sum(len(html.encode("utf-8")) for html in corpus) * iterations
+    return {"pages_per_sec": len(corpus) * iterations / elapsed, "mb_per_sec": total_bytes / elapsed / 1e6}
+
+def equivalence(name: str, reference: List[str], corpus: List[str]) -> Dict[str, float]:
+    """Quota di pagine con output identico al riferimento e similarità minima (per righe) tra le altre"""
+    extractor = get_extractor(name)
+    identical, worst = 0, 1.0
+    for expected, html in zip(reference, corpus):
+        text = extractor.extract(html)
+        if text == expected:
+            identical += 1
+        else:
+            worst = min(worst, difflib.SequenceMatcher(None, expected.splitlines(), text.splitlines()).ratio())
+    return {"identical": identical / len(corpus), "min_similarity": worst}
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].isdigit() else None
+    iterations = int(sys.argv[-1]) if len(sys.argv) > 1 and sys.argv[-1].isdigit() else 3
+
+    corpus = load_corpus(directory)
+    size_mb = sum(len(html.encode("utf-8")) for html in corpus) / 1e6
+    print(f"Corpus: {len(corpus)} pagine, {size_mb:.1f} MB, {iterations} iterazioni")
+
+    missing = [name for name in EXTRACTORS if name not in available_extractors()]
+    if missing:
+        print(f"⚠️  Backend non installati: {', '.join(missing)}")
+
+    reference = [get_extractor("bs4").extract(html) for html in corpus]
+
+    print(f"\n{'Backend':<12} {'Pagine/s':>10} {'MB/s':>8} {'vs bs4':>8} {'Identiche':>10} {'Sim. min':>9}")
+    results = {}
+    for name in available_extractors():
+        r = {**measure(name, corpus, iterations), **equivalence(name, reference, corpus)}
+        results[name] = r
+        speedup = r["pages_per_sec"] / results["bs4"]["pages_per_sec"]
+        print(f"{name:<12} {r['pages_per_sec']:>10.1f} {r['mb_per_sec']:>8.2f} {speedup:>7.1f}x "
+              f"{r['identical']:>9.0%} {r['min_similarity']:>9.3f}")
+
+    equivalent = [name for name, r in results.items() if r["identical"] == 1.0]
+    fastest = max(equivalent, key=lambda name: results[name]["pages_per_sec"])
+    print(f"\nBackend più veloce con output identico: {fastest} (CRAWLER_EXTRACTOR={fastest})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+# build_static_assets.py
+"""
+Build degli asset statici: nomi con hash del contenuto e varianti gzip/brotli precompresse
+"""
+import sys
+import logging
+from pathlib import Path
+
+from app.core.static_assets import build_assets
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+def main():
+    static_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("app/static")
+    if not static_dir.is_dir():
+        print(f"❌ Directory statica non trovata: {static_dir}")
+        sys.exit(1)
+
+    manifest = build_assets(static_dir)
+    print(f"✅ {len(manifest)} asset generati in {static_dir / 'build'}")
+    for original, hashed in manifest.items():
+        print(f"   {original} -> {hashed}")
+
+if __name__ == "__main__":
+    main()
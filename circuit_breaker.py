@@ -0,0 +1,115 @@
+# circuit_breaker.py
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from host_scheduler import host_of
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Solo questi esiti dicono che l'host non risponde: un 404 o un 500 arrivano comunque da un server vivo
+BREAKER_ERRORS = frozenset(("timeout", "connection"))
+
+@dataclass
+class HostCircuit:
+    state: str = CLOSED
+    failures: int = 0  # errori consecutivi
+    cooldown: float = 0.0
+    opened_at: float = 0.0
+    probe_started_at: Optional[float] = None
+    trips: int = 0
+    rejected: int = 0
+
+class HostCircuitBreaker:
+    """
+    Circuit breaker per host: dopo `threshold` timeout o errori di connessione consecutivi il
+    circuito si apre e le richieste a quell'host falliscono subito. Trascorso il cooldown passa
+    una sola richiesta di prova (half-open): se riesce il circuito si chiude, altrimenti si
+    riapre con cooldown doppio, fino a `max_cooldown`. Thread-safe.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 60.0, max_cooldown: float = 600.0):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max(max_cooldown, cooldown)
+        self._circuits: Dict[str, HostCircuit] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def allow(self, url: str) -> bool:
+        """True se la richiesta può partire (circuito chiuso o richiesta di prova)"""
+        if not self.enabled:
+            return True
+        host = host_of(url)
+        now = time.monotonic()
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if circuit is None or circuit.state == CLOSED:
+                return True
+            if circuit.state == OPEN and now - circuit.opened_at >= circuit.cooldown:
+                circuit.state = HALF_OPEN
+                circuit.probe_started_at = now
+                logger.info(f"Circuito {host}: richiesta di prova")
+                return True
+            # Una prova rimasta senza esito (es. task annullato) non blocca l'host per sempre
+            if circuit.state == HALF_OPEN and now - circuit.probe_started_at >= circuit.cooldown:
+                circuit.probe_started_at = now
+                return True
+            circuit.rejected += 1
+            return False
+
+    def retry_after(self, url: str) -> float:
+        """Secondi alla prossima richiesta di prova per l'host della URL"""
+        with self._lock:
+            circuit = self._circuits.get(host_of(url))
+            if circuit is None or circuit.state == CLOSED:
+                return 0.0
+            started = circuit.opened_at if circuit.state == OPEN else circuit.probe_started_at
+            return max(started + circuit.cooldown - time.monotonic(), 0.0)
+
+    def record(self, url: str, error: Optional[str]):
+        """Esito di una richiesta verso l'host"""
+        if not self.enabled:
+            return
+        host = host_of(url)
+        now = time.monotonic()
+        with self._lock:
+            circuit = self._circuits.setdefault(host, HostCircuit(cooldown=self.base_cooldown))
+            if error not in BREAKER_ERRORS:
+                if circuit.state != CLOSED:
+                    logger.info(f"Circuito {host} chiuso: l'host risponde di nuovo")
+                circuit.state = CLOSED
+                circuit.failures = 0
+                circuit.cooldown = self.base_cooldown
+                return
+
+            circuit.failures += 1
+            if circuit.state == HALF_OPEN:
+                circuit.cooldown = min(circuit.cooldown * 2, self.max_cooldown)
+                self._open(host, circuit, now, f"prova fallita ({error})")
+            elif circuit.state == CLOSED and circuit.failures >= self.threshold:
+                self._open(host, circuit, now, f"{circuit.failures} errori consecutivi ({error})")
+
+    def _open(self, host: str, circuit: HostCircuit, now: float, reason: str):
+        circuit.state = OPEN
+        circuit.opened_at = now
+        circuit.probe_started_at = None
+        circuit.trips += 1
+        logger.warning(f"Circuito {host} aperto per {circuit.cooldown:.0f}s: {reason}")
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                host: {"state": c.state, "failures": c.failures, "trips": c.trips, "rejected": c.rejected}
+                for host, c in self._circuits.items()
+                if c.trips or c.state != CLOSED
+            }
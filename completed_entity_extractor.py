@@ -5,8 +5,9 @@ from typing import Dict, List, Optional, Set
 from collections import defaultdict, Counter
 import spacy
 from spacy.lang.it.stop_words import STOP_WORDS
-from utils import api_client, retry_on_failure, progress_tracker
+from utils import retry_on_failure, progress_tracker
 from config import config
+from repository import get_repository
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +15,8 @@ class EntityExtractor:
     """Estrattore avanzato di entità named entity recognition"""
     
     def __init__(self):
-        self.api = api_client
+        # API HTTP o database diretto (DATA_ACCESS_MODE)
+        self.repo = get_repository()
         self.nlp = None
         self._load_nlp_model()
         
@@ -47,17 +49,10 @@ class EntityExtractor:
         """Recupera il contenuto di una fonte"""
         logger.info(f"Recupero contenuto per fonte ID: {source_id}")
         
-        projects = self.api.get("/projects/", params={"limit": 2000})
-        if not projects:
-            return None
-        
-        for project in projects:
-            for source in project.get('sources', []):
-                if source['id'] == source_id:
-                    return source
-        
-        logger.error(f"Fonte {source_id} non trovata")
-        return None
+        source = self.repo.get_source(source_id)
+        if source is None:
+            logger.error(f"Fonte {source_id} non trovata")
+        return source
     
     def extract_entities(self, text: str) -> Dict[str, List[Dict]]:
         """Estrae entità dal testo usando spaCy"""
@@ -174,15 +169,13 @@ class EntityExtractor:
                 logger.info("Nessuna entità da salvare")
                 return True
             
-            # Salva tramite API
-            # NOTA: Questo endpoint deve essere implementato nell'API
-            # POST /sources/{source_id}/entities
-            for entity in all_entities:
-                result = self.api.post(f"/sources/{source_id}/entities", json=entity)
-                if result is None:
-                    logger.warning(f"Errore nel salvare entità: {entity['text']}")
+            # Salva tutte le entità in un'unica operazione (POST /sources/{source_id}/entities)
+            created = self.repo.add_entities(source_id, all_entities)
+            if created is None:
+                logger.warning(f"Errore nel salvare le entità della fonte {source_id}")
+                return False
             
-            logger.info(f"Salvate {len(all_entities)} entità per fonte {source_id}")
+            logger.info(f"Salvate {created} nuove entità su {len(all_entities)} per fonte {source_id}")
             return True
             
         except Exception as e:
@@ -197,6 +190,11 @@ class EntityExtractor:
             if not source_info:
                 return False
             
+            if source_info.get('duplicate_of'):
+                # Quasi-duplicato di un'altra fonte: le entità sono già quelle dell'originale
+                logger.info(f"Fonte {source_id} saltata: quasi-duplicato della fonte {source_info['duplicate_of']}")
+                return True
+            
             content = source_info.get('content', '')
             if not content or not content.strip():
                 logger.warning(f"Nessun contenuto trovato per fonte {source_id}")
@@ -241,7 +239,7 @@ def main():
         sys.exit(1)
     
     # Verifica connessione API
-    if not api_client.check_health():
+    if not get_repository().check_health():
         logger.error("API non raggiungibile. Assicurati che il server sia in esecuzione.")
         sys.exit(1)
     
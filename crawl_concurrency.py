@@ -0,0 +1,200 @@
+# crawl_concurrency.py
+import asyncio
+import logging
+import math
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Sotto questa soglia il p95 non è considerato un segnale di coda (latenze di pochi ms sono rumore)
+MIN_LATENCY_TARGET = 0.5
+
+def percentile(values: Iterable[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    return ordered[index]
+
+class AIMDController:
+    """
+    Limite di concorrenza adattivo (AIMD) per i download del crawler.
+
+    Ogni `window` download confronta il p95 della latenza e la quota di esiti di sovraccarico
+    (429, 5xx, timeout) con le soglie: se sono sani e il limite è stato raggiunto lo aumenta,
+    altrimenti lo riduce di `decrease`. Finché non c'è stata una riduzione cresce del 50% per
+    finestra (slow start), poi di `increase`. Un singolo sovraccarico riduce subito il limite,
+    ma al più una volta per "giro" di richieste in volo. Thread-safe.
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: Optional[int] = None, enabled: bool = True,
+                 window: int = 20, increase: float = 1.0, decrease: float = 0.5,
+                 latency_target: float = 0.0, latency_tolerance: float = 2.0, error_threshold: float = 0.1):
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum or initial, self.minimum)
+        self.enabled = enabled
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.increase = increase
+        self.decrease = decrease
+        # latency_target=0: soglia automatica, `latency_tolerance` volte il miglior p95 osservato
+        self.latency_target = latency_target
+        self.latency_tolerance = latency_tolerance
+        self.error_threshold = error_threshold
+        self.baseline_p95: Optional[float] = None
+
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._overloads: Deque[bool] = deque(maxlen=window)
+        self._since_evaluation = 0
+        self._since_decrease = 0
+        self._saturated = False
+        self._slow_start = True
+
+        self.increases = 0
+        self.decreases = 0
+        self.peak_limit = int(self.limit)
+        self.last_decision = "avvio"
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    # --- slot di concorrenza ---
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            return self._try_acquire()
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            self._saturated = True
+            return False
+        self.in_flight += 1
+        if self.in_flight >= int(self.limit):
+            self._saturated = True
+        return True
+
+    def acquire(self):
+        """Attende uno slot libero (il limite può cambiare mentre si attende)"""
+        with self._cond:
+            while not self._try_acquire():
+                self._cond.wait()
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    # --- segnali ---
+
+    def record_fetch(self, event):
+        """Osservatore di WebScraper: un FetchEvent per ogni download concluso"""
+        self.record(event.elapsed, event.overloaded)
+
+    def record(self, latency: float, overloaded: bool):
+        with self._cond:
+            self._latencies.append(latency)
+            self._overloads.append(overloaded)
+            self._since_evaluation += 1
+            self._since_decrease += 1
+            if not self.enabled:
+                return
+            if overloaded and self._since_decrease >= int(self.limit):
+                self._decrease("sovraccarico (429/5xx/timeout)")
+            elif self._since_evaluation >= self._latencies.maxlen:
+                self._evaluate()
+
+    def _evaluate(self):
+        self._since_evaluation = 0
+        p95 = percentile(self._latencies, 0.95)
+        overload_rate = sum(self._overloads) / len(self._overloads)
+        target = self._latency_target(p95)
+
+        if overload_rate > self.error_threshold:
+            self._decrease(f"errori {overload_rate:.0%}")
+        elif p95 > target:
+            self._decrease(f"p95 {p95:.2f}s oltre {target:.2f}s")
+        elif self._saturated:
+            self._increase()
+        self._saturated = False
+
+    def _latency_target(self, p95: float) -> float:
+        if self.latency_target > 0:
+            return self.latency_target
+        self.baseline_p95 = p95 if self.baseline_p95 is None else min(self.baseline_p95, p95)
+        return max(self.baseline_p95 * self.latency_tolerance, MIN_LATENCY_TARGET)
+
+    def _increase(self):
+        if self.limit >= self.maximum:
+            return
+        step = self.limit * 0.5 if self._slow_start else self.increase
+        self.limit = min(self.limit + max(step, 1.0), self.maximum)
+        self.increases += 1
+        self.peak_limit = max(self.peak_limit, int(self.limit))
+        self.last_decision = f"aumento a {int(self.limit)}"
+        logger.debug(f"Concorrenza: {self.last_decision}")
+        self._cond.notify_all()
+
+    def _decrease(self, reason: str):
+        self._slow_start = False
+        self._since_decrease = 0
+        self._since_evaluation = 0
+        # La finestra descriveva il vecchio limite
+        self._latencies.clear()
+        self._overloads.clear()
+        if self.limit <= self.minimum:
+            return
+        self.limit = max(self.limit * self.decrease, self.minimum)
+        self.decreases += 1
+        self.last_decision = f"riduzione a {int(self.limit)}: {reason}"
+        logger.info(f"Concorrenza: {self.last_decision}")
+
+    def metrics(self) -> Dict:
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "peak_limit": self.peak_limit,
+                "in_flight": self.in_flight,
+                "p95_latency": percentile(self._latencies, 0.95),
+                "overload_rate": sum(self._overloads) / len(self._overloads) if self._overloads else 0.0,
+                "increases": self.increases,
+                "decreases": self.decreases,
+                "last_decision": self.last_decision,
+            }
+
+class AsyncSlots:
+    """Slot del controller per il motore asyncio: l'attesa sospende la coroutine, non il thread"""
+
+    def __init__(self, controller: AIMDController):
+        self.controller = controller
+        self._changed = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._changed:
+            await self._changed.wait_for(self.controller.try_acquire)
+
+    async def __aexit__(self, *exc_info):
+        self.controller.release()
+        async with self._changed:
+            self._changed.notify_all()
+
+def create_controller(initial: int, maximum: Optional[int] = None) -> AIMDController:
+    """
+    Controller configurato: parte da `initial` e cresce fino a `maximum` (default
+    CRAWLER_MAX_CONCURRENCY). Con CRAWLER_ADAPTIVE_CONCURRENCY=false resta fisso al massimo
+    indicato dal motore o, se non indicato, a `initial`.
+    """
+    if not config.crawler.adaptive_concurrency:
+        fixed = maximum or initial
+        return AIMDController(initial=fixed, minimum=fixed, maximum=fixed, enabled=False)
+    return AIMDController(
+        initial=initial,
+        minimum=config.crawler.min_concurrency,
+        maximum=max(maximum or config.crawler.max_concurrency, initial),
+        latency_target=config.crawler.latency_target
+    )
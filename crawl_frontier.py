@@ -0,0 +1,204 @@
+# crawl_frontier.py
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+
+# Campi della fonte conservati nella frontiera (il contenuto no, basta sapere se c'è)
+PAYLOAD_FIELDS = ("id", "title", "url", "project_id", "etag", "last_modified", "content_hash")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawl_runs (
+    run_id TEXT PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    recrawl INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS frontier (
+    run_id TEXT NOT NULL,
+    source_id INTEGER NOT NULL,
+    url TEXT,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_eligible_at REAL NOT NULL,
+    last_error TEXT,
+    updated_at REAL NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (run_id, source_id)
+);
+CREATE INDEX IF NOT EXISTS idx_frontier_claim ON frontier (run_id, state, next_eligible_at);
+"""
+
+def source_payload(source: Dict) -> Dict:
+    payload = {field: source.get(field) for field in PAYLOAD_FIELDS}
+    payload["has_content"] = bool((source.get("content") or "").strip())
+    return payload
+
+class CrawlFrontier:
+    """
+    Frontiera persistente su SQLite: ogni run ha le sue URL con stato
+    (pending/in_flight/done/failed), numero di tentativi e prossimo istante utile.
+    Un crawl interrotto riprende dal run id; i fallimenti tornano in coda con backoff.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3, retry_backoff: float = 30.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def create_run(self, project_id: int, sources: List[Dict], recrawl: bool = False,
+                   scope: Optional[str] = None) -> str:
+        # scope serve alla coda condivisa per unire i nodi allo stesso run: la frontiera locale crea sempre un run nuovo
+        run_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT INTO crawl_runs (run_id, project_id, recrawl, created_at) VALUES (?, ?, ?, ?)",
+                (run_id, project_id, int(recrawl), now)
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO frontier (run_id, source_id, url, state, next_eligible_at, updated_at, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, s["id"], s.get("url"), PENDING, now, now, json.dumps(source_payload(s))) for s in sources]
+            )
+            self._conn.execute("COMMIT")
+        logger.info(f"Creato run {run_id} per il progetto {project_id} con {len(sources)} URL")
+        return run_id
+
+    def get_run(self, run_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM crawl_runs WHERE run_id = ?", (run_id,)).fetchone()
+        return dict(row) if row else None
+
+    def unfinished_runs(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM crawl_runs WHERE finished_at IS NULL ORDER BY created_at DESC"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def resume_run(self, run_id: str) -> int:
+        """Riporta in coda le URL rimaste in volo quando il processo è terminato"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE frontier SET state = ?, updated_at = ? WHERE run_id = ? AND state = ?",
+                (PENDING, time.time(), run_id, IN_FLIGHT)
+            )
+            self._conn.execute("UPDATE crawl_runs SET finished_at = NULL WHERE run_id = ?", (run_id,))
+        if cursor.rowcount:
+            logger.info(f"Run {run_id}: {cursor.rowcount} URL in volo rimesse in coda")
+        return cursor.rowcount
+
+    def claim(self, run_id: str, limit: int = 1000) -> List[Dict]:
+        """Prende fino a `limit` URL pronte e le segna in_flight"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                "SELECT source_id, payload FROM frontier "
+                "WHERE run_id = ? AND state = ? AND next_eligible_at <= ? "
+                "ORDER BY next_eligible_at LIMIT ?",
+                (run_id, PENDING, now, limit)
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE frontier SET state = ?, updated_at = ? WHERE run_id = ? AND source_id = ?",
+                [(IN_FLIGHT, now, run_id, row["source_id"]) for row in rows]
+            )
+            self._conn.execute("COMMIT")
+        return [json.loads(row["payload"]) for row in rows]
+
+    def mark_done(self, run_id: str, source_id: int):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE frontier SET state = ?, last_error = NULL, updated_at = ? WHERE run_id = ? AND source_id = ?",
+                (DONE, time.time(), run_id, source_id)
+            )
+
+    def mark_failed(self, run_id: str, source_id: int, error: Optional[str], retryable: bool = True,
+                    delay: Optional[float] = None) -> bool:
+        """
+        Registra un fallimento; ritorna True se la URL è stata rimessa in coda.
+        `delay` sostituisce il backoff esponenziale; per rinviare una URL non richiesta c'è defer().
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts FROM frontier WHERE run_id = ? AND source_id = ?", (run_id, source_id)
+            ).fetchone()
+            attempts = (row["attempts"] if row else 0) + 1
+            requeue = retryable and attempts < self.max_attempts
+            if delay is None:
+                delay = self.retry_backoff * (2 ** (attempts - 1))
+            next_eligible_at = now + delay if requeue else now
+            self._conn.execute(
+                "UPDATE frontier SET state = ?, attempts = ?, next_eligible_at = ?, last_error = ?, updated_at = ? "
+                "WHERE run_id = ? AND source_id = ?",
+                (PENDING if requeue else FAILED, attempts, next_eligible_at, error, now, run_id, source_id)
+            )
+        return requeue
+
+    def defer(self, run_id: str, source_id: int, delay: float, reason: Optional[str] = None):
+        """
+        Rimette in coda tra `delay` secondi una URL che non è stata richiesta (es. circuito
+        dell'host aperto): a differenza di mark_failed non consuma un tentativo
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE frontier SET state = ?, next_eligible_at = ?, last_error = ?, updated_at = ? "
+                "WHERE run_id = ? AND source_id = ?",
+                (PENDING, now + max(delay, 0.0), reason, now, run_id, source_id)
+            )
+
+    def next_eligible_in(self, run_id: str) -> Optional[float]:
+        """Secondi al prossimo tentativo in backoff, None se non resta nulla in coda"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_eligible_at) FROM frontier WHERE run_id = ? AND state = ?", (run_id, PENDING)
+            ).fetchone()
+        if row[0] is None:
+            return None
+        return max(row[0] - time.time(), 0.0)
+
+    def counts(self, run_id: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, COUNT(*) FROM frontier WHERE run_id = ? GROUP BY state", (run_id,)
+            ).fetchall()
+        counts = {PENDING: 0, IN_FLIGHT: 0, DONE: 0, FAILED: 0}
+        counts.update({state: count for state, count in rows})
+        return counts
+
+    def failures(self, run_id: str, limit: int = 20) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source_id, url, attempts, last_error FROM frontier WHERE run_id = ? AND state = ? LIMIT ?",
+                (run_id, FAILED, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def finish_run(self, run_id: str):
+        with self._lock:
+            self._conn.execute("UPDATE crawl_runs SET finished_at = ? WHERE run_id = ?", (time.time(), run_id))
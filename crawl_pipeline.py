@@ -0,0 +1,204 @@
+# crawl_pipeline.py
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+from utils import progress_tracker
+from config import config
+from improved_crawler import AdvancedCrawler, CrawlResult
+from crawl_frontier import CrawlFrontier
+from text_extractors import TextExtractor, get_extractor
+from crawl_telemetry import CrawlTelemetry
+from crawl_writer import WriteItem
+
+logger = logging.getLogger(__name__)
+
+# Segnale di fine per i thread delle fasi
+_STOP = object()
+
+# Estrattore e metriche del processo di parsing, creati una volta dall'initializer del pool
+_process_extractor: Optional[TextExtractor] = None
+_process_telemetry: Optional[CrawlTelemetry] = None
+
+def _init_parse_process(extractor_name: str):
+    global _process_extractor, _process_telemetry
+    _process_extractor = get_extractor(extractor_name)
+    _process_telemetry = CrawlTelemetry()
+
+def parse_page(html: str) -> Tuple[str, Dict]:
+    """
+    Estrazione e pulizia del testo, eseguita in un processo del pool (fuori dal GIL dei fetch).
+    Restituisce anche le metriche accumulate dal processo, da sommare a quelle del crawler.
+    """
+    start = time.perf_counter()
+    text = _process_extractor.extract(html)
+    _process_telemetry.observe("parse_seconds", time.perf_counter() - start)
+    return text, _process_telemetry.drain()
+
+class PipelineCrawler(AdvancedCrawler):
+    """
+    Crawler a fasi: thread di download (I/O), un pool di processi per parsing e pulizia
+    (CPU, su tutti i core) e la fase di scrittura a lotti (BatchWriter). Le fasi sono collegate
+    da code limitate: se parsing o salvataggio restano indietro i download si fermano,
+    così in memoria ci sono al massimo `queue_size` pagine in attesa.
+    Il pool di parsing è creato al primo blocco e riusato per tutto il crawl: close() lo chiude.
+    """
+
+    def __init__(self, fetch_workers: int = config.crawler.max_workers,
+                 parse_workers: int = config.crawler.parse_workers,
+                 queue_size: int = config.crawler.pipeline_queue_size,
+                 frontier: Optional[CrawlFrontier] = None):
+        super().__init__(max_workers=fetch_workers, frontier=frontier)
+        # Più processi di parsing che core aggiungono solo avvio e contesa
+        self.parse_workers = max(min(parse_workers, os.cpu_count() or 1), 1)
+        self.queue_size = max(queue_size, 1)
+        # Un lotto più grande della coda non si riempirebbe mai: si salverebbe solo allo scadere del timer
+        self.write_batch_size = max(min(config.crawler.write_batch_size, self.queue_size), 1)
+        self._parse_pool: Optional[ProcessPoolExecutor] = None
+        self._parse_pool_broken = False
+
+    def close(self):
+        self._shutdown_parse_pool()
+        super().close()
+
+    def parse_pool(self) -> ProcessPoolExecutor:
+        """Pool dei processi di parsing, condiviso dai blocchi della frontiera (ricreato se un processo è morto)"""
+        if self._parse_pool_broken:
+            logger.warning("Pool di parsing interrotto (processo terminato), lo ricreo")
+            self._shutdown_parse_pool()
+        if self._parse_pool is None:
+            # spawn: i processi non ereditano i thread e i lock del processo principale
+            self._parse_pool = ProcessPoolExecutor(
+                max_workers=self.parse_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_parse_process,
+                initargs=(self.extractor.name,)
+            )
+        return self._parse_pool
+
+    def _shutdown_parse_pool(self):
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=True, cancel_futures=True)
+            self._parse_pool = None
+        self._parse_pool_broken = False
+
+    def crawl_sources_parallel(self, sources: List[Dict]) -> List[CrawlResult]:
+        """Crawl a pipeline con lo stesso filtro e le stesse statistiche del crawler a thread"""
+        sources_to_process = [s for s in sources if not self.should_skip_source(s)]
+        total_to_process = len(sources_to_process)
+
+        logger.info(f"Fonti da processare: {total_to_process} su {len(sources)} totali")
+
+        if total_to_process == 0:
+            logger.info("Nessuna fonte da processare")
+            return []
+
+        logger.info(f"Pipeline: {self.concurrency.current_limit} download contemporanei "
+                    f"(massimo {self.concurrency.maximum}), {self.parse_workers} processi di parsing, "
+                    f"coda di {self.queue_size} pagine")
+
+        with progress_tracker(total_to_process, "Crawling fonti (pipeline)") as tracker:
+            return self._run_pipeline(sources_to_process, tracker)
+
+    def _run_pipeline(self, sources: List[Dict], tracker) -> List[CrawlResult]:
+        cached, ready_queue = self.plan_fetches(sources)
+
+        fetch_threads = self.concurrency.maximum
+        fetch_queue = queue.Queue(maxsize=fetch_threads)  # dispatcher -> download
+        done = queue.Queue()  # tutte le fasi -> thread principale
+        # Pagine scaricate e non ancora salvate: il download attende uno slot libero
+        parse_slots = threading.BoundedSemaphore(self.queue_size)
+
+        pool = self.parse_pool()
+
+        def on_written(item: WriteItem, saved: bool, error: Optional[str]):
+            parse_slots.release()
+            done.put(self.written_result(item, saved, error))
+
+        # Parsing -> writer: la coda del writer è limitata da parse_slots e ha posto per tutte le
+        # pagine in volo, così on_parsed (thread del pool) non si blocca in submit()
+        writer = self.create_writer(on_written, max_queue=self.queue_size + 1)
+
+        def dispatch():
+            # Prima le risposte della cache HTTP, poi le fonti nell'ordine in cui gli host diventano pronti
+            while cached:
+                fetch_queue.put(cached.popleft())
+            while ready_queue:
+                fetch_queue.put(ready_queue.pop())
+            for _ in range(fetch_threads):
+                fetch_queue.put(_STOP)
+
+        def on_parsed(source: Dict, validators: Dict, start_time: float, future: Future):
+            # Gira nel thread di gestione del pool: non deve bloccare
+            try:
+                cleaned_text, metrics = future.result()
+                self.telemetry.merge(metrics)
+                result = self.reject_text(source['id'], cleaned_text, start_time)
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    self._parse_pool_broken = True
+                logger.error(f"Errore nel parsing della fonte {source['id']}: {e}")
+                result = CrawlResult(source_id=source['id'], success=False, error=str(e),
+                                     processing_time=time.time() - start_time, reason="parse_error")
+            if result is None:
+                writer.submit(WriteItem(source['id'], cleaned_text, validators, start_time))
+            else:
+                parse_slots.release()
+                done.put(result)
+
+        def fetch_worker():
+            while True:
+                source = fetch_queue.get()
+                if source is _STOP:
+                    return
+                start_time = time.time()
+                try:
+                    etag, last_modified = self.conditional_validators(source)
+                    # Ci sono fetch_threads thread, ma scaricano insieme solo quanti ne consente il limite
+                    self.concurrency.acquire()
+                    try:
+                        fetch_result = self.scraper.fetch(source['url'], etag=etag, last_modified=last_modified,
+                                                          wait=False)
+                    finally:
+                        self.concurrency.release()
+                    outcome = self.triage_fetch(source, fetch_result, start_time)
+                    if isinstance(outcome, CrawlResult):
+                        done.put(outcome)
+                        continue
+                    parse_slots.acquire()  # Backpressure
+                    future = pool.submit(parse_page, fetch_result.content)
+                    future.add_done_callback(partial(on_parsed, source, outcome, start_time))
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        self._parse_pool_broken = True
+                    logger.error(f"Errore nello scraping della fonte {source['id']}: {e}")
+                    done.put(CrawlResult(source_id=source['id'], success=False, error=str(e),
+                                         processing_time=time.time() - start_time, reason="exception"))
+
+        writer.start()
+        threads = [threading.Thread(target=dispatch, name="crawl-dispatch", daemon=True)]
+        threads += [threading.Thread(target=fetch_worker, name=f"crawl-fetch-{i}", daemon=True)
+                    for i in range(fetch_threads)]
+        for thread in threads:
+            thread.start()
+
+        results = []
+        try:
+            while len(results) < len(sources):
+                result = done.get()
+                results.append(result)
+                self._record_result(result, tracker)
+                # Le fonti mancanti sono tutte nel writer: inutile attendere che il lotto si riempia
+                if len(results) + writer.pending >= len(sources):
+                    writer.flush()
+        finally:
+            writer.close()
+
+        return results
@@ -0,0 +1,373 @@
+# crawl_queue.py
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine, text
+
+from crawl_frontier import PENDING, IN_FLIGHT, DONE, FAILED, source_payload
+
+logger = logging.getLogger(__name__)
+
+# Schema della coda condivisa (PostgreSQL); applicato anche da improved_db_setup.py
+SCHEMA_STATEMENTS = (
+    "CREATE TABLE IF NOT EXISTS crawl_queue_runs ("
+    " run_id TEXT PRIMARY KEY,"
+    " project_id INTEGER NOT NULL,"
+    " scope TEXT,"
+    " recrawl BOOLEAN NOT NULL DEFAULT FALSE,"
+    " created_at TIMESTAMPTZ NOT NULL DEFAULT now(),"
+    " finished_at TIMESTAMPTZ)",
+    "CREATE TABLE IF NOT EXISTS crawl_queue ("
+    " run_id TEXT NOT NULL REFERENCES crawl_queue_runs (run_id) ON DELETE CASCADE,"
+    " source_id INTEGER NOT NULL,"
+    " seq INTEGER NOT NULL DEFAULT 0,"
+    " url TEXT,"
+    " state TEXT NOT NULL,"
+    " attempts INTEGER NOT NULL DEFAULT 0,"
+    " next_eligible_at TIMESTAMPTZ NOT NULL DEFAULT now(),"
+    " lease_owner TEXT,"
+    " lease_expires_at TIMESTAMPTZ,"
+    " last_error TEXT,"
+    " updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),"
+    " payload JSONB NOT NULL,"
+    " PRIMARY KEY (run_id, source_id))",
+    # colonne aggiunte dopo la prima versione dello schema
+    "ALTER TABLE crawl_queue_runs ADD COLUMN IF NOT EXISTS scope TEXT",
+    "ALTER TABLE crawl_queue ADD COLUMN IF NOT EXISTS seq INTEGER NOT NULL DEFAULT 0",
+    "DROP INDEX IF EXISTS idx_crawl_queue_claim",
+    "CREATE INDEX IF NOT EXISTS idx_crawl_queue_claim_order ON crawl_queue (run_id, state, next_eligible_at, seq)",
+    "CREATE INDEX IF NOT EXISTS idx_crawl_queue_runs_scope ON crawl_queue_runs (scope) WHERE finished_at IS NULL",
+    "CREATE INDEX IF NOT EXISTS idx_crawl_queue_lease ON crawl_queue (lease_owner) WHERE state = 'in_flight'",
+    "CREATE TABLE IF NOT EXISTS crawl_nodes ("
+    " node_id TEXT PRIMARY KEY,"
+    " hostname TEXT NOT NULL,"
+    " pid INTEGER NOT NULL,"
+    " run_id TEXT,"
+    " started_at TIMESTAMPTZ NOT NULL DEFAULT now(),"
+    " heartbeat_at TIMESTAMPTZ NOT NULL DEFAULT now(),"
+    " claimed INTEGER NOT NULL DEFAULT 0,"
+    " done INTEGER NOT NULL DEFAULT 0,"
+    " failed INTEGER NOT NULL DEFAULT 0,"
+    " requeued INTEGER NOT NULL DEFAULT 0,"
+    " reclaimed INTEGER NOT NULL DEFAULT 0)",
+)
+
+# Con URL in volo su altri nodi il run non è finito: si ricontrolla dopo al più questi secondi
+IN_FLIGHT_POLL_INTERVAL = 5.0
+
+class SharedCrawlQueue:
+    """
+    Coda di crawling condivisa su PostgreSQL, per più crawler (anche su macchine diverse) sullo
+    stesso progetto. Stessa interfaccia di CrawlFrontier: _crawl_with_frontier la usa senza modifiche.
+
+    - create_run() con uno `scope` (crawl dell'intero progetto) si unisce al run non finito con lo stesso
+      scope e la stessa modalità, se esiste: tutti i nodi lavorano sulla stessa coda. I run su un elenco
+      di fonti scelto dal chiamante ("all", re-crawl pianificato) non hanno scope e non vengono condivisi.
+    - claim() prende le URL con SELECT ... FOR UPDATE SKIP LOCKED, nell'ordine di inserimento (seq), e le
+      assegna al nodo con una lease: due nodi non ricevono mai la stessa URL.
+    - un thread di heartbeat rinnova le lease del nodo; se il nodo muore scadono e le URL
+      tornano prendibili dagli altri nodi (senza contare un tentativo).
+    - crawl_nodes tiene heartbeat e contatori di ogni nodo.
+
+    Tutti gli istanti sono calcolati dal database (now()), quindi gli orologi delle macchine non contano.
+    Il rate limit per host resta per nodo: N nodi sullo stesso host ne moltiplicano il ritmo.
+    """
+
+    def __init__(self, database_url: str, max_attempts: int = 3, retry_backoff: float = 30.0,
+                 lease_seconds: float = 300.0):
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.lease_seconds = lease_seconds
+        self.node_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.engine = create_engine(database_url, pool_pre_ping=True)
+        if self.engine.dialect.name != "postgresql":
+            raise ValueError(f"La coda condivisa richiede PostgreSQL (DATABASE_URL usa {self.engine.dialect.name})")
+        with self.engine.begin() as conn:
+            for statement in SCHEMA_STATEMENTS:
+                conn.execute(text(statement))
+            conn.execute(
+                text("INSERT INTO crawl_nodes (node_id, hostname, pid) VALUES (:node, :hostname, :pid)"),
+                {"node": self.node_id, "hostname": socket.gethostname(), "pid": os.getpid()}
+            )
+
+        self._lock = threading.Lock()
+        self._counters = {"claimed": 0, "done": 0, "failed": 0, "requeued": 0, "reclaimed": 0}
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="crawl-heartbeat", daemon=True)
+        self._heartbeat.start()
+        logger.info(f"Nodo di crawling {self.node_id} (lease {self.lease_seconds:.0f}s)")
+
+    def close(self):
+        self._stop.set()
+        self._heartbeat.join()
+        # Le URL ancora assegnate al nodo tornano subito disponibili
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("UPDATE crawl_queue SET state = :pending, lease_owner = NULL, lease_expires_at = NULL, "
+                     "updated_at = now() WHERE lease_owner = :node AND state = :in_flight"),
+                {"pending": PENDING, "in_flight": IN_FLIGHT, "node": self.node_id}
+            )
+        self._write_heartbeat()
+        self.engine.dispose()
+
+    # --- heartbeat ---
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self._write_heartbeat()
+            except Exception as e:
+                logger.warning(f"Heartbeat del nodo {self.node_id} non riuscito: {e}")
+
+    def _write_heartbeat(self):
+        """Rinnova le lease del nodo e pubblica i suoi contatori"""
+        with self._lock:
+            counters = dict(self._counters)
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("UPDATE crawl_queue SET lease_expires_at = now() + make_interval(secs => :lease) "
+                     "WHERE lease_owner = :node AND state = :in_flight"),
+                {"lease": self.lease_seconds, "node": self.node_id, "in_flight": IN_FLIGHT}
+            )
+            conn.execute(
+                text("UPDATE crawl_nodes SET heartbeat_at = now(), claimed = :claimed, done = :done, "
+                     "failed = :failed, requeued = :requeued, reclaimed = :reclaimed WHERE node_id = :node"),
+                {**counters, "node": self.node_id}
+            )
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    # --- run ---
+
+    def create_run(self, project_id: int, sources: List[Dict], recrawl: bool = False,
+                   scope: Optional[str] = None) -> str:
+        """
+        Crea il run del progetto. Con uno `scope` si unisce al run non finito con lo stesso scope e la
+        stessa modalità avviato da un altro nodo; senza scope il run è sempre nuovo.
+        """
+        with self.engine.begin() as conn:
+            # Due nodi che partono insieme non creano due run per lo stesso progetto
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('crawl_queue_runs'), :project)"),
+                         {"project": project_id})
+            existing = None
+            if scope is not None:
+                existing = conn.execute(
+                    text("SELECT run_id FROM crawl_queue_runs WHERE scope = :scope AND recrawl = :recrawl "
+                         "AND finished_at IS NULL ORDER BY created_at DESC LIMIT 1"),
+                    {"scope": scope, "recrawl": recrawl}
+                ).scalar()
+            if existing:
+                run_id = existing
+                logger.info(f"Il nodo {self.node_id} si unisce al run {run_id} del progetto {project_id}")
+            else:
+                run_id = uuid.uuid4().hex[:12]
+                conn.execute(
+                    text("INSERT INTO crawl_queue_runs (run_id, project_id, scope, recrawl) "
+                         "VALUES (:run, :project, :scope, :recrawl)"),
+                    {"run": run_id, "project": project_id, "scope": scope, "recrawl": recrawl}
+                )
+                if sources:
+                    conn.execute(
+                        text("INSERT INTO crawl_queue (run_id, source_id, seq, url, state, payload) "
+                             "VALUES (:run, :source, :seq, :url, :state, CAST(:payload AS JSONB)) ON CONFLICT DO NOTHING"),
+                        [{"run": run_id, "source": s["id"], "seq": seq, "url": s.get("url"), "state": PENDING,
+                          "payload": json.dumps(source_payload(s))} for seq, s in enumerate(sources)]
+                    )
+                logger.info(f"Creato run condiviso {run_id} per il progetto {project_id} con {len(sources)} URL")
+            conn.execute(text("UPDATE crawl_nodes SET run_id = :run WHERE node_id = :node"),
+                         {"run": run_id, "node": self.node_id})
+        return run_id
+
+    def get_run(self, run_id: str) -> Optional[Dict]:
+        with self.engine.connect() as conn:
+            row = conn.execute(text("SELECT * FROM crawl_queue_runs WHERE run_id = :run"), {"run": run_id}).first()
+        return dict(row._mapping) if row else None
+
+    def unfinished_runs(self) -> List[Dict]:
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text("SELECT * FROM crawl_queue_runs WHERE finished_at IS NULL ORDER BY created_at DESC")
+            ).all()
+        return [dict(row._mapping) for row in rows]
+
+    def resume_run(self, run_id: str) -> int:
+        """Riapre il run; le URL rimaste in volo su nodi terminati si riprendono alla scadenza della lease"""
+        with self.engine.begin() as conn:
+            conn.execute(text("UPDATE crawl_queue_runs SET finished_at = NULL WHERE run_id = :run"), {"run": run_id})
+            conn.execute(text("UPDATE crawl_nodes SET run_id = :run WHERE node_id = :node"),
+                         {"run": run_id, "node": self.node_id})
+            expired = conn.execute(
+                text("SELECT COUNT(*) FROM crawl_queue WHERE run_id = :run AND state = :in_flight "
+                     "AND lease_expires_at < now()"),
+                {"run": run_id, "in_flight": IN_FLIGHT}
+            ).scalar()
+        if expired:
+            logger.info(f"Run {run_id}: {expired} URL con lease scaduta verranno riprese")
+        return expired
+
+    # --- lavoro ---
+
+    def claim(self, run_id: str, limit: int = 1000) -> List[Dict]:
+        """Prende fino a `limit` URL pronte (o con lease scaduta) e le assegna al nodo"""
+        with self.engine.begin() as conn:
+            rows = conn.execute(
+                text(
+                    "WITH picked AS ("
+                    " SELECT run_id, source_id, state AS previous_state FROM crawl_queue"
+                    " WHERE run_id = :run AND ((state = :pending AND next_eligible_at <= now())"
+                    "  OR (state = :in_flight AND lease_expires_at < now()))"
+                    # a parità di istante (tutto il run è inserito con lo stesso now()) conta l'ordine
+                    # di inserimento, es. l'alternanza tra progetti di fair_interleave
+                    " ORDER BY next_eligible_at, seq LIMIT :limit"
+                    " FOR UPDATE SKIP LOCKED) "
+                    "UPDATE crawl_queue q SET state = :in_flight, lease_owner = :node,"
+                    " lease_expires_at = now() + make_interval(secs => :lease), updated_at = now() "
+                    "FROM picked WHERE q.run_id = picked.run_id AND q.source_id = picked.source_id "
+                    "RETURNING q.payload, q.next_eligible_at, q.seq, picked.previous_state"
+                ),
+                {"run": run_id, "pending": PENDING, "in_flight": IN_FLIGHT, "limit": limit,
+                 "node": self.node_id, "lease": self.lease_seconds}
+            ).all()
+        # RETURNING non garantisce l'ordine della CTE
+        rows.sort(key=lambda row: (row.next_eligible_at, row.seq))
+        reclaimed = sum(1 for row in rows if row.previous_state == IN_FLIGHT)
+        self._count("claimed", len(rows))
+        if reclaimed:
+            self._count("reclaimed", reclaimed)
+            logger.info(f"Riprese {reclaimed} URL con lease scaduta (nodo terminato o bloccato)")
+        # psycopg2 decodifica già JSONB; altri driver possono restituire la stringa
+        return [row.payload if isinstance(row.payload, dict) else json.loads(row.payload) for row in rows]
+
+    def mark_done(self, run_id: str, source_id: int):
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                text("UPDATE crawl_queue SET state = :done, last_error = NULL, lease_owner = NULL, "
+                     "lease_expires_at = NULL, updated_at = now() "
+                     "WHERE run_id = :run AND source_id = :source AND lease_owner = :node"),
+                {"done": DONE, "run": run_id, "source": source_id, "node": self.node_id}
+            )
+        if result.rowcount:
+            self._count("done")
+        else:
+            logger.warning(f"Fonte {source_id}: lease non più del nodo {self.node_id}, esito non registrato")
+
+    def mark_failed(self, run_id: str, source_id: int, error: Optional[str], retryable: bool = True,
+                    delay: Optional[float] = None) -> bool:
+        """
+        Registra un fallimento; ritorna True se la URL è stata rimessa in coda.
+        `delay` sostituisce il backoff esponenziale; per rinviare una URL non richiesta c'è defer().
+        """
+        with self.engine.begin() as conn:
+            attempts = conn.execute(
+                text("SELECT attempts FROM crawl_queue WHERE run_id = :run AND source_id = :source "
+                     "AND lease_owner = :node FOR UPDATE"),
+                {"run": run_id, "source": source_id, "node": self.node_id}
+            ).scalar()
+            if attempts is None:
+                logger.warning(f"Fonte {source_id}: lease non più del nodo {self.node_id}, esito non registrato")
+                return False
+            attempts += 1
+            requeue = retryable and attempts < self.max_attempts
+            if delay is None:
+                delay = self.retry_backoff * (2 ** (attempts - 1))
+            conn.execute(
+                text("UPDATE crawl_queue SET state = :state, attempts = :attempts, "
+                     "next_eligible_at = now() + make_interval(secs => :delay), last_error = :error, "
+                     "lease_owner = NULL, lease_expires_at = NULL, updated_at = now() "
+                     "WHERE run_id = :run AND source_id = :source"),
+                {"state": PENDING if requeue else FAILED, "attempts": attempts, "delay": delay if requeue else 0,
+                 "error": error, "run": run_id, "source": source_id}
+            )
+        self._count("requeued" if requeue else "failed")
+        return requeue
+
+    def defer(self, run_id: str, source_id: int, delay: float, reason: Optional[str] = None) -> bool:
+        """
+        Rimette in coda tra `delay` secondi una URL che non è stata richiesta (es. circuito
+        dell'host aperto) senza consumare un tentativo; False se la lease non è più del nodo
+        """
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                text("UPDATE crawl_queue SET state = :pending, next_eligible_at = now() + make_interval(secs => :delay), "
+                     "last_error = :error, lease_owner = NULL, lease_expires_at = NULL, updated_at = now() "
+                     "WHERE run_id = :run AND source_id = :source AND lease_owner = :node"),
+                {"pending": PENDING, "delay": max(delay, 0.0), "error": reason,
+                 "run": run_id, "source": source_id, "node": self.node_id}
+            )
+        if not result.rowcount:
+            logger.warning(f"Fonte {source_id}: lease non più del nodo {self.node_id}, rinvio non registrato")
+            return False
+        self._count("requeued")
+        return True
+
+    def next_eligible_in(self, run_id: str) -> Optional[float]:
+        """
+        Secondi al prossimo tentativo in coda; None se il run è esaurito. Le URL in volo su altri
+        nodi tengono aperto il run: se quel nodo muore, la sua lease scade e le URL vanno riprese.
+        """
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text("SELECT EXTRACT(EPOCH FROM MIN(next_eligible_at) FILTER (WHERE state = :pending) - now()),"
+                     " EXTRACT(EPOCH FROM MIN(lease_expires_at) FILTER (WHERE state = :in_flight) - now()) "
+                     "FROM crawl_queue WHERE run_id = :run AND state IN (:pending, :in_flight)"),
+                {"run": run_id, "pending": PENDING, "in_flight": IN_FLIGHT}
+            ).one()
+        pending_in, lease_in = row
+        waits = [float(pending_in)] if pending_in is not None else []
+        if lease_in is not None:
+            waits.append(min(float(lease_in), IN_FLIGHT_POLL_INTERVAL))
+        if not waits:
+            return None
+        return max(min(waits), 0.0)
+
+    def counts(self, run_id: str) -> Dict[str, int]:
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text("SELECT state, COUNT(*) FROM crawl_queue WHERE run_id = :run GROUP BY state"), {"run": run_id}
+            ).all()
+        counts = {PENDING: 0, IN_FLIGHT: 0, DONE: 0, FAILED: 0}
+        counts.update({state: count for state, count in rows})
+        return counts
+
+    def failures(self, run_id: str, limit: int = 20) -> List[Dict]:
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text("SELECT source_id, url, attempts, last_error FROM crawl_queue "
+                     "WHERE run_id = :run AND state = :failed LIMIT :limit"),
+                {"run": run_id, "failed": FAILED, "limit": limit}
+            ).all()
+        return [dict(row._mapping) for row in rows]
+
+    def node_stats(self, run_id: str) -> List[Dict]:
+        """Contatori e ultimo heartbeat di ogni nodo che ha lavorato sul run"""
+        self._write_heartbeat()
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text("SELECT node_id, hostname, claimed, done, failed, requeued, reclaimed, "
+                     "EXTRACT(EPOCH FROM heartbeat_at - started_at) AS active_seconds, "
+                     "EXTRACT(EPOCH FROM now() - heartbeat_at) AS heartbeat_age "
+                     "FROM crawl_nodes WHERE run_id = :run ORDER BY done DESC"),
+                {"run": run_id}
+            ).all()
+        return [dict(row._mapping) for row in rows]
+
+    def finish_run(self, run_id: str):
+        """Chiude il run solo se nessuna URL è più in coda o in volo (l'ultimo nodo lo chiude)"""
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("UPDATE crawl_queue_runs SET finished_at = now() WHERE run_id = :run AND NOT EXISTS ("
+                     "SELECT 1 FROM crawl_queue WHERE run_id = :run AND state IN (:pending, :in_flight))"),
+                {"run": run_id, "pending": PENDING, "in_flight": IN_FLIGHT}
+            )
+        for node in self.node_stats(run_id):
+            rate = node['done'] / max(float(node['active_seconds'] or 0), 1.0)
+            logger.info(f"Nodo {node['node_id']}: {node['done']} completate, {node['failed']} fallite, "
+                        f"{node['requeued']} ritentate, {node['reclaimed']} riprese da altri nodi "
+                        f"({rate:.1f} URL/s)")
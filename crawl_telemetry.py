@@ -0,0 +1,293 @@
+# crawl_telemetry.py
+import bisect
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from host_scheduler import host_of
+
+logger = logging.getLogger(__name__)
+
+# Limiti superiori dei bucket degli istogrammi (secondi), da 1ms a 60s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+class StatsCounter(dict):
+    """Dizionario di contatori con incremento atomico: i worker chiamano inc(), le letture restano stats['x']"""
+
+    def __init__(self, *keys: str):
+        super().__init__((key, 0) for key in keys)
+        self._lock = threading.Lock()
+
+    def inc(self, key: str, amount: int = 1):
+        with self._lock:
+            self[key] = self.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            for key in self:
+                self[key] = 0
+
+class Histogram:
+    """Istogramma a bucket fissi (come Prometheus): conteggi, somma e quantili stimati"""
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # l'ultimo è +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, data: Dict):
+        for i, count in enumerate(data["counts"]):
+            self.counts[i] += count
+        self.sum += data["sum"]
+        self.count += data["count"]
+
+    def quantile(self, q: float) -> float:
+        """Quantile per interpolazione lineare dentro il bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def to_dict(self) -> Dict:
+        return {"counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+class CrawlTelemetry:
+    """
+    Metriche di un crawl: contatori e istogrammi con etichette (es. host, status), thread-safe.
+    I processi di parsing accumulano in una loro istanza e inviano i delta con drain();
+    il processo principale li somma con merge(). Esporta JSON, formato Prometheus e un
+    riepilogo per host e per fase.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.started_at = time.time()
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def record_fetch(self, event):
+        """Osservatore di WebScraper: latenza, byte ed esito di ogni download, per host"""
+        host = host_of(event.url)
+        # Codice HTTP se la risposta è arrivata, altrimenti il tipo di errore (timeout, connection, ...)
+        status = str(event.status_code) if event.status_code else (event.error or "error")
+        self.inc("fetch_responses_total", host=host, status=status)
+        if event.error == "circuit_open":
+            return  # Nessuna richiesta inviata
+        self.observe("fetch_seconds", event.elapsed, host=host)
+        if event.size:
+            self.inc("fetch_bytes_total", event.size, host=host)
+        if event.error:
+            self.inc("fetch_errors_total", host=host, error=event.error)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started_at = time.time()
+
+    # --- scambio tra processi ---
+
+    def snapshot(self) -> Dict:
+        """Stato serializzabile (pickle/JSON): etichette come liste di coppie"""
+        with self._lock:
+            return {
+                "counters": {name: [[list(map(list, key)), value] for key, value in series.items()]
+                             for name, series in self._counters.items()},
+                "histograms": {name: [[list(map(list, key)), histogram.to_dict()] for key, histogram in series.items()]
+                               for name, series in self._histograms.items()},
+            }
+
+    def drain(self) -> Dict:
+        """Snapshot e azzeramento: il delta da inviare al processo principale"""
+        snapshot = self.snapshot()
+        self.reset()
+        return snapshot
+
+    def merge(self, snapshot: Dict):
+        with self._lock:
+            for name, entries in snapshot.get("counters", {}).items():
+                series = self._counters.setdefault(name, {})
+                for labels, value in entries:
+                    key = tuple(map(tuple, labels))
+                    series[key] = series.get(key, 0) + value
+            for name, entries in snapshot.get("histograms", {}).items():
+                series = self._histograms.setdefault(name, {})
+                for labels, data in entries:
+                    key = tuple(map(tuple, labels))
+                    histogram = series.get(key)
+                    if histogram is None:
+                        histogram = series[key] = Histogram()
+                    histogram.merge(data)
+
+    # --- letture ---
+
+    def counter(self, name: str, **labels) -> float:
+        """Somma delle serie del contatore che hanno le etichette indicate"""
+        wanted = set(_labels(labels))
+        with self._lock:
+            return sum(value for key, value in self._counters.get(name, {}).items() if wanted <= set(key))
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        """Istogramma aggregato sulle serie che hanno le etichette indicate"""
+        wanted = set(_labels(labels))
+        total = Histogram()
+        with self._lock:
+            for key, histogram in self._histograms.get(name, {}).items():
+                if wanted <= set(key):
+                    total.merge(histogram.to_dict())
+        return total
+
+    def label_values(self, name: str, label: str) -> List[str]:
+        with self._lock:
+            keys = list(self._counters.get(name, {})) + list(self._histograms.get(name, {}))
+        return sorted({value for key in keys for k, value in key if k == label})
+
+    def to_prometheus(self, prefix: str = "crawler_") -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {prefix}{name} counter")
+                for key, value in series.items():
+                    lines.append(f"{prefix}{name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                        cumulative += count
+                        lines.append(f"{prefix}{name}_bucket{_format_labels(key + (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{prefix}{name}_sum{_format_labels(key)} {histogram.sum:g}")
+                    lines.append(f"{prefix}{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict:
+        """Riepilogo per fase (fetch/parse/save) e per host: dove si ferma il throughput"""
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        stages = {}
+        for stage in ("fetch", "parse", "save"):
+            histogram = self.histogram(f"{stage}_seconds")
+            if histogram.count:
+                stages[stage] = _timing(histogram)
+
+        hosts = {}
+        for host in self.label_values("fetch_seconds", "host"):
+            histogram = self.histogram("fetch_seconds", host=host)
+            downloaded = self.counter("fetch_bytes_total", host=host)
+            hosts[host] = {
+                **_timing(histogram),
+                "bytes": int(downloaded),
+                "bytes_per_sec": downloaded / elapsed,
+                "errors": int(self.counter("fetch_errors_total", host=host)),
+                "status": {status: int(self.counter("fetch_responses_total", host=host, status=status))
+                           for status in self.label_values("fetch_responses_total", "status")
+                           if self.counter("fetch_responses_total", host=host, status=status)},
+            }
+
+        return {
+            "elapsed_seconds": elapsed,
+            "pages_per_sec": self.histogram("fetch_seconds").count / elapsed,
+            "bytes_per_sec": self.counter("fetch_bytes_total") / elapsed,
+            "stages": stages,
+            # Host più lenti per primi
+            "hosts": dict(sorted(hosts.items(), key=lambda item: item[1]["total_seconds"], reverse=True)),
+        }
+
+def _timing(histogram: Histogram) -> Dict:
+    return {
+        "count": histogram.count,
+        "total_seconds": histogram.sum,
+        "p50": histogram.quantile(0.5),
+        "p95": histogram.quantile(0.95),
+        "p99": histogram.quantile(0.99),
+    }
+
+def _format_labels(key: Labels) -> str:
+    if not key:
+        return ""
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for name, value in key)
+    return "{" + ",".join(escaped) + "}"
+
+def write_run_summary(path: str, summary: Dict) -> Optional[Path]:
+    """Scrive il riepilogo di un run come JSON (artefatto da confrontare tra un crawl e l'altro)"""
+    try:
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(json.dumps(summary, indent=2, ensure_ascii=False, default=str), encoding="utf-8")
+        return target
+    except OSError as e:
+        logger.error(f"Impossibile scrivere il riepilogo del crawl in {path}: {e}")
+        return None
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    telemetry: CrawlTelemetry = None
+
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body = json.dumps({"summary": self.telemetry.summary(), "metrics": self.telemetry.snapshot()},
+                              default=str).encode("utf-8")
+            content_type = "application/json"
+        elif self.path.startswith("/metrics"):
+            body = self.telemetry.to_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Metriche: {format % args}")
+
+def start_metrics_server(telemetry: CrawlTelemetry, port: int, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """Espone /metrics (Prometheus) e /metrics.json in un thread daemon"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"telemetry": telemetry})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        logger.warning(f"Endpoint delle metriche non avviato sulla porta {port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="crawl-metrics", daemon=True).start()
+    logger.info(f"Metriche del crawl su http://{host}:{port}/metrics e /metrics.json")
+    return server
@@ -0,0 +1,184 @@
+# crawl_writer.py
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Segnali per il thread di scrittura
+_STOP = object()
+_FLUSH = object()
+
+@dataclass
+class WriteItem:
+    """Testo estratto in attesa di salvataggio"""
+    source_id: int
+    content: str
+    metadata: Dict = field(default_factory=dict)  # validatori del download (etag, last_modified, ...)
+    start_time: float = 0.0
+
+class BatchWriter:
+    """
+    Fase di scrittura del crawler: i worker accodano i testi con submit() e un thread dedicato
+    li salva a lotti di `batch_size` o ogni `flush_interval` secondi, con una
+    sola chiamata a `save_batch` per lotto. `save_batch` restituisce {"updated": [...], "missing": [...]}
+    oppure None se il salvataggio è fallito: il lotto viene ritentato con backoff e dopo
+    `max_attempts` tentativi i suoi elementi finiscono nel file dead-letter (JSONL), da cui
+    read_dead_letter() li recupera. Per ogni elemento viene chiamato on_written(item, saved, error).
+    La coda contiene al massimo `max_queue` elementi: se il database rallenta, submit() attende
+    invece di accumulare in memoria i testi di tutto il crawl.
+    """
+
+    def __init__(self, save_batch: Callable[[List[WriteItem]], Optional[Dict]],
+                 on_written: Callable[[WriteItem, bool, Optional[str]], None],
+                 batch_size: int = 20, flush_interval: float = 2.0, max_attempts: int = 3,
+                 retry_delay: float = 1.0, dead_letter_path: Optional[str] = None, max_queue: int = 200):
+        self.save_batch = save_batch
+        self.on_written = on_written
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_delay = retry_delay
+        self.dead_letter_path = dead_letter_path
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max(max_queue, 1))
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        self.batches = 0
+        self.written = 0
+        self.dead_lettered = 0
+
+    @property
+    def pending(self) -> int:
+        """Elementi accodati e non ancora salvati (o scartati)"""
+        with self._lock:
+            return self._pending
+
+    def start(self) -> "BatchWriter":
+        self._thread = threading.Thread(target=self._run, name="crawl-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, item: WriteItem):
+        """Accoda un testo; con la coda piena attende che il thread di scrittura la svuoti"""
+        with self._lock:
+            self._pending += 1
+        self._queue.put(item)
+
+    def flush(self):
+        """Salva subito il lotto in corso (es. quando non arriveranno altri elementi a breve)"""
+        try:
+            self._queue.put_nowait(_FLUSH)
+        except queue.Full:
+            pass  # coda piena: il lotto in corso si riempie comunque
+
+    def close(self):
+        """Salva gli elementi rimasti e ferma il thread"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "BatchWriter":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self):
+        batch: List[WriteItem] = []
+        batch_started = time.monotonic()
+        while True:
+            timeout = max(batch_started + self.flush_interval - time.monotonic(), 0) if batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, WriteItem):
+                if not batch:
+                    batch_started = time.monotonic()
+                batch.append(item)
+
+            full = len(batch) >= self.batch_size
+            stale = batch and time.monotonic() - batch_started >= self.flush_interval
+            if batch and (full or stale or item is _FLUSH or item is _STOP):
+                self._write(batch)
+                batch = []
+            if item is _STOP:
+                return
+
+    def _write(self, batch: List[WriteItem]):
+        result, error = None, "salvataggio non riuscito"
+        for attempt in range(self.max_attempts):
+            try:
+                result = self.save_batch(batch)
+            except Exception as e:
+                result, error = None, str(e)
+            if result is not None:
+                break
+            if attempt < self.max_attempts - 1:
+                wait_time = self.retry_delay * (2 ** attempt)
+                logger.warning(f"Salvataggio di un lotto di {len(batch)} fonti fallito "
+                               f"(tentativo {attempt + 1}), riprovo tra {wait_time:.0f}s")
+                time.sleep(wait_time)
+        self.batches += 1
+
+        if result is None:
+            self._dead_letter(batch, error)
+            for item in batch:
+                self._done(item, False, f"Salvataggio fallito dopo {self.max_attempts} tentativi: {error}")
+            return
+
+        updated = set(result.get("updated") or [])
+        for item in batch:
+            saved = item.source_id in updated
+            self.written += saved
+            self._done(item, saved, None if saved else "Fonte non trovata nel database")
+
+    def _done(self, item: WriteItem, saved: bool, error: Optional[str]):
+        with self._lock:
+            self._pending -= 1
+        try:
+            self.on_written(item, saved, error)
+        except Exception as e:
+            logger.error(f"Errore nella notifica del salvataggio della fonte {item.source_id}: {e}")
+
+    def _dead_letter(self, batch: List[WriteItem], error: str):
+        self.dead_lettered += len(batch)
+        if not self.dead_letter_path:
+            logger.error(f"Lotto di {len(batch)} fonti perso: {error} (dead-letter disattivato)")
+            return
+        failed_at = datetime.datetime.utcnow().isoformat()
+        try:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for item in batch:
+                    f.write(json.dumps({"source_id": item.source_id, "content": item.content,
+                                        "metadata": item.metadata, "error": error, "failed_at": failed_at},
+                                       ensure_ascii=False, default=str) + "\n")
+            logger.error(f"Lotto di {len(batch)} fonti salvato in {self.dead_letter_path}: {error}")
+        except OSError as e:
+            logger.error(f"Impossibile scrivere il dead-letter {self.dead_letter_path}: {e}")
+
+def read_dead_letter(path: str) -> List[WriteItem]:
+    """Elementi del file dead-letter (righe illeggibili ignorate)"""
+    if not os.path.exists(path):
+        return []
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            try:
+                record = json.loads(line)
+                items.append(WriteItem(source_id=record["source_id"], content=record["content"],
+                                       metadata=record.get("metadata") or {}))
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Riga {line_number} del dead-letter ignorata: {e}")
+    return items
@@ -34,6 +34,20 @@ API_TIMEOUT=30
 # Numero massimo di retry per richieste API fallite
 API_MAX_RETRIES=3
 
+# Trasporto binario MessagePack verso l'API (richiede il pacchetto msgpack)
+API_USE_MSGPACK=true
+
+# Compressione zstd dei body grandi (richiede il pacchetto zstandard)
+API_COMPRESS_REQUESTS=true
+
+# Dimensione minima del body (bytes) oltre la quale comprimere
+API_COMPRESSION_MIN_BYTES=16384
+
+# Accesso ai dati di crawler, importazione ed estrazione entità: api (HTTP) oppure database
+# (SQLAlchemy diretto su DATABASE_URL, senza passare dall'API: per gli script sulla stessa
+# macchina del database). Con database la cache dell'API si aggiorna solo con CACHE_BACKEND=redis
+DATA_ACCESS_MODE=api
+
 # =================================================================
 # WEB SCRAPING CONFIGURATION
 # =================================================================
@@ -47,12 +61,37 @@ SCRAPING_RETRY_ATTEMPTS=3
 # Delay tra i retry di scraping (secondi)
 SCRAPING_RETRY_DELAY=2.0
 
-# Delay tra richieste per rate limiting (secondi)
+# Delay tra richieste allo stesso host per rate limiting (secondi)
 SCRAPING_RATE_LIMIT=2.0
 
+# Richieste consecutive concesse a un host prima di applicare il delay
+SCRAPING_HOST_BURST=1
+
+# Usa il Crawl-delay di robots.txt quando è più lento di SCRAPING_RATE_LIMIT
+SCRAPING_RESPECT_CRAWL_DELAY=true
+
 # Dimensione massima del contenuto da scaricare (bytes)
 SCRAPING_MAX_CONTENT_LENGTH=5000000
 
+# Circuit breaker per host: dopo N timeout/errori di connessione consecutivi le URL dell'host
+# falliscono subito (o tornano nella frontiera) finché una richiesta di prova, dopo il cooldown
+# in secondi (raddoppia a ogni prova fallita), non trova l'host di nuovo raggiungibile. 0 = disattivato
+SCRAPING_BREAKER_THRESHOLD=5
+SCRAPING_BREAKER_COOLDOWN=60.0
+
+# Redirect permanenti (301/308): la mappa URL vecchia -> nuova (SQLite) evita il redirect nei
+# crawl successivi e la URL salvata della fonte viene aggiornata col contenuto. Vuoto = disattivata
+SCRAPING_REDIRECT_MAP_PATH=redirects.db
+
+# Cache HTTP su disco (SQLite) per lo sviluppo e i run ripetuti: le risposte vengono salvate con
+# validatori e scadenza. refresh-if-stale = usa le risposte più giovani del TTL (ore) senza rete,
+# poi le rivalida con una richiesta condizionale; offline = solo replay, le URL non in cache
+# falliscono (cache_miss); refresh = riscarica sempre e aggiorna la cache; off = disattivata.
+# Con la cache attiva la storia del re-crawl (CRAWLER_SCHEDULE_PATH) non viene aggiornata
+SCRAPING_HTTP_CACHE_MODE=off
+SCRAPING_HTTP_CACHE_PATH=http_cache.db
+SCRAPING_HTTP_CACHE_TTL_HOURS=24
+
 # User-Agent per le richieste web
 SCRAPING_USER_AGENT=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36
 
@@ -86,12 +125,120 @@ ENTITY_CONFIDENCE_THRESHOLD=0.5
 # PARALLEL PROCESSING
 # =================================================================
 
-# Numero massimo di worker per il crawling parallelo
+# Worker per il crawling parallelo (con concorrenza adattiva è il valore di partenza)
 MAX_CRAWLER_WORKERS=3
 
 # Numero massimo di worker per l'elaborazione parallela
 MAX_PROCESSING_WORKERS=2
 
+# Motore di crawling: threads (ThreadPoolExecutor), async (asyncio + aiohttp) o pipeline
+# (thread di download + MAX_PROCESSING_WORKERS processi di parsing + writer a lotti)
+CRAWLER_ENGINE=threads
+
+# Motore async: richieste contemporanee totali e per singolo host
+CRAWLER_ASYNC_CONCURRENCY=500
+CRAWLER_ASYNC_PER_HOST=4
+
+# Re-crawl delle fonti già scaricate con richieste condizionali (ETag / Last-Modified):
+# le pagine invariate (304 o stesso hash) non vengono rianalizzate né salvate
+CRAWLER_RECRAWL=false
+
+# Estrazione del testo dall'HTML: bs4, lxml, selectolax (pip install selectolax), stream
+# (parser a eventi senza DOM: memoria proporzionale al testo, utile per pagine di molti MB)
+# o auto = il più veloce installato (confronto: python benchmark_extractors.py)
+CRAWLER_EXTRACTOR=auto
+
+# Frontiera persistente (SQLite) dei run di crawling: stato di ogni URL, ripresa con
+# "python improved_crawler.py --resume RUN_ID". Lasciare vuoto per disattivarla
+CRAWLER_FRONTIER_PATH=crawl_frontier.db
+CRAWLER_FRONTIER_BATCH_SIZE=1000
+
+# Crawling distribuito: con CRAWLER_FRONTIER_BACKEND=postgres la frontiera è la tabella
+# crawl_queue di DATABASE_URL e più processi/macchine sullo stesso progetto si dividono le URL
+# (SELECT ... FOR UPDATE SKIP LOCKED). Ogni URL assegnata a un nodo ha una lease rinnovata
+# dall'heartbeat: se il nodo muore, dopo CRAWLER_LEASE_SECONDS le sue URL passano agli altri.
+# Con più nodi conviene un CRAWLER_FRONTIER_BATCH_SIZE piccolo (es. 100) per bilanciare la coda
+CRAWLER_FRONTIER_BACKEND=sqlite
+CRAWLER_LEASE_SECONDS=300
+
+# Re-crawl pianificato: ogni download viene registrato in CRAWLER_SCHEDULE_PATH (SQLite) e
+# da hash del contenuto e risposte 304 si stima quanto spesso cambia ogni fonte.
+# "python improved_crawler.py --refresh" (es. da cron ogni ora) riscarica solo le fonti scadute,
+# le più probabilmente cambiate per prime, entro CRAWLER_REFRESH_DAILY_BUDGET download al giorno.
+# Intervalli in ore: minimo, massimo e iniziale per le fonti senza storia. Vuoto = disattivato
+CRAWLER_SCHEDULE_PATH=crawl_schedule.db
+CRAWLER_REFRESH_DAILY_BUDGET=5000
+CRAWLER_REFRESH_MIN_HOURS=1
+CRAWLER_REFRESH_MAX_HOURS=720
+CRAWLER_REFRESH_INITIAL_HOURS=24
+
+# Crawl di tutti i progetti ("all"): i download si alternano tra i progetti in proporzione
+# ai pesi ("ID:peso,ID:peso", default 1), così i progetti piccoli non aspettano quelli grandi.
+# Budget = fonti al più per progetto in un run (0 = nessun limite; "ID:fonti" per progetto):
+# le fonti oltre il budget restano per il run successivo
+CRAWLER_PROJECT_WEIGHTS=
+CRAWLER_PROJECT_BUDGET=0
+CRAWLER_PROJECT_BUDGETS=
+
+# Tentativi per URL e backoff tra i tentativi (secondi, raddoppia a ogni fallimento)
+CRAWLER_MAX_ATTEMPTS=3
+CRAWLER_RETRY_BACKOFF=30.0
+
+# Motore pipeline: pagine scaricate in attesa di parsing/salvataggio (oltre, i download si fermano)
+CRAWLER_PIPELINE_QUEUE_SIZE=64
+
+# Fase di scrittura (tutti i motori): i testi vengono salvati a lotti di N fonti o
+# ogni N secondi con una sola richiesta; un lotto che fallisce dopo N tentativi finisce nel
+# file dead-letter (ripubblicabile con "python improved_crawler.py --replay-dead-letter").
+# Con CRAWLER_WRITE_QUEUE_SIZE testi in attesa i worker si fermano finché il database non recupera
+CRAWLER_WRITE_BATCH_SIZE=20
+CRAWLER_WRITE_FLUSH_INTERVAL=2.0
+CRAWLER_WRITE_MAX_ATTEMPTS=3
+CRAWLER_WRITE_QUEUE_SIZE=200
+CRAWLER_DEAD_LETTER_PATH=crawl_dead_letter.jsonl
+
+# Concorrenza adattiva (AIMD): i download contemporanei crescono finché latenza p95 ed errori
+# restano sani e si dimezzano su 429/5xx/timeout; anche il rate del singolo host rallenta e
+# poi risale. CRAWLER_LATENCY_TARGET = p95 massimo in secondi (0 = doppio del migliore osservato)
+CRAWLER_ADAPTIVE_CONCURRENCY=true
+CRAWLER_MIN_CONCURRENCY=1
+CRAWLER_MAX_CONCURRENCY=16
+CRAWLER_LATENCY_TARGET=0
+
+# Telemetria del crawl: metriche live su http://127.0.0.1:PORTA/metrics (Prometheus) e
+# /metrics.json (0 = disattivato) e un riepilogo JSON per run (host e fasi più lenti)
+CRAWLER_METRICS_PORT=0
+CRAWLER_REPORT_DIR=crawl_reports
+
+# =================================================================
+# CANCELLAZIONE PROGETTI
+# =================================================================
+
+# Oltre questo numero di fonti la cancellazione avviene in background
+PROJECT_DELETE_BACKGROUND_THRESHOLD=1000
+
+# Fonti eliminate per ogni batch/transazione
+PROJECT_DELETE_BATCH_SIZE=1000
+
+# Pausa tra i batch di cancellazione (secondi)
+PROJECT_DELETE_BATCH_PAUSE=0.05
+
+# =================================================================
+# QUASI-DUPLICATI
+# =================================================================
+
+# Distanza di Hamming massima tra le firme SimHash (64 bit) di due pagine quasi-duplicate;
+# le copie vengono marcate (duplicate_of) ed escluse da estrazione entità e ricerca
+NEAR_DUPLICATE_MAX_DISTANCE=6
+
+# Parole minime del contenuto perché la firma venga calcolata e confrontata
+NEAR_DUPLICATE_MIN_WORDS=30
+
+# Raggio della ricerca multi-probe sulle 4 bande da 16 bit dell'indice: il valore predefinito
+# (1 con distanza 6) trova tutte le copie entro NEAR_DUPLICATE_MAX_DISTANCE; con 0 le sonde
+# scendono da 68 a 4 per fonte ma sono garantite solo le copie entro 3 bit
+# NEAR_DUPLICATE_PROBE_RADIUS=1
+
 # =================================================================
 # SYSTEM MAINTENANCE
 # =================================================================
@@ -105,6 +252,23 @@ DISK_WARNING_THRESHOLD=80
 # Soglia di utilizzo disco per errore critico (percentuale)
 DISK_CRITICAL_THRESHOLD=90
 
+# =================================================================
+# CACHE
+# =================================================================
+
+# Backend della cache delle letture (memory, redis)
+# Con più worker uvicorn usare redis (versione 7 o successiva) per condividere le hit
+CACHE_BACKEND=memory
+
+# Durata predefinita delle voci in cache (secondi)
+CACHE_DEFAULT_TTL=60
+
+# Numero massimo di voci nella cache in memoria (eviction LRU)
+CACHE_MAX_ENTRIES=1024
+
+# Prefisso delle chiavi su Redis
+CACHE_KEY_PREFIX=airp
+
 # =================================================================
 # EXTERNAL SERVICES (opzionali)
 # =================================================================
@@ -0,0 +1,405 @@
+# host_scheduler.py
+import heapq
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+logger = logging.getLogger(__name__)
+
+# Back-off adattivo per host: su 429/5xx/timeout il rate dimezza (al più una volta per intervallo),
+# poi ogni download riuscito lo fa risalire di un ventesimo del rate che ha causato il sovraccarico
+RECOVERY_STEPS = 20
+MIN_HOST_RATE = 1 / 60
+RATE_SMOOTHING = 0.2  # peso dell'ultimo intervallo nella media mobile del rate osservato
+# Letture di robots.txt in background: un host lento o irraggiungibile non ferma il dispatcher
+ROBOTS_LOADERS = 8
+
+def host_of(url: str) -> str:
+    return (urlsplit(url).hostname or "").lower()
+
+@dataclass
+class HostBucket:
+    """Token bucket di un host: `rate` richieste al secondo, fino a `burst` consecutive"""
+    rate: float
+    burst: float
+    tokens: float
+    updated_at: float
+    crawl_delay: Optional[float] = None
+    base_rate: float = 0.0  # rate configurato (intervallo o Crawl-delay), a cui torna dopo il back-off
+    backoffs: int = 0
+    backed_off_at: float = 0.0
+    backoff_from: float = 0.0  # rate al momento dell'ultimo sovraccarico
+    observed_interval: Optional[float] = None  # media mobile dell'intervallo tra richieste
+    last_request_at: Optional[float] = None
+
+    def observe_request(self, now: float):
+        if self.last_request_at is not None:
+            interval = now - self.last_request_at
+            if self.observed_interval is None:
+                self.observed_interval = interval
+            else:
+                self.observed_interval += RATE_SMOOTHING * (interval - self.observed_interval)
+        self.last_request_at = now
+
+    def current_rate(self) -> float:
+        """Rate imposto o, per un host senza limite, quello effettivamente osservato"""
+        if self.rate != float("inf"):
+            return self.rate
+        return 1 / max(self.observed_interval or 1.0, 1e-3)
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def ready_at(self, now: float) -> float:
+        self.refill(now)
+        if self.tokens >= 1:
+            return now
+        return now + (1 - self.tokens) / self.rate
+
+class HostScheduler:
+    """
+    Rate limiting per dominio: ogni host ha il suo token bucket, quindi le richieste
+    verso host diversi non si attendono a vicenda. Il Crawl-delay di robots.txt,
+    se più lento, sostituisce l'intervallo predefinito. Thread-safe.
+    """
+
+    def __init__(self, min_interval: float, burst: int = 1, user_agent: str = "*",
+                 robots_fetcher: Optional[Callable[[str], Optional[str]]] = None, adaptive: bool = False):
+        self.min_interval = min_interval
+        self.burst = max(burst, 1)
+        self.user_agent = user_agent
+        self.robots_fetcher = robots_fetcher
+        self.adaptive = adaptive
+        self._buckets: Dict[str, HostBucket] = {}
+        self._robots_loaded: Dict[str, threading.Event] = {}
+        self._robots_done = threading.Condition()
+        self._robots_pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _bucket(self, host: str, now: float) -> HostBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            rate = 1 / self.min_interval if self.min_interval > 0 else float("inf")
+            bucket = HostBucket(rate=rate, burst=self.burst, tokens=self.burst, updated_at=now, base_rate=rate)
+            self._buckets[host] = bucket
+        return bucket
+
+    def ready_at(self, url_or_host: str) -> float:
+        """Istante (time.monotonic) in cui l'host potrà ricevere la prossima richiesta"""
+        host = host_of(url_or_host) if "/" in url_or_host else url_or_host
+        now = time.monotonic()
+        with self._lock:
+            return self._bucket(host, now).ready_at(now)
+
+    def reserve(self, url: str) -> float:
+        """Prenota il prossimo slot per l'host della URL e ritorna i secondi da attendere"""
+        host = host_of(url)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(host, now)
+            bucket.observe_request(now)
+            if bucket.rate == float("inf"):
+                return 0.0
+            wait = bucket.ready_at(now) - now
+            bucket.tokens -= 1
+            return max(wait, 0.0)
+
+    def wait(self, url: str) -> float:
+        delay = self.reserve(url)
+        if delay > 0:
+            logger.debug(f"Rate limiting {host_of(url)}: attendo {delay:.2f}s")
+            time.sleep(delay)
+        return delay
+
+    async def wait_async(self, url: str) -> float:
+        delay = self.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def set_crawl_delay(self, host: str, crawl_delay: float):
+        """Applica un Crawl-delay: l'host non riceve più di una richiesta ogni `crawl_delay` secondi"""
+        if crawl_delay <= self.min_interval:
+            return
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(host, now)
+            bucket.refill(now)
+            bucket.crawl_delay = crawl_delay
+            bucket.rate = bucket.base_rate = 1 / crawl_delay
+            bucket.burst = 1
+            bucket.tokens = min(bucket.tokens, 1)
+        logger.info(f"Crawl-delay {crawl_delay}s per {host}")
+
+    def record_outcome(self, url: str, overloaded: bool):
+        """AIMD sul rate dell'host: dimezza su sovraccarico, risale a passi fino al rate configurato"""
+        if not self.adaptive:
+            return
+        host = host_of(url)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(host, now)
+            bucket.refill(now)
+            if overloaded:
+                # Le richieste già in volo falliscono insieme: un solo dimezzamento per intervallo
+                if bucket.rate != float("inf") and now - bucket.backed_off_at < 1 / bucket.rate:
+                    return
+                bucket.backoff_from = bucket.current_rate()
+                bucket.rate = max(bucket.backoff_from / 2, MIN_HOST_RATE)
+                bucket.burst = 1
+                bucket.tokens = min(bucket.tokens, 1)
+                bucket.backoffs += 1
+                bucket.backed_off_at = now
+                logger.info(f"Back-off per {host}: {bucket.rate:.2f} richieste/s")
+            elif bucket.rate < bucket.base_rate:
+                bucket.rate += max(bucket.backoff_from / RECOVERY_STEPS, MIN_HOST_RATE)
+                if bucket.rate >= min(bucket.base_rate, bucket.backoff_from):
+                    bucket.rate = bucket.base_rate
+                    bucket.burst = 1 if bucket.crawl_delay else self.burst
+                    logger.info(f"Fine back-off per {host}")
+
+    def ensure_robots(self, url: str):
+        """
+        Legge (una volta per host) il Crawl-delay da robots.txt. Va chiamato prima di prenotare
+        uno slot: chi arriva mentre robots.txt è in lettura (anche in background) attende il
+        Crawl-delay invece di partire con l'intervallo predefinito.
+        """
+        if self.robots_fetcher is None:
+            return
+        loaded, loader = self._claim_robots(url)
+        if loader:
+            self._load_robots(url, loaded)
+        else:
+            loaded.wait()
+
+    def robots_ready(self, url: str) -> bool:
+        """
+        True se il Crawl-delay dell'host è già noto; altrimenti avvia (una volta per host) la
+        lettura di robots.txt in background e ritorna False senza attendere
+        """
+        if self.robots_fetcher is None:
+            return True
+        loaded, loader = self._claim_robots(url)
+        if loader:
+            with self._lock:
+                if self._robots_pool is None:
+                    self._robots_pool = ThreadPoolExecutor(max_workers=ROBOTS_LOADERS,
+                                                           thread_name_prefix="robots")
+            self._robots_pool.submit(self._load_robots, url, loaded)
+        return loaded.is_set()
+
+    def _claim_robots(self, url: str) -> Tuple[threading.Event, bool]:
+        """Evento di fine lettura di robots.txt dell'host e se tocca al chiamante leggerlo"""
+        host = host_of(url)
+        with self._lock:
+            loaded = self._robots_loaded.get(host)
+            if loaded is not None:
+                return loaded, False
+            loaded = self._robots_loaded[host] = threading.Event()
+            return loaded, True
+
+    def _load_robots(self, url: str, loaded: threading.Event):
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        try:
+            robots_txt = self.robots_fetcher(f"{parts.scheme}://{parts.netloc}/robots.txt")
+            if not robots_txt:
+                return
+            parser = RobotFileParser()
+            parser.parse(robots_txt.splitlines())
+            crawl_delay = parser.crawl_delay(self.user_agent) or parser.crawl_delay("*")
+            if crawl_delay:
+                self.set_crawl_delay(host, float(crawl_delay))
+        except Exception as e:
+            logger.debug(f"robots.txt di {host} non letto: {e}")
+        finally:
+            loaded.set()
+            with self._robots_done:
+                self._robots_done.notify_all()
+
+    def wait_robots(self, hosts: List[str], timeout: float = 1.0) -> bool:
+        """Attende (al più `timeout` secondi) che robots.txt di almeno uno degli host sia letto"""
+        def any_loaded():
+            return any(self._robots_loaded[host].is_set() for host in hosts if host in self._robots_loaded)
+        with self._robots_done:
+            return self._robots_done.wait_for(any_loaded, timeout=timeout)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                host: {"rate": bucket.rate, "crawl_delay": bucket.crawl_delay or 0.0,
+                       "backoffs": bucket.backoffs, "throttled": bucket.rate < bucket.base_rate}
+                for host, bucket in self._buckets.items()
+            }
+
+class HostReadyQueue:
+    """
+    Coda di elementi raggruppati per host: pop() restituisce il prossimo elemento
+    dell'host che sarà pronto per primo e ne prenota lo slot nello scheduler.
+    Il throughput cresce così con il numero di host distinti.
+    """
+
+    def __init__(self, scheduler: HostScheduler):
+        self.scheduler = scheduler
+        self._queues: Dict[str, Deque[Tuple[str, Any]]] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._counter = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, url: str, item: Any):
+        host = host_of(url)
+        queue = self._queues.get(host)
+        if queue is None:
+            queue = self._queues[host] = deque()
+            self._push_host(host)
+            # robots.txt dell'host nuovo si legge mentre partono gli altri download
+            self.scheduler.robots_ready(url)
+        queue.append((url, item))
+        self._size += 1
+
+    def _push_host(self, host: str):
+        self._counter += 1
+        heapq.heappush(self._heap, (self.scheduler.ready_at(host), self._counter, host))
+
+    def next_ready_at(self) -> float:
+        """Istante (monotonic) in cui il primo host in coda sarà pronto"""
+        return self.scheduler.ready_at(self._heap[0][2])
+
+    def pop(self) -> Any:
+        """Attende che un host sia pronto e restituisce il suo prossimo elemento"""
+        # Host con robots.txt ancora in lettura: tornano in coda, passano gli altri
+        loading: List[Tuple[float, int, str]] = []
+        while True:
+            if not self._heap:
+                self.scheduler.wait_robots([host for _, _, host in loading])
+                for entry in loading:
+                    heapq.heappush(self._heap, entry)
+                loading = []
+            entry = heapq.heappop(self._heap)
+            ready_at, _, host = entry
+            if not self.scheduler.robots_ready(self._queues[host][0][0]):
+                loading.append(entry)
+                continue
+            # Il tempo in heap può essere vecchio (es. Crawl-delay appena applicato): ricontrolla
+            current = self.scheduler.ready_at(host)
+            delay = current - time.monotonic()
+            if delay > 0 and current > ready_at and self._heap and current > self._heap[0][0]:
+                self._counter += 1
+                heapq.heappush(self._heap, (current, self._counter, host))
+                continue
+            if delay > 0:
+                time.sleep(delay)
+            break
+
+        for entry in loading:
+            heapq.heappush(self._heap, entry)
+        queue = self._queues[host]
+        url, item = queue.popleft()
+        self._size -= 1
+        self.scheduler.reserve(url)
+        if queue:
+            self._push_host(host)
+        else:
+            del self._queues[host]
+        return item
+
+def interleave_by_host(items: List[Dict], url_key: str = "url") -> List[Dict]:
+    """Ordina gli elementi a turno tra gli host (round robin)"""
+    queues: Dict[str, Deque[Dict]] = {}
+    for item in items:
+        queues.setdefault(host_of(item.get(url_key) or ""), deque()).append(item)
+    ordered = []
+    while queues:
+        for host in list(queues):
+            ordered.append(queues[host].popleft())
+            if not queues[host]:
+                del queues[host]
+    return ordered
+
+class FairReadyQueue:
+    """
+    Weighted fair queuing tra gruppi di elementi (i progetti, dal campo `key`), ciascuno con la
+    sua HostReadyQueue. Ogni gruppo ha un tempo virtuale che avanza di 1/peso per elemento
+    servito; pop() sceglie il gruppo con il tempo virtuale di fine più basso tra quelli con un
+    host già pronto (o, se nessuno lo è, quello pronto per primo). Un progetto piccolo riceve
+    così la sua quota di download anche mentre un progetto grande ha migliaia di fonti in coda.
+    Con un solo gruppo si comporta come HostReadyQueue.
+    """
+
+    def __init__(self, scheduler: HostScheduler, weights: Optional[Dict[Any, float]] = None,
+                 key: str = "project_id"):
+        self.scheduler = scheduler
+        self.weights = weights or {}
+        self.key = key
+        self._groups: Dict[Any, HostReadyQueue] = {}
+        self._virtual: Dict[Any, float] = {}
+        self._clock = 0.0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def weight(self, group: Any) -> float:
+        return max(self.weights.get(group, 1.0), 1e-6)
+
+    def push(self, url: str, item: Dict):
+        group = item.get(self.key)
+        queue = self._groups.get(group)
+        if queue is None:
+            queue = self._groups[group] = HostReadyQueue(self.scheduler)
+            # Un gruppo che (ri)entra non accumula credito per il tempo in cui era vuoto
+            self._virtual[group] = max(self._virtual.get(group, 0.0), self._clock)
+        queue.push(url, item)
+        self._size += 1
+
+    def pop(self) -> Any:
+        """Prossimo elemento del gruppo a cui spetta il turno (attende se nessun host è pronto)"""
+        now = time.monotonic()
+        by_finish = sorted(self._groups, key=lambda group: self._virtual[group] + 1.0 / self.weight(group))
+        group = next((g for g in by_finish if self._groups[g].next_ready_at() <= now), None)
+        if group is None:
+            group = min(by_finish, key=lambda g: self._groups[g].next_ready_at())
+
+        queue = self._groups[group]
+        item = queue.pop()
+        self._size -= 1
+        self._clock = self._virtual[group]
+        self._virtual[group] += 1.0 / self.weight(group)
+        if not queue:
+            del self._groups[group]
+        return item
+
+def fair_interleave(items: List[Dict], weights: Optional[Dict[Any, float]] = None,
+                    key: str = "project_id") -> List[Dict]:
+    """
+    Ordina gli elementi alternando i gruppi (campo `key`) in proporzione ai pesi, mantenendo
+    l'ordine interno di ogni gruppo: la versione statica di FairReadyQueue, per le code che
+    consumano una lista (blocchi della frontiera, motore async)
+    """
+    weights = weights or {}
+    queues: Dict[Any, Deque[Dict]] = {}
+    for item in items:
+        queues.setdefault(item.get(key), deque()).append(item)
+    if len(queues) < 2:
+        return list(items)
+    heap = [(1.0 / max(weights.get(group, 1.0), 1e-6), index, group) for index, group in enumerate(queues)]
+    heapq.heapify(heap)
+    ordered = []
+    while heap:
+        finish, index, group = heapq.heappop(heap)
+        queue = queues[group]
+        ordered.append(queue.popleft())
+        if queue:
+            heapq.heappush(heap, (finish + 1.0 / max(weights.get(group, 1.0), 1e-6), index, group))
+    return ordered
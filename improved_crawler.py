@@ -1,13 +1,28 @@
 # improved_run_crawler.py
+import os
+import atexit
 import sys
+import queue
+import argparse
 import logging
 import time
-from typing import List, Dict, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import datetime
+import dataclasses
+from collections import Counter, deque
+from typing import List, Dict, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from bs4 import BeautifulSoup
-from utils import api_client, web_scraper, clean_text, progress_tracker, retry_on_failure
+from utils import (web_scraper, content_hash, canonicalize_url, progress_tracker, retry_on_failure, create_http_cache,
+                   FetchResult, HTTP_CACHE_MODES)
 from config import config
+from host_scheduler import FairReadyQueue, fair_interleave
+from crawl_frontier import CrawlFrontier
+from text_extractors import get_extractor
+from crawl_concurrency import create_controller
+from crawl_telemetry import CrawlTelemetry, StatsCounter, start_metrics_server, write_run_summary
+from crawl_writer import BatchWriter, WriteItem, read_dead_letter
+from recrawl_scheduler import RecrawlScheduler, CHANGED, UNCHANGED, NOT_MODIFIED, FAILED
+from repository import get_repository
 
 logger = logging.getLogger(__name__)
 
@@ -19,27 +34,82 @@ class CrawlResult:
     content_length: int = 0
     error: Optional[str] = None
     processing_time: float = 0.0
+    unchanged: bool = False
+    not_modified: bool = False  # invariata per risposta 304 (e non per hash uguale)
+    content_hash: Optional[str] = None  # hash della pagina scaricata, per la storia del re-crawl
+    retryable: bool = True  # False per errori che un nuovo tentativo non risolve
+    reason: Optional[str] = None  # categoria del fallimento (timeout, connection, http_4xx, too_short, ...)
+    retry_after: Optional[float] = None  # circuito dell'host aperto: riprovare tra N secondi
+
+# Fallimenti del download che un nuovo tentativo non risolve
+PERMANENT_FETCH_ERRORS = frozenset(("non_text", "too_large", "http_4xx", "cache_miss"))
+
+# Project id dei run che coprono più progetti insieme (crawl_projects)
+ALL_PROJECTS = 0
+
+def parse_project_map(value: str) -> Dict[int, float]:
+    """"ID:valore,ID:valore" (es. CRAWLER_PROJECT_WEIGHTS) come dict; le voci non valide sono ignorate"""
+    mapping = {}
+    for entry in (value or "").split(","):
+        project_id, _, amount = entry.partition(":")
+        try:
+            mapping[int(project_id)] = float(amount)
+        except ValueError:
+            if entry.strip():
+                logger.warning(f"Voce '{entry.strip()}' ignorata (formato atteso ID:valore)")
+    return mapping
 
 class AdvancedCrawler:
     """Crawler avanzato con supporto per crawling parallelo e gestione intelligente degli errori"""
     
-    def __init__(self, max_workers: int = 3):
-        self.api = api_client
+    def __init__(self, max_workers: int = config.crawler.max_workers, recrawl: bool = config.crawler.recrawl,
+                 frontier: Optional[CrawlFrontier] = None):
+        # API HTTP o database diretto (DATA_ACCESS_MODE)
+        self.repo = get_repository()
         self.scraper = web_scraper
         self.max_workers = max_workers
-        self.stats = {
-            'processed': 0,
-            'successful': 0,
-            'failed': 0,
-            'skipped': 0,
-            'total_content_length': 0
-        }
+        # Re-crawl: riscarica anche le fonti con contenuto, con richieste condizionali
+        self.recrawl = recrawl
+        # Frontiera persistente: checkpoint di ogni risultato e ripresa per run id
+        self.frontier = frontier
+        self.run_id: Optional[str] = None
+        # Backend di estrazione del testo (CRAWLER_EXTRACTOR)
+        self.extractor = get_extractor()
+        # Download contemporanei: partono da max_workers e si adattano a latenza ed errori
+        self.concurrency = create_controller(max_workers)
+        # Contatori aggiornati dai worker con stats.inc() (thread-safe)
+        self.stats = StatsCounter(
+            'processed', 'successful', 'failed', 'skipped', 'unchanged', 'retried', 'deferred', 'duplicates',
+            'near_duplicates', 'total_content_length'
+        )
+        self.failure_reasons: Counter = Counter()
+        # Metriche per host e per fase (download, parsing, salvataggio)
+        self.telemetry = CrawlTelemetry()
+        self._metrics_server = None
+        # Fase di scrittura a lotti, attiva durante il crawl parallelo (None = salvataggio diretto)
+        self.writer: Optional[BatchWriter] = None
+        self.write_batch_size = config.crawler.write_batch_size
+        # Storia dei download e scadenze del re-crawl (assegnato da create_crawler)
+        self.scheduler: Optional[RecrawlScheduler] = None
+        # Pesi dei progetti nel weighted fair queuing dei download (default 1)
+        self.project_weights: Dict[int, float] = parse_project_map(config.crawler.project_weights)
+        # Crawl di più progetti: fonti ancora da completare per progetto e inizio del run
+        self._project_remaining: Dict[int, int] = {}
+        self._source_projects: Dict[int, int] = {}
+        self._projects_started = 0.0
+        # Fonti con la stessa URL canonica nel blocco in corso: fonte scaricata -> copie
+        self._duplicates: Dict[int, List[int]] = {}
+    
+    def close(self):
+        """Rilascia le risorse del crawler (i motori che ne hanno altre le chiudono qui)"""
+        if self.frontier is not None:
+            self.frontier.close()
     
     @retry_on_failure(max_attempts=2, delay=1.0)
     def get_all_projects(self) -> Optional[List[Dict]]:
         """Recupera tutti i progetti disponibili"""
         logger.info("Recupero lista progetti...")
-        projects = self.api.get("/projects/", params={"limit": 2000})
+        projects = self.repo.list_projects(limit=2000)
         
         if projects:
             logger.info(f"Trovati {len(projects)} progetti")
@@ -52,7 +122,7 @@ class AdvancedCrawler:
     def get_sources_for_project(self, project_id: int) -> List[Dict]:
         """Recupera tutte le fonti per un progetto"""
         logger.info(f"Recupero fonti per progetto {project_id}...")
-        sources = self.api.get(f"/projects/{project_id}/sources/", params={"limit": 5000})
+        sources = self.repo.get_project_sources(project_id, limit=5000)
         
         if sources:
             logger.info(f"Trovate {len(sources)} fonti per progetto {project_id}")
@@ -61,10 +131,15 @@ class AdvancedCrawler:
             logger.warning(f"Nessuna fonte trovata per progetto {project_id}")
             return []
     
+    @staticmethod
+    def has_content(source: Dict) -> bool:
+        """True se la fonte ha già un contenuto (le fonti della frontiera portano solo il flag)"""
+        return bool(source.get('has_content') or (source.get('content') or '').strip())
+    
     def should_skip_source(self, source: Dict) -> bool:
         """Determina se saltare una fonte basandosi su vari criteri"""
-        # Salta se il contenuto è già presente e non vuoto
-        if source.get('content') and source['content'].strip():
+        # Salta se il contenuto è già presente e non vuoto (tranne in re-crawl)
+        if not self.recrawl and self.has_content(source):
             return True
         
         # Salta URL problematiche conosciute
@@ -81,8 +156,8 @@ class AdvancedCrawler:
         
         return False
     
-    def scrape_single_source(self, source: Dict) -> CrawlResult:
-        """Scrape una singola fonte"""
+    def scrape_single_source(self, source: Dict, scheduled: bool = False) -> CrawlResult:
+        """Scrape una singola fonte (scheduled=True se lo slot dell'host è già prenotato)"""
         start_time = time.time()
         source_id = source['id']
         url = source['url']
@@ -92,59 +167,17 @@ class AdvancedCrawler:
             
             # Controlla se saltare
             if self.should_skip_source(source):
-                self.stats['skipped'] += 1
+                self.stats.inc('skipped')
                 return CrawlResult(
                     source_id=source_id,
                     success=True,  # È un successo saltare contenuto già presente
                     processing_time=time.time() - start_time
                 )
             
-            # Esegue lo scraping
-            html_content = self.scraper.scrape_url(url)
-            
-            if not html_content:
-                return CrawlResult(
-                    source_id=source_id,
-                    success=False,
-                    error="Impossibile scaricare il contenuto",
-                    processing_time=time.time() - start_time
-                )
-            
-            # Pulisce il contenuto
-            soup = BeautifulSoup(html_content, 'lxml')
-            
-            # Rimuove elementi non necessari
-            for element in soup(["script", "style", "nav", "footer", "header", "aside", "iframe"]):
-                element.decompose()
-            
-            # Estrae testo pulito
-            text = soup.get_text()
-            cleaned_text = clean_text(text)
-            
-            if len(cleaned_text) < 100:  # Testo troppo corto, probabilmente non utile
-                return CrawlResult(
-                    source_id=source_id,
-                    success=False,
-                    error="Contenuto troppo breve o vuoto",
-                    processing_time=time.time() - start_time
-                )
-            
-            # Salva nel database
-            if self.save_content_to_db(source_id, cleaned_text):
-                self.stats['total_content_length'] += len(cleaned_text)
-                return CrawlResult(
-                    source_id=source_id,
-                    success=True,
-                    content_length=len(cleaned_text),
-                    processing_time=time.time() - start_time
-                )
-            else:
-                return CrawlResult(
-                    source_id=source_id,
-                    success=False,
-                    error="Errore nel salvataggio nel database",
-                    processing_time=time.time() - start_time
-                )
+            # Esegue lo scraping (condizionale se la fonte ha già un contenuto)
+            etag, last_modified = self.conditional_validators(source)
+            fetch_result = self.scraper.fetch(url, etag=etag, last_modified=last_modified, wait=not scheduled)
+            return self.process_fetch(source, fetch_result, start_time)
                 
         except Exception as e:
             logger.error(f"Errore nello scraping della fonte {source_id}: {e}")
@@ -152,19 +185,255 @@ class AdvancedCrawler:
                 source_id=source_id,
                 success=False,
                 error=str(e),
-                processing_time=time.time() - start_time
+                processing_time=time.time() - start_time,
+                reason="exception"
             )
     
+    def extract_text(self, html_content: str) -> str:
+        """Estrae il testo pulito dall'HTML"""
+        start = time.perf_counter()
+        try:
+            return self.extractor.extract(html_content)
+        finally:
+            self.telemetry.observe("parse_seconds", time.perf_counter() - start)
+    
+    def conditional_validators(self, source: Dict) -> tuple:
+        """ETag e Last-Modified da inviare: solo per fonti che hanno già un contenuto da conservare"""
+        if not self.has_content(source):
+            return None, None
+        return source.get('etag'), source.get('last_modified')
+    
+    def process_fetch(self, source: Dict, fetch_result: Optional[FetchResult],
+                      start_time: float) -> Optional[CrawlResult]:
+        """Gestisce l'esito di un download: una pagina invariata non viene né analizzata né salvata"""
+        outcome = self.triage_fetch(source, fetch_result, start_time)
+        if isinstance(outcome, CrawlResult):
+            return outcome
+        return self.process_content(source['id'], fetch_result.content, start_time, outcome)
+    
+    def triage_fetch(self, source: Dict, fetch_result: Optional[FetchResult],
+                     start_time: float) -> Union[CrawlResult, Dict]:
+        """Esito immediato (download fallito o pagina invariata) oppure i validatori da salvare col contenuto"""
+        if fetch_result is None or fetch_result.error:
+            return self._fetch_failed_result(source['id'], fetch_result, start_time)
+        
+        if fetch_result.not_modified:
+            return self._unchanged_result(source['id'], start_time, not_modified=True)
+        
+        raw_hash = content_hash(fetch_result.content or "")
+        if self.has_content(source) and source.get('content_hash') == raw_hash:
+            return self._unchanged_result(source['id'], start_time, content_hash=raw_hash)
+        
+        if not fetch_result.content:
+            return self.process_content(source['id'], None, start_time)
+        
+        validators = {
+            "etag": fetch_result.etag,
+            "last_modified": fetch_result.last_modified,
+            "fetched_at": datetime.datetime.utcnow().isoformat(),
+            "content_hash": raw_hash,
+        }
+        if fetch_result.moved_to:
+            # Redirect permanente: la fonte punterà direttamente alla nuova URL
+            validators["url"] = fetch_result.moved_to
+        return validators
+    
+    def _fetch_failed_result(self, source_id: int, fetch_result: Optional[FetchResult],
+                             start_time: float) -> CrawlResult:
+        reason = fetch_result.error if fetch_result is not None else "error"
+        if reason == "circuit_open":
+            error = "Host non raggiungibile (circuito aperto)"
+        else:
+            error = f"Impossibile scaricare il contenuto ({reason})"
+        return CrawlResult(
+            source_id=source_id,
+            success=False,
+            error=error,
+            processing_time=time.time() - start_time,
+            retryable=reason not in PERMANENT_FETCH_ERRORS,
+            reason=reason,
+            retry_after=fetch_result.retry_after if fetch_result is not None else None
+        )
+    
+    def _unchanged_result(self, source_id: int, start_time: float, not_modified: bool = False,
+                          content_hash: Optional[str] = None) -> CrawlResult:
+        self.stats.inc('unchanged')
+        logger.debug(f"Fonte {source_id} invariata, nessun aggiornamento")
+        return CrawlResult(
+            source_id=source_id,
+            success=True,
+            unchanged=True,
+            processing_time=time.time() - start_time,
+            not_modified=not_modified,
+            content_hash=content_hash
+        )
+    
+    def process_content(self, source_id: int, html_content: Optional[str], start_time: float,
+                        validators: Optional[Dict] = None) -> Optional[CrawlResult]:
+        """
+        Estrae il testo da una pagina scaricata e lo salva (comune a tutti i motori di crawling).
+        Con la fase di scrittura attiva il testo viene accodato e restituisce None: il risultato
+        arriva dal writer a salvataggio avvenuto.
+        """
+        if not html_content:
+            return CrawlResult(
+                source_id=source_id,
+                success=False,
+                error="Impossibile scaricare il contenuto",
+                processing_time=time.time() - start_time,
+                reason="empty"
+            )
+        
+        cleaned_text = self.extract_text(html_content)
+        
+        rejected = self.reject_text(source_id, cleaned_text, start_time)
+        if rejected is not None:
+            return rejected
+        
+        if self.writer is not None:
+            self.writer.submit(WriteItem(source_id, cleaned_text, validators or {}, start_time))
+            return None
+        
+        # Salva nel database
+        saved = self.save_content_to_db(source_id, cleaned_text, validators)
+        if saved:
+            for duplicate_id in self._duplicates.get(source_id, ()):
+                self.save_content_to_db(duplicate_id, cleaned_text, validators)
+        return self.saved_result(source_id, cleaned_text, saved, start_time, (validators or {}).get('content_hash'))
+    
+    def reject_text(self, source_id: int, cleaned_text: str, start_time: float) -> Optional[CrawlResult]:
+        """Risultato di fallimento se il testo estratto non vale il salvataggio, altrimenti None"""
+        if len(cleaned_text) < 100:  # Testo troppo corto, probabilmente non utile
+            return CrawlResult(
+                source_id=source_id,
+                success=False,
+                error="Contenuto troppo breve o vuoto",
+                processing_time=time.time() - start_time,
+                retryable=False,
+                reason="too_short"
+            )
+        return None
+    
+    def saved_result(self, source_id: int, cleaned_text: str, saved: bool, start_time: float,
+                     content_hash: Optional[str] = None) -> CrawlResult:
+        """Risultato finale dopo il salvataggio del testo"""
+        if saved:
+            self.stats.inc('total_content_length', len(cleaned_text))
+            return CrawlResult(
+                source_id=source_id,
+                success=True,
+                content_length=len(cleaned_text),
+                processing_time=time.time() - start_time,
+                content_hash=content_hash
+            )
+        else:
+            return CrawlResult(
+                source_id=source_id,
+                success=False,
+                error="Errore nel salvataggio nel database",
+                processing_time=time.time() - start_time,
+                reason="save_error"
+            )
+    
+    def written_result(self, item: WriteItem, saved: bool, error: Optional[str]) -> CrawlResult:
+        """Risultato di una fonte dopo la fase di scrittura"""
+        if saved:
+            return self.saved_result(item.source_id, item.content, saved, item.start_time,
+                                     item.metadata.get('content_hash'))
+        # Il testo è nel dead-letter (o la fonte non esiste più): riscaricare la pagina non serve
+        return CrawlResult(
+            source_id=item.source_id,
+            success=False,
+            error=error,
+            processing_time=time.time() - item.start_time,
+            retryable=False,
+            reason="save_error"
+        )
+    
+    def create_writer(self, on_written, dead_letter_path: Optional[str] = config.crawler.dead_letter_path,
+                      max_queue: int = config.crawler.write_queue_size) -> BatchWriter:
+        """Fase di scrittura configurata, che salva con save_contents_to_db"""
+        return BatchWriter(
+            self.save_contents_to_db,
+            on_written,
+            batch_size=self.write_batch_size,
+            flush_interval=config.crawler.write_flush_interval,
+            max_attempts=config.crawler.write_max_attempts,
+            dead_letter_path=dead_letter_path or None,
+            max_queue=max_queue
+        )
+    
+    def save_contents_to_db(self, items: List[WriteItem]) -> Optional[Dict]:
+        """Salva un lotto di testi con una sola richiesta; None se il salvataggio non è riuscito"""
+        start = time.perf_counter()
+        try:
+            # Le copie della stessa URL ricevono lo stesso testo nella stessa richiesta
+            result = self.repo.update_sources_content_bulk([
+                {"id": source_id, "content": item.content, **item.metadata}
+                for item in items
+                for source_id in [item.source_id, *self._duplicates.get(item.source_id, ())]
+            ])
+            if result and result.get('duplicates'):
+                self.stats.inc('near_duplicates', len(result['duplicates']))
+            return result
+        finally:
+            self.telemetry.observe("save_seconds", time.perf_counter() - start)
+    
+    def replay_dead_letter(self, path: str = config.crawler.dead_letter_path) -> Counter:
+        """
+        Ripubblica i testi del dead-letter: i lotti che falliscono di nuovo vanno in un file temporaneo
+        che alla fine sostituisce l'originale con os.replace. Fino ad allora il dead-letter resta intatto:
+        se la ripubblicazione si interrompe, al massimo qualche testo viene salvato due volte.
+        """
+        read_size = os.path.getsize(path) if os.path.exists(path) else 0
+        items = read_dead_letter(path)
+        if not items:
+            logger.info(f"Nessun elemento da ripubblicare in {path}")
+            return Counter()
+        
+        failed_path = f"{path}.replay"
+        if os.path.exists(failed_path):
+            os.remove(failed_path)  # resto di una ripubblicazione interrotta
+        outcome = Counter()
+        with self.create_writer(lambda item, saved, error: outcome.update(saved=saved, failed=not saved),
+                                dead_letter_path=failed_path) as writer:
+            for item in items:
+                writer.submit(item)
+        if outcome['saved'] + outcome['failed'] < len(items):
+            # Il writer si è fermato senza esito per tutti i testi: il dead-letter resta com'era
+            logger.error(f"Ripubblicazione di {path} interrotta, file originale conservato")
+            if os.path.exists(failed_path):
+                os.remove(failed_path)
+            return outcome
+        
+        # Lotti arrivati nel frattempo da un crawl in corso: restano nel dead-letter
+        with open(path, "rb") as f:
+            f.seek(read_size)
+            appended = f.read()
+        if appended:
+            with open(failed_path, "ab") as f:
+                f.write(appended)
+        if os.path.exists(failed_path):
+            os.replace(failed_path, path)
+        else:
+            os.remove(path)
+        logger.info(f"Dead-letter ripubblicato: {outcome['saved']} salvate, {outcome['failed']} fallite")
+        return outcome
+    
     @retry_on_failure(max_attempts=3, delay=1.0)
-    def save_content_to_db(self, source_id: int, content: str) -> bool:
-        """Salva il contenuto nel database"""
+    def save_content_to_db(self, source_id: int, content: str, validators: Optional[Dict] = None) -> bool:
+        """Salva il contenuto nel database, con i validatori HTTP del download"""
+        start = time.perf_counter()
         try:
-            update_data = {"content": content}
-            result = self.api.put(f"/sources/{source_id}", json=update_data)
+            result = self.repo.update_source_content(source_id, content, validators)
+            if result and result.get('duplicate_of'):
+                self.stats.inc('near_duplicates')
             return result is not None
         except Exception as e:
             logger.error(f"Errore salvataggio fonte {source_id}: {e}")
             return False
+        finally:
+            self.telemetry.observe("save_seconds", time.perf_counter() - start)
     
     def crawl_sources_parallel(self, sources: List[Dict]) -> List[CrawlResult]:
         """Crawl di fonti in parallelo con gestione intelligente della concorrenza"""
@@ -182,43 +451,80 @@ class AdvancedCrawler:
         
         # Usa progress tracker
         with progress_tracker(total_to_process, "Crawling fonti") as tracker:
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                # Sottometti tutti i job
-                future_to_source = {
-                    executor.submit(self.scrape_single_source, source): source 
-                    for source in sources_to_process
-                }
-                
-                # Processa i risultati man mano che arrivano
-                for future in as_completed(future_to_source):
-                    source = future_to_source[future]
-                    
-                    try:
-                        result = future.result()
-                        results.append(result)
+            # Le fonti escono dalla coda dell'host pronto per primo: host diversi
+            # procedono in parallelo, ciascuno al proprio ritmo; tra progetti diversi
+            # i download si alternano secondo i pesi (weighted fair queuing)
+            # Le risposte della cache HTTP non richiedono rete: partono subito, senza coda dell'host
+            cached, ready_queue = self.plan_fetches(sources_to_process)
+            
+            # Future dei worker e risultati della fase di scrittura arrivano sulla stessa coda
+            done = queue.Queue()
+            future_to_source = {}
+            pending_writes = 0
+            
+            self.writer = self.create_writer(
+                lambda item, saved, error: done.put(self.written_result(item, saved, error))
+            ).start()
+            try:
+                with ThreadPoolExecutor(max_workers=self.concurrency.maximum) as executor:
+                    while cached or ready_queue or future_to_source or pending_writes:
+                        # Sottometti finché il limite di concorrenza (adattivo) lo consente
+                        while (cached or ready_queue) and self.concurrency.try_acquire():
+                            source = cached.popleft() if cached else ready_queue.pop()
+                            future = executor.submit(self._scrape_in_slot, source)
+                            future_to_source[future] = source
+                            future.add_done_callback(done.put)
                         
-                        # Aggiorna statistiche
-                        self.stats['processed'] += 1
-                        if result.success:
-                            self.stats['successful'] += 1
-                        else:
-                            self.stats['failed'] += 1
-                            logger.warning(f"Fallimento fonte {result.source_id}: {result.error}")
+                        # Nessun download in corso: inutile attendere che il lotto si riempia
+                        if not cached and not ready_queue and not future_to_source:
+                            self.writer.flush()
                         
-                        # Aggiorna progress
-                        tracker.update()
+                        # Processa i risultati man mano che arrivano
+                        item = done.get()
+                        if isinstance(item, CrawlResult):
+                            pending_writes -= 1
+                            result = item
+                        else:
+                            source = future_to_source.pop(item)
+                            try:
+                                result = item.result()
+                            except Exception as e:
+                                logger.error(f"Errore nel future per fonte {source['id']}: {e}")
+                                result = CrawlResult(source_id=source['id'], success=False, error=str(e))
+                            if result is None:
+                                # Testo accodato alla fase di scrittura: il risultato arriverà da lì
+                                pending_writes += 1
+                                continue
                         
-                        # Log periodico
-                        if self.stats['processed'] % 10 == 0:
-                            self._log_progress_stats()
-                    
-                    except Exception as e:
-                        logger.error(f"Errore nel future per fonte {source['id']}: {e}")
-                        self.stats['failed'] += 1
-                        tracker.update()
+                        results.append(result)
+                        self._record_result(result, tracker)
+            finally:
+                self.writer.close()
+                self.writer = None
         
         return results
     
+    def plan_fetches(self, sources: List[Dict]) -> Tuple[deque, FairReadyQueue]:
+        """Fonti servite dalla cache HTTP (senza rate limit) e coda per host delle fonti da scaricare"""
+        cached = deque()
+        ready_queue = FairReadyQueue(self.scraper.host_scheduler, self.project_weights)
+        for source in sources:
+            if self.scraper.serves_from_cache(source['url']):
+                cached.append(source)
+            else:
+                # Accodata sull'host della destinazione di un redirect permanente noto: è quello
+                # che riceverà la richiesta, e di cui pop() prenota lo slot e legge robots.txt
+                ready_queue.push(self.scraper.scheduling_url(source['url']), source)
+        if cached:
+            logger.info(f"Cache HTTP: {len(cached)} fonti senza download")
+        return cached, ready_queue
+    
+    def _scrape_in_slot(self, source: Dict) -> CrawlResult:
+        try:
+            return self.scrape_single_source(source, scheduled=True)
+        finally:
+            self.concurrency.release()
+    
     def crawl_sources_sequential(self, sources: List[Dict]) -> List[CrawlResult]:
         """Crawl sequenziale per debugging o connessioni instabili"""
         results = []
@@ -228,22 +534,78 @@ class AdvancedCrawler:
             for source in sources_to_process:
                 result = self.scrape_single_source(source)
                 results.append(result)
-                
-                # Aggiorna statistiche
-                self.stats['processed'] += 1
-                if result.success:
-                    self.stats['successful'] += 1
-                else:
-                    self.stats['failed'] += 1
-                    logger.warning(f"Fallimento fonte {result.source_id}: {result.error}")
-                
-                tracker.update()
-                
-                # Pausa tra richieste per essere gentili
-                time.sleep(config.scraping.rate_limit_delay)
+                self._record_result(result, tracker)
         
         return results
     
+    def _record_result(self, result: CrawlResult, tracker):
+        """Aggiorna statistiche, progress e checkpoint della frontiera (comune a tutti i motori)"""
+        # L'esito vale anche per le copie della stessa URL (tracker None: non sono nel totale)
+        for duplicate_id in self._duplicates.pop(result.source_id, ()):
+            self._record_result(dataclasses.replace(result, source_id=duplicate_id), None)
+        
+        requeued = False
+        if self.frontier is not None and self.run_id:
+            if result.success:
+                self.frontier.mark_done(self.run_id, result.source_id)
+            elif result.reason == "circuit_open" and result.retry_after is not None:
+                # Circuito aperto: la pagina non è stata richiesta, la fonte torna in coda all'ora
+                # della richiesta di prova senza consumare un tentativo
+                self.frontier.defer(self.run_id, result.source_id, result.retry_after, result.error)
+                requeued = True
+            else:
+                requeued = self.frontier.mark_failed(self.run_id, result.source_id, result.error, result.retryable)
+        
+        # Con il circuito aperto la pagina non è stata richiesta: niente da aggiungere alla storia
+        if self.scheduler is not None and result.reason != "circuit_open":
+            self.scheduler.record(result.source_id, self._schedule_outcome(result), result.content_hash)
+        
+        self.stats.inc('processed')
+        if not result.success:
+            self.failure_reasons[result.reason or "error"] += 1
+        if result.success:
+            outcome = 'successful'
+        elif requeued and result.retry_after is not None:
+            outcome = 'deferred'
+            logger.debug(f"Fonte {result.source_id} rinviata di {result.retry_after:.0f}s: {result.error}")
+        elif requeued:
+            outcome = 'retried'
+            logger.info(f"Fonte {result.source_id} rimessa in coda con backoff: {result.error}")
+        else:
+            outcome = 'failed'
+            logger.warning(f"Fallimento fonte {result.source_id}: {result.error}")
+        self.stats.inc(outcome)
+        if outcome not in ('retried', 'deferred'):
+            self._project_source_done(result.source_id)
+        self.telemetry.inc("results_total", outcome=outcome, reason=result.reason or "")
+        self.telemetry.observe("source_seconds", result.processing_time)
+        
+        if tracker is not None:
+            tracker.update()
+        
+        # Log periodico
+        if self.stats['processed'] % 10 == 0:
+            self._log_progress_stats()
+    
+    def _project_source_done(self, source_id: int):
+        """Nel crawl di più progetti, segnala quando un progetto ha esaurito le sue fonti"""
+        project_id = self._source_projects.pop(source_id, None)
+        if project_id is None:
+            return
+        self._project_remaining[project_id] -= 1
+        if self._project_remaining[project_id] == 0:
+            logger.info(f"Progetto {project_id} completato dopo {time.time() - self._projects_started:.0f}s "
+                        f"({len([r for r in self._project_remaining.values() if r])} progetti ancora in corso)")
+    
+    @staticmethod
+    def _schedule_outcome(result: CrawlResult) -> str:
+        """Esito del download per la stima della frequenza di cambiamento"""
+        if not result.success:
+            return FAILED
+        if result.not_modified:
+            return NOT_MODIFIED
+        return UNCHANGED if result.unchanged else CHANGED
+    
     def _log_progress_stats(self):
         """Log delle statistiche di progresso"""
         success_rate = (self.stats['successful'] / max(self.stats['processed'], 1)) * 100
@@ -253,41 +615,208 @@ class AdvancedCrawler:
             f"Progresso: {self.stats['processed']} processate, "
             f"{self.stats['successful']} successi, "
             f"{self.stats['failed']} fallimenti, "
-            f"{self.stats['skipped']} saltate "
+            f"{self.stats['skipped']} saltate, "
+            f"{self.stats['unchanged']} invariate "
             f"(Success rate: {success_rate:.1f}%, "
-            f"Contenuto medio: {avg_content:.0f} caratteri)"
+            f"Contenuto medio: {avg_content:.0f} caratteri, "
+            f"Concorrenza: {self.concurrency.current_limit})"
         )
     
-    def crawl_project(self, project_id: int, parallel: bool = True) -> bool:
-        """Crawl completo di un progetto"""
+    def crawl_project(self, project_id: int, parallel: bool = True, run_id: Optional[str] = None,
+                      sources: Optional[List[Dict]] = None) -> bool:
+        """
+        Crawl completo di un progetto (run_id: riprende un run interrotto della frontiera;
+        sources: solo queste fonti del progetto, es. quelle scadute per il re-crawl)
+        """
         logger.info(f"=== Inizio crawling progetto {project_id} ===")
         
         # Reset statistiche
-        self.stats = {key: 0 for key in self.stats}
+        self.stats.reset()
+        self.failure_reasons = Counter()
+        self.telemetry.reset()
+        if config.crawler.metrics_port and self._metrics_server is None:
+            self._metrics_server = start_metrics_server(self.telemetry, config.crawler.metrics_port)
         
+        # Il controller di concorrenza e la telemetria ricevono latenza ed esito di ogni download
+        self.scraper.add_fetch_listener(self.concurrency.record_fetch)
+        self.scraper.add_fetch_listener(self.telemetry.record_fetch)
         try:
-            # Recupera le fonti
-            sources = self.get_sources_for_project(project_id)
-            if not sources:
-                logger.warning("Nessuna fonte da processare")
-                return True
-            
-            # Esegue il crawling
-            if parallel and len(sources) > 5:  # Parallelo solo se ci sono abbastanza fonti
-                logger.info(f"Crawling parallelo con {self.max_workers} worker")
-                results = self.crawl_sources_parallel(sources)
+            if self.frontier is not None:
+                self._crawl_with_frontier(project_id, parallel, run_id, sources)
             else:
-                logger.info("Crawling sequenziale")
-                results = self.crawl_sources_sequential(sources)
+                # Recupera le fonti
+                if sources is None:
+                    sources = self.get_sources_for_project(project_id)
+                if not sources:
+                    logger.warning("Nessuna fonte da processare")
+                    return True
+                self._crawl_sources(sources, parallel)
             
             # Report finale
             self._log_final_stats()
+            self._write_run_report(project_id)
             
             return True
             
         except Exception as e:
             logger.error(f"Errore nel crawling del progetto {project_id}: {e}")
             return False
+        finally:
+            self.scraper.remove_fetch_listener(self.concurrency.record_fetch)
+            self.scraper.remove_fetch_listener(self.telemetry.record_fetch)
+    
+    def crawl_projects(self, project_ids: List[int], parallel: bool = True) -> bool:
+        """
+        Crawl di più progetti in un solo run: invece di uno dopo l'altro, i download si alternano
+        tra i progetti con weighted fair queuing (CRAWLER_PROJECT_WEIGHTS), così i progetti piccoli
+        finiscono presto anche accanto a un backfill grande. Ogni progetto scarica al più il suo
+        budget di fonti per run (CRAWLER_PROJECT_BUDGETS, default CRAWLER_PROJECT_BUDGET);
+        le altre restano per il run successivo.
+        """
+        budgets = parse_project_map(config.crawler.project_budgets)
+        sources = []
+        self._project_remaining = {}
+        self._source_projects = {}
+        for project_id in project_ids:
+            project_sources = [s for s in self.get_sources_for_project(project_id) if not self.should_skip_source(s)]
+            budget = int(budgets.get(project_id, config.crawler.project_budget))
+            if budget and len(project_sources) > budget:
+                logger.info(f"Progetto {project_id}: {budget} fonti su {len(project_sources)} in questo run (budget)")
+                project_sources = project_sources[:budget]
+            if not project_sources:
+                continue
+            logger.info(f"Progetto {project_id}: {len(project_sources)} fonti, peso "
+                        f"{self.project_weights.get(project_id, 1.0):g}")
+            self._project_remaining[project_id] = len(project_sources)
+            self._source_projects.update((s['id'], project_id) for s in project_sources)
+            sources.extend(project_sources)
+        
+        if not sources:
+            logger.info("Nessuna fonte da processare")
+            return True
+        self._projects_started = time.time()
+        try:
+            # Ordine già alternato: i blocchi della frontiera e il motore async consumano la lista in ordine
+            return self.crawl_project(ALL_PROJECTS, parallel, sources=fair_interleave(sources, self.project_weights))
+        finally:
+            self._project_remaining = {}
+            self._source_projects = {}
+    
+    def refresh_projects(self, project_ids: List[int], parallel: bool = True) -> bool:
+        """Re-crawl delle sole fonti scadute secondo il pianificatore, entro il budget giornaliero"""
+        if self.scheduler is None:
+            logger.error("Pianificatore del re-crawl disattivato (CRAWLER_SCHEDULE_PATH vuoto o cache HTTP attiva)")
+            return False
+        
+        sources_by_project = {project_id: self.get_sources_for_project(project_id) for project_id in project_ids}
+        new = self.scheduler.sync([s for sources in sources_by_project.values() for s in sources])
+        if new:
+            logger.info(f"Pianificatore: {new} nuove fonti registrate")
+        due = set(self.scheduler.due(project_ids))
+        logger.info(f"Re-crawl: {len(due)} fonti scadute (budget rimasto oggi: {self.scheduler.budget_left()})")
+        
+        # Le fonti scelte vanno riscaricate anche se hanno già un contenuto (richieste condizionali)
+        self.recrawl = True
+        success = True
+        for project_id, sources in sources_by_project.items():
+            selected = [s for s in sources if s['id'] in due]
+            if selected:
+                success = self.crawl_project(project_id, parallel, sources=selected) and success
+        
+        summary = self.scheduler.summary(project_ids)
+        logger.info(f"Intervalli di re-crawl stimati: {summary['intervals']}, "
+                    f"risposte 304: {summary['not_modified']}")
+        for source in summary['fastest']:
+            logger.info(f"  ogni {source['interval_hours']}h: {source['url']}")
+        next_due = self.scheduler.next_due_in()
+        if next_due is not None:
+            logger.info(f"Prossima fonte in scadenza tra {next_due / 3600:.1f}h")
+        return success
+    
+    def _deduplicate(self, sources: List[Dict]) -> List[Dict]:
+        """
+        Una fonte per URL canonica (dopo i redirect permanenti noti): le altre diventano copie
+        che ricevono testo ed esito della prima. Solo tra fonti nello stesso stato (stesso
+        contenuto salvato), perché l'esito di una pagina invariata non vale per una fonte vuota.
+        """
+        unique = []
+        representatives: Dict[tuple, Dict] = {}
+        for source in sources:
+            url = source.get('url')
+            try:
+                key = canonicalize_url(self.scraper.resolve_redirect(url) or url)
+            except ValueError:
+                unique.append(source)
+                continue
+            has_content = self.has_content(source)
+            key = (key, has_content, source.get('content_hash') if has_content else None)
+            representative = representatives.get(key)
+            if representative is None:
+                representatives[key] = source
+                unique.append(source)
+            else:
+                self._duplicates.setdefault(representative['id'], []).append(source['id'])
+        
+        duplicates = len(sources) - len(unique)
+        if duplicates:
+            self.stats.inc('duplicates', duplicates)
+            logger.info(f"{duplicates} fonti con una URL già presente: {len(unique)} download per {len(sources)} fonti")
+        return unique
+    
+    def _crawl_sources(self, sources: List[Dict], parallel: bool) -> List[CrawlResult]:
+        sources = self._deduplicate(sources)
+        try:
+            if parallel and len(sources) > 5:  # Parallelo solo se ci sono abbastanza fonti
+                logger.info(f"Crawling parallelo con {self.concurrency.current_limit} worker "
+                            f"(massimo {self.concurrency.maximum})")
+                return self.crawl_sources_parallel(sources)
+            logger.info("Crawling sequenziale")
+            return self.crawl_sources_sequential(sources)
+        finally:
+            # Copie di fonti saltate (nessun esito da propagare)
+            self._duplicates.clear()
+    
+    def _crawl_with_frontier(self, project_id: int, parallel: bool, run_id: Optional[str] = None,
+                             sources: Optional[List[Dict]] = None):
+        """Crawl a blocchi dalla frontiera persistente, fino a esaurire anche i tentativi in backoff"""
+        if run_id:
+            # Il run riprende con la stessa modalità con cui è stato creato
+            self.recrawl = bool(self.frontier.get_run(run_id)['recrawl'])
+            self.frontier.resume_run(run_id)
+            logger.info(f"Ripresa del run {run_id}: {self.frontier.counts(run_id)}")
+        else:
+            # Solo il crawl dell'intero progetto è condivisibile tra nodi: un elenco di fonti scelto dal
+            # chiamante ("all", re-crawl pianificato) resta un run a sé
+            scope = None
+            if sources is None:
+                sources = self.get_sources_for_project(project_id)
+                scope = f"project:{project_id}"
+            run_id = self.frontier.create_run(
+                project_id, [s for s in sources if not self.should_skip_source(s)], recrawl=self.recrawl, scope=scope
+            )
+        self.run_id = run_id
+        logger.info(f"Run {run_id} (se interrotto: python improved_crawler.py --resume {run_id})")
+        
+        try:
+            while True:
+                batch = self.frontier.claim(run_id, limit=config.crawler.frontier_batch_size)
+                if batch:
+                    self._crawl_sources(batch, parallel)
+                    continue
+                
+                wait = self.frontier.next_eligible_in(run_id)
+                if wait is None:
+                    break
+                logger.info(f"Attendo {wait:.0f}s per le fonti in backoff")
+                time.sleep(wait)
+            
+            self.frontier.finish_run(run_id)
+            counts = self.frontier.counts(run_id)
+            logger.info(f"Run {run_id} completato: {counts['done']} completate, {counts['failed']} fallite")
+            for failure in self.frontier.failures(run_id):
+                logger.warning(f"Fallita dopo {failure['attempts']} tentativi: {failure['url']} ({failure['last_error']})")
+        finally:
+            self.run_id = None
     
     def _log_final_stats(self):
         """Log delle statistiche finali"""
@@ -300,19 +829,200 @@ class AdvancedCrawler:
         logger.info(f"Successi: {self.stats['successful']}")
         logger.info(f"Fallimenti: {self.stats['failed']}")
         logger.info(f"Saltate: {self.stats['skipped']}")
+        logger.info(f"Invariate (re-crawl): {self.stats['unchanged']}")
+        logger.info(f"Copie della stessa URL (scaricate una volta): {self.stats['duplicates']}")
+        logger.info(f"Quasi-duplicati (esclusi da NLP e ricerca): {self.stats['near_duplicates']}")
+        if self.scraper.http_cache is not None:
+            cache = self.scraper.http_cache.stats()
+            logger.info(f"Cache HTTP ({self.scraper.http_cache.mode}): {cache['hits']} risposte dalla cache, "
+                        f"{cache['misses']} mancanti o scadute, {cache['revalidated']} rivalidate (304), "
+                        f"{cache['stored']} salvate")
+        logger.info(f"Ritentate con backoff: {self.stats['retried']}")
+        logger.info(f"Rinviate (circuito aperto): {self.stats['deferred']}")
+        if self.failure_reasons:
+            reasons = ", ".join(f"{reason} {count}" for reason, count in self.failure_reasons.most_common())
+            logger.info(f"Motivi dei fallimenti (tentativi): {reasons}")
+        for host, circuit in self.scraper.circuit_breaker.stats().items():
+            logger.info(f"Circuito {host}: {circuit['state']}, aperto {circuit['trips']} volte, "
+                        f"{circuit['rejected']} richieste evitate")
         logger.info(f"Success rate: {success_rate:.1f}%")
         logger.info(f"Contenuto totale scaricato: {total_mb:.2f} MB")
+        
+        concurrency = self.concurrency.metrics()
+        logger.info(
+            f"Concorrenza: limite finale {concurrency['limit']} (picco {concurrency['peak_limit']}), "
+            f"{concurrency['increases']} aumenti, {concurrency['decreases']} riduzioni, "
+            f"p95 {concurrency['p95_latency']:.2f}s, ultima decisione: {concurrency['last_decision']}"
+        )
+        throttled = {host: s for host, s in self.scraper.host_scheduler.stats().items() if s['backoffs']}
+        for host, host_stats in throttled.items():
+            logger.info(f"Back-off {host}: {host_stats['backoffs']} volte, ora {host_stats['rate']:.2f} richieste/s")
+        
+        summary = self.telemetry.summary()
+        for stage, timing in summary['stages'].items():
+            logger.info(f"Fase {stage}: {timing['count']} operazioni, totale {timing['total_seconds']:.1f}s, "
+                        f"p50 {timing['p50']:.3f}s, p95 {timing['p95']:.3f}s")
+        for host, timing in list(summary['hosts'].items())[:5]:
+            logger.info(f"Host {host}: {timing['count']} download, {timing['errors']} errori, "
+                        f"p95 {timing['p95']:.2f}s, {timing['bytes_per_sec'] / 1024:.0f} KB/s")
         logger.info("===================================")
+    
+    def run_summary(self, project_id: int) -> Dict:
+        """Riepilogo del run: statistiche, motivi dei fallimenti, concorrenza, circuiti e telemetria"""
+        return {
+            "project_id": project_id,
+            "engine": type(self).__name__,
+            "finished_at": datetime.datetime.utcnow().isoformat(),
+            "stats": dict(self.stats),
+            "failure_reasons": dict(self.failure_reasons),
+            "concurrency": self.concurrency.metrics(),
+            "circuits": self.scraper.circuit_breaker.stats(),
+            "host_backoffs": {host: s for host, s in self.scraper.host_scheduler.stats().items() if s['backoffs']},
+            **self.telemetry.summary(),
+        }
+    
+    def _write_run_report(self, project_id: int):
+        if not config.crawler.report_dir:
+            return
+        timestamp = datetime.datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        path = write_run_summary(f"{config.crawler.report_dir}/crawl_{project_id}_{timestamp}.json",
+                                 self.run_summary(project_id))
+        if path is not None:
+            logger.info(f"Riepilogo del run: {path}")
+
+def create_frontier() -> Optional[CrawlFrontier]:
+    """
+    Frontiera persistente configurata: SQLite locale (None se CRAWLER_FRONTIER_PATH è vuoto)
+    o, con CRAWLER_FRONTIER_BACKEND=postgres, la coda condivisa tra più nodi di crawling
+    """
+    if config.crawler.frontier_backend == "postgres":
+        from crawl_queue import SharedCrawlQueue
+        return SharedCrawlQueue(
+            config.database.url,
+            max_attempts=config.crawler.max_attempts,
+            retry_backoff=config.crawler.retry_backoff,
+            lease_seconds=config.crawler.lease_seconds
+        )
+    if config.crawler.frontier_backend != "sqlite":
+        logger.warning(f"Frontiera '{config.crawler.frontier_backend}' sconosciuta, uso 'sqlite'")
+    if not config.crawler.frontier_path:
+        return None
+    return CrawlFrontier(
+        config.crawler.frontier_path,
+        max_attempts=config.crawler.max_attempts,
+        retry_backoff=config.crawler.retry_backoff
+    )
+
+def create_scheduler() -> Optional[RecrawlScheduler]:
+    """Pianificatore del re-crawl configurato (None se CRAWLER_SCHEDULE_PATH è vuoto)"""
+    if not config.crawler.schedule_path:
+        return None
+    if config.scraping.http_cache_mode.lower() != "off":
+        # Le risposte riprodotte dalla cache falserebbero la stima della frequenza di cambiamento
+        logger.info("Cache HTTP attiva: la storia del re-crawl non viene aggiornata")
+        return None
+    return RecrawlScheduler(
+        config.crawler.schedule_path,
+        daily_budget=config.crawler.refresh_daily_budget,
+        min_interval=config.crawler.refresh_min_hours * 3600,
+        max_interval=config.crawler.refresh_max_hours * 3600,
+        initial_interval=config.crawler.refresh_initial_hours * 3600
+    )
+
+def create_crawler(engine: str = "threads") -> AdvancedCrawler:
+    """Crea il crawler per il motore richiesto ('threads', 'async' o 'pipeline')"""
+    crawler = _create_engine_crawler(engine, create_frontier())
+    crawler.scheduler = create_scheduler()
+    return crawler
+
+def _create_engine_crawler(engine: str, frontier: Optional[CrawlFrontier]) -> AdvancedCrawler:
+    if engine == "async":
+        from async_crawler import AsyncCrawler
+        try:
+            return AsyncCrawler(frontier=frontier)
+        except RuntimeError as e:
+            logger.warning(f"{e}. Uso il motore a thread")
+    elif engine == "pipeline":
+        from crawl_pipeline import PipelineCrawler
+        return PipelineCrawler(frontier=frontier)
+    elif engine != "threads":
+        logger.warning(f"Motore di crawling '{engine}' sconosciuto, uso 'threads'")
+    return AdvancedCrawler(max_workers=config.crawler.max_workers, recrawl=config.crawler.recrawl, frontier=frontier)
+
+def print_duplicate_clusters(project_id: int, clusters: List[Dict]):
+    """Report dei gruppi di quasi-duplicati: fonte originale e copie con la distanza tra le firme"""
+    copies = sum(len(cluster['duplicates']) for cluster in clusters)
+    print(f"\n=== QUASI-DUPLICATI DEL PROGETTO {project_id}: {len(clusters)} gruppi, {copies} copie ===")
+    for cluster in clusters:
+        print(f"  [{cluster['source_id']}] {cluster['title']} | {cluster['url'] or '-'}")
+        for duplicate in cluster['duplicates']:
+            print(f"      ~ [{duplicate['source_id']}] distanza {duplicate['distance']} | "
+                  f"{duplicate['title']} | {duplicate['url'] or '-'}")
 
 def main():
     """Funzione principale"""
-    # Verifica connessione API
-    if not api_client.check_health():
-        logger.error("API non raggiungibile. Assicurati che il server sia in esecuzione.")
+    parser = argparse.ArgumentParser(description="Crawler delle fonti dei progetti")
+    parser.add_argument("--resume", metavar="RUN_ID", help="riprende un run interrotto della frontiera")
+    parser.add_argument("--project", type=int, metavar="ID",
+                        help="crawl del progetto senza domande (es. per avviare più nodi sulla coda condivisa)")
+    parser.add_argument("--refresh", action="store_true",
+                        help="riscarica solo le fonti scadute secondo la frequenza di cambiamento stimata "
+                             "(tutti i progetti, o quello di --project), entro il budget giornaliero")
+    parser.add_argument("--http-cache", choices=HTTP_CACHE_MODES, metavar="MODE",
+                        help="modo della cache HTTP su disco per questo run (al posto di SCRAPING_HTTP_CACHE_MODE): "
+                             + ", ".join(HTTP_CACHE_MODES))
+    parser.add_argument("--duplicates", type=int, metavar="ID",
+                        help="mostra i gruppi di quasi-duplicati del progetto ed esce")
+    parser.add_argument("--replay-dead-letter", action="store_true",
+                        help="salva i testi rimasti nel file dead-letter della fase di scrittura")
+    args = parser.parse_args()
+    if args.http_cache:
+        # Lo scraper condiviso esiste già: la cache va ricreata per il nuovo modo
+        config.scraping.http_cache_mode = args.http_cache
+        web_scraper.http_cache = create_http_cache()
+    
+    # Verifica connessione all'API (o al database con DATA_ACCESS_MODE=database)
+    repo = get_repository()
+    if not repo.check_health():
+        logger.error(f"Accesso ai dati ({repo.name}) non disponibile. Assicurati che il server sia in esecuzione.")
         sys.exit(1)
     
-    # Crea il crawler
-    crawler = AdvancedCrawler(max_workers=config.scraping.retry_attempts)
+    if args.duplicates is not None:
+        clusters = repo.get_duplicate_clusters(args.duplicates)
+        if clusters is None:
+            sys.exit(1)
+        print_duplicate_clusters(args.duplicates, clusters)
+        sys.exit(0)
+    
+    # Crea il crawler con il motore configurato
+    crawler = create_crawler(config.crawler.engine)
+    # Anche su interruzione: la coda condivisa restituisce subito le URL assegnate al nodo
+    # e il pool di parsing del motore pipeline viene chiuso
+    atexit.register(crawler.close)
+    
+    if args.replay_dead_letter:
+        outcome = crawler.replay_dead_letter()
+        sys.exit(1 if outcome['failed'] else 0)
+    
+    if args.resume:
+        run = crawler.frontier.get_run(args.resume) if crawler.frontier else None
+        if run is None:
+            logger.error(f"Run {args.resume} non trovato (frontiera: {config.crawler.frontier_path or 'disattivata'})")
+            sys.exit(1)
+        success = crawler.crawl_project(run['project_id'], run_id=args.resume)
+        sys.exit(0 if success else 1)
+    
+    if args.refresh:
+        if args.project is not None:
+            project_ids = [args.project]
+        else:
+            project_ids = [project['id'] for project in crawler.get_all_projects() or []]
+        success = crawler.refresh_projects(project_ids)
+        sys.exit(0 if success else 1)
+    
+    if args.project is not None:
+        success = crawler.crawl_project(args.project)
+        sys.exit(0 if success else 1)
     
     # Mostra progetti disponibili
     projects = crawler.get_all_projects()
@@ -323,17 +1033,26 @@ def main():
     for proj in projects:
         print(f"  ID: {proj['id']:<3} | Nome: {proj['name']}")
     
+    unfinished_runs = crawler.frontier.unfinished_runs() if crawler.frontier else []
+    if unfinished_runs:
+        print("\n=== RUN INTERROTTI (riprendi con --resume RUN_ID) ===")
+        for run in unfinished_runs[:5]:
+            counts = crawler.frontier.counts(run['run_id'])
+            print(f"  Run: {run['run_id']} | Progetto: {run['project_id']} | "
+                  f"Da fare: {counts['pending'] + counts['in_flight']} | Completate: {counts['done']}")
+    
     # Selezione progetto
     try:
         project_choice = input("\nInserisci ID progetto (o 'all' per tutti): ").strip()
         
+        if not crawler.recrawl:
+            recrawl_choice = input("Aggiornare anche le fonti già scaricate? (s/n, default=n): ").strip().lower()
+            crawler.recrawl = recrawl_choice == 's'
+        
         if project_choice.lower() == 'all':
-            # Crawl di tutti i progetti
-            for project in projects:
-                logger.info(f"\n=== PROGETTO: {project['name']} ===")
-                success = crawler.crawl_project(project['id'])
-                if not success:
-                    logger.error(f"Errore nel crawling del progetto {project['id']}")
+            # Crawl di tutti i progetti insieme, alternati con weighted fair queuing
+            if not crawler.crawl_projects([project['id'] for project in projects]):
+                logger.error("Errore nel crawling dei progetti")
         else:
             project_id = int(project_choice)
             
@@ -9,12 +9,14 @@ from contextlib import contextmanager
 from typing import List, Optional
 from config import config
 from utils import retry_on_failure
+from crawl_queue import SCHEMA_STATEMENTS as CRAWL_QUEUE_SCHEMA
 
 # Aggiungi il path del progetto per importare i modelli
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
 try:
     from app.models.project import Base
+    from app.services import near_duplicates
 except ImportError as e:
     logging.error(f"Errore nell'importazione dei modelli: {e}")
     logging.error("Assicurati che il modulo 'app.models.project' esista e sia corretto")
@@ -134,6 +136,8 @@ class DatabaseManager:
             if 'postgresql' in config.database.url.lower():
                 self._apply_postgresql_optimizations()
             
+            self.refresh_near_duplicate_index()
+            
             logger.info("✅ Database inizializzato correttamente")
             return True
             
@@ -159,6 +163,32 @@ class DatabaseManager:
             
             # Indice per le relazioni
             "CREATE INDEX IF NOT EXISTS idx_sources_project_id ON sources (project_id)",
+            "CREATE INDEX IF NOT EXISTS idx_entities_source_id ON entities (source_id)",
+            
+            # Validatori HTTP per il re-crawl condizionale (If-None-Match / If-Modified-Since)
+            "ALTER TABLE sources ADD COLUMN IF NOT EXISTS etag VARCHAR, "
+            "ADD COLUMN IF NOT EXISTS last_modified VARCHAR, "
+            "ADD COLUMN IF NOT EXISTS fetched_at TIMESTAMP, "
+            "ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+            
+            # Cancellazione a cascata lato database (i modelli usano passive_deletes)
+            "ALTER TABLE sources DROP CONSTRAINT IF EXISTS sources_project_id_fkey, "
+            "ADD CONSTRAINT sources_project_id_fkey FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE",
+            "ALTER TABLE entities DROP CONSTRAINT IF EXISTS entities_source_id_fkey, "
+            "ADD CONSTRAINT entities_source_id_fkey FOREIGN KEY (source_id) REFERENCES sources (id) ON DELETE CASCADE",
+            
+            # Rilevamento dei quasi-duplicati: firma SimHash, fonte originale e indice LSH a bande
+            "ALTER TABLE sources ADD COLUMN IF NOT EXISTS simhash BIGINT, "
+            "ADD COLUMN IF NOT EXISTS duplicate_of INTEGER REFERENCES sources (id) ON DELETE SET NULL",
+            "CREATE INDEX IF NOT EXISTS ix_sources_duplicate_of ON sources (duplicate_of)",
+            "CREATE TABLE IF NOT EXISTS source_simhash_bands ("
+            "source_id INTEGER NOT NULL REFERENCES sources (id) ON DELETE CASCADE, "
+            "band INTEGER NOT NULL, value INTEGER NOT NULL, project_id INTEGER NOT NULL, "
+            "PRIMARY KEY (source_id, band))",
+            "CREATE INDEX IF NOT EXISTS ix_source_simhash_bands_lookup ON source_simhash_bands (project_id, band, value)",
+
+            # Coda condivisa del crawling distribuito (CRAWLER_FRONTIER_BACKEND=postgres)
+            *CRAWL_QUEUE_SCHEMA,
         ]
         
         try:
@@ -176,6 +206,21 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Errore nell'applicazione delle ottimizzazioni: {e}")
     
+    def refresh_near_duplicate_index(self):
+        """
+        Ricostruisce l'indice dei quasi-duplicati se usa uno schema di bande precedente, altrimenti
+        reindicizza solo le copie rimaste senza originale (cancellato con ON DELETE SET NULL)
+        """
+        try:
+            with self.get_session() as session:
+                if not near_duplicates.index_is_current(session):
+                    originals = near_duplicates.rebuild_index(session)
+                    logger.info(f"Indice dei quasi-duplicati ricostruito ({originals} originali)")
+                else:
+                    near_duplicates.reindex_orphans(session)
+        except Exception as e:
+            logger.error(f"Errore nell'aggiornamento dell'indice dei quasi-duplicati: {e}")
+    
     def verify_database_integrity(self) -> bool:
         """Verifica l'integrità del database"""
         logger.info("Verifica integrità database...")
@@ -6,11 +6,15 @@ from typing import Dict, List, Optional, Union
 from pathlib import Path
 import pandas as pd
 from dataclasses import dataclass
-from utils import api_client, progress_tracker, retry_on_failure, validate_url, safe_str, safe_int
+from utils import progress_tracker, retry_on_failure, validate_url, safe_str, safe_int
 from config import config
+from repository import get_repository
 
 logger = logging.getLogger(__name__)
 
+# Fonti salvate con una sola richiesta all'API (o un solo INSERT sul database)
+IMPORT_BATCH_SIZE = 500
+
 @dataclass
 class ImportStats:
     """Statistiche di importazione"""
@@ -33,7 +37,8 @@ class DataImporter:
     """Sistema avanzato di importazione dati da file Excel/CSV"""
     
     def __init__(self):
-        self.api = api_client
+        # API HTTP o database diretto (DATA_ACCESS_MODE)
+        self.repo = get_repository()
         self.project_cache: Dict[str, int] = {}
         self.stats = ImportStats()
         
@@ -90,7 +95,7 @@ class DataImporter:
         
         try:
             # Prima cerca se esiste già
-            projects = self.api.get("/projects/", params={"limit": 2000})
+            projects = self.repo.list_projects(limit=2000)
             if projects:
                 for project in projects:
                     if project['name'].strip().lower() == project_name.lower():
@@ -100,12 +105,9 @@ class DataImporter:
                         return project_id
             
             # Se non esiste, crealo
-            project_data = {
-                "name": project_name,
-                "description": f"Progetto creato automaticamente per il contesto '{project_name}'"
-            }
-            
-            result = self.api.post("/projects/", json=project_data)
+            result = self.repo.create_project(
+                project_name, f"Progetto creato automaticamente per il contesto '{project_name}'"
+            )
             if result:
                 project_id = result['id']
                 self.project_cache[project_name] = project_id
@@ -118,32 +120,31 @@ class DataImporter:
         
         return None
     
+    def prepare_source(self, title: str, url: str) -> Union[Dict[str, str], ImportResult]:
+        """Valida e normalizza titolo e URL; ImportResult con l'errore se la fonte non è valida"""
+        title = safe_str(title).strip()
+        if not title:
+            return ImportResult(False, "Titolo vuoto")
+        
+        try:
+            return {"title": title, "url": validate_url(url)}
+        except ValueError as e:
+            return ImportResult(False, f"URL non valida: {e}")
+    
     @retry_on_failure(max_attempts=3, delay=1.0)
     def import_source(self, project_id: int, title: str, url: str) -> ImportResult:
         """Importa una singola fonte"""
         try:
-            # Valida e normalizza i dati
-            title = safe_str(title).strip()
-            if not title:
-                return ImportResult(False, "Titolo vuoto")
-            
-            try:
-                normalized_url = validate_url(url)
-            except ValueError as e:
-                return ImportResult(False, f"URL non valida: {e}")
-            
-            # Prepara i dati
-            source_data = {
-                "title": title,
-                "url": normalized_url
-            }
+            source = self.prepare_source(title, url)
+            if isinstance(source, ImportResult):
+                return source
             
-            # Importa tramite API
-            result = self.api.post(f"/projects/{project_id}/sources/", json=source_data)
+            # Importa tramite API (o direttamente nel database)
+            result = self.repo.create_source(project_id, source['title'], source['url'])
             
             if result:
                 source_id = result.get('id')
-                logger.debug(f"Fonte importata: {title} (ID: {source_id})")
+                logger.debug(f"Fonte importata: {source['title']} (ID: {source_id})")
                 return ImportResult(True, "Importazione riuscita", project_id, source_id)
             else:
                 return ImportResult(False, "Errore API durante l'importazione")
@@ -152,6 +153,29 @@ class DataImporter:
             logger.error(f"Errore nell'importazione di '{title}': {e}")
             return ImportResult(False, f"Errore: {e}")
     
+    def import_sources(self, project_id: int, sources: List[Dict[str, str]]) -> int:
+        """Importa un blocco di fonti già validate dello stesso progetto; ritorna quante ne sono state create"""
+        if not sources:
+            return 0
+        try:
+            # Una richiesta (o un INSERT in una transazione) per tutto il blocco: riesce o fallisce per intero
+            created = self.repo.create_sources_bulk(project_id, sources)
+        except Exception as e:
+            logger.error(f"Errore nell'importazione di {len(sources)} fonti nel progetto {project_id}: {e}")
+            created = None
+        
+        if created is None:
+            logger.warning(f"Importazione di {len(sources)} fonti nel progetto {project_id} non riuscita")
+            return 0
+        logger.debug(f"Importate {len(created)} fonti nel progetto {project_id}")
+        return len(created)
+    
+    def _flush_sources(self, project_id: int, sources: List[Dict[str, str]]):
+        """Salva il blocco di fonti in attesa e aggiorna le statistiche"""
+        created = self.import_sources(project_id, sources)
+        self.stats.successful_imports += created
+        self.stats.failed_imports += len(sources) - created
+    
     def validate_row_data(self, row: pd.Series, column_mapping: Dict[str, str]) -> Optional[Dict[str, str]]:
         """Valida e estrae i dati da una riga"""
         try:
@@ -194,6 +218,10 @@ class DataImporter:
         
         logger.info(f"Formato rilevato. Processamento di {self.stats.total_rows} righe...")
         
+        # Fonti valide in attesa di salvataggio, raggruppate per progetto: ogni blocco di
+        # IMPORT_BATCH_SIZE righe diventa una sola richiesta invece di una per riga
+        pending: Dict[int, List[Dict[str, str]]] = {}
+        
         # Processa le righe con progress tracking
         with progress_tracker(self.stats.total_rows, f"Importazione {file_name}") as tracker:
             for index, row in df.iterrows():
@@ -214,21 +242,27 @@ class DataImporter:
                     tracker.update()
                     continue
                 
-                # Importa la fonte
-                result = self.import_source(project_id, row_data['title'], row_data['url'])
+                # Accoda la fonte al blocco del progetto
+                source = self.prepare_source(row_data['title'], row_data['url'])
                 
-                if result.success:
-                    self.stats.successful_imports += 1
-                else:
+                if isinstance(source, ImportResult):
                     self.stats.failed_imports += 1
-                    if "duplicate" in result.message.lower() or "already exists" in result.message.lower():
-                        self.stats.duplicate_sources += 1
+                    logger.debug(f"Riga {index + 1} scartata: {source.message}")
+                else:
+                    batch = pending.setdefault(project_id, [])
+                    batch.append(source)
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        self._flush_sources(project_id, pending.pop(project_id))
                 
                 tracker.update()
                 
                 # Log periodico ogni 50 righe
                 if (index + 1) % 50 == 0:
                     self._log_progress()
+            
+            # Blocchi rimasti incompleti
+            for project_id, batch in pending.items():
+                self._flush_sources(project_id, batch)
         
         # Log finale
         self._log_final_stats(file_name)
@@ -402,7 +436,7 @@ class InteractiveImporter:
         logger.info("=== SISTEMA DI IMPORTAZIONE DATI ===")
         
         # Verifica connessione API
-        if not self.importer.api.check_health():
+        if not self.importer.repo.check_health():
             logger.error("API non raggiungibile. Assicurati che il server sia in esecuzione.")
             return False
         
@@ -450,7 +484,7 @@ def main():
             
             # Verifica connessione API
             importer = DataImporter()
-            if not importer.api.check_health():
+            if not importer.repo.check_health():
                 logger.error("API non raggiungibile.")
                 sys.exit(1)
             
@@ -1,10 +1,10 @@
 # improved_scrape_single_source.py
 import sys
 import logging
-from bs4 import BeautifulSoup
 from typing import Optional, Dict, Any
-from utils import api_client, web_scraper, clean_text, retry_on_failure, validate_url
+from utils import api_client, web_scraper, retry_on_failure, validate_url
 from config import config
+from text_extractors import get_extractor
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +14,7 @@ class SourceScraper:
     def __init__(self):
         self.api = api_client
         self.scraper = web_scraper
+        self.extractor = get_extractor()
     
     @retry_on_failure(max_attempts=3, delay=2.0)
     def get_source_info(self, source_id: int) -> Optional[Dict[str, Any]]:
@@ -47,16 +48,8 @@ class SourceScraper:
             if not html_content:
                 return None
             
-            # Pulisce il contenuto HTML
-            soup = BeautifulSoup(html_content, 'lxml')
-            
-            # Rimuove elementi non necessari
-            for element in soup(["script", "style", "nav", "footer", "header", "aside"]):
-                element.decompose()
-            
             # Estrae il testo pulito
-            text = soup.get_text()
-            cleaned_text = clean_text(text)
+            cleaned_text = self.extractor.extract(html_content)
             
             logger.info(f"Estratti {len(cleaned_text)} caratteri di testo pulito")
             return cleaned_text
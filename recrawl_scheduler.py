@@ -0,0 +1,286 @@
+# recrawl_scheduler.py
+import datetime
+import heapq
+import logging
+import math
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Esiti di un download ai fini della stima
+CHANGED = "changed"
+UNCHANGED = "unchanged"  # stesso hash del contenuto salvato
+NOT_MODIFIED = "not_modified"  # 304 alla richiesta condizionale
+FAILED = "failed"
+
+# Peso delle osservazioni passate a ogni nuova osservazione: la stima segue i cambi di ritmo
+DECAY = 0.9
+
+# Visita fittizia a priori (dopo initial_interval) con i cambiamenti per cui, senza altre
+# osservazioni, la stima vale esattamente 1/initial_interval: le prime visite senza
+# cambiamenti allungano l'intervallo gradualmente invece di portarlo subito al massimo
+PRIOR_CHANGES = 1.5 * (1 - math.exp(-1))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS source_schedule (
+    source_id INTEGER PRIMARY KEY,
+    project_id INTEGER,
+    url TEXT,
+    checks REAL NOT NULL DEFAULT 0,
+    changes REAL NOT NULL DEFAULT 0,
+    exposure REAL NOT NULL DEFAULT 0,
+    not_modified INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    last_fetch_at REAL,
+    last_hash TEXT,
+    next_due_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_schedule_due ON source_schedule (next_due_at);
+CREATE TABLE IF NOT EXISTS fetch_history (
+    source_id INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    outcome TEXT NOT NULL,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_history_source ON fetch_history (source_id, fetched_at);
+CREATE TABLE IF NOT EXISTS fetch_budget (
+    day TEXT PRIMARY KEY,
+    fetched INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+def _timestamp(value) -> Optional[float]:
+    """fetched_at della fonte (ISO, UTC senza fuso) come timestamp"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp()
+
+def _today() -> str:
+    return datetime.datetime.utcnow().strftime("%Y-%m-%d")
+
+class RecrawlScheduler:
+    """
+    Pianificatore del re-crawl su SQLite: stima per ogni fonte la frequenza di cambiamento dalle
+    visite passate (hash del contenuto e risposte 304) e ne calcola la prossima scadenza, così le
+    pagine che cambiano spesso vengono riscaricate spesso e quelle statiche di rado.
+
+    Stima (Cho e Garcia-Molina): con n visite a intervallo medio I e X cambiamenti osservati,
+    λ = -ln((n - X + 0.5) / (n + 0.5)) / I, con una visita a priori (PRIOR_CHANGES); n, X e il
+    tempo osservato decadono di DECAY a ogni visita. La scadenza è 1/λ dopo l'ultima visita, entro [min_interval, max_interval].
+    Tra le fonti scadute, due() sceglie quelle con la probabilità più alta di essere cambiate
+    (1 - e^(-λ·età)) fino al budget giornaliero di download.
+    """
+
+    def __init__(self, path: str, daily_budget: int = 5000, min_interval: float = 3600.0,
+                 max_interval: float = 30 * 86400.0, initial_interval: float = 86400.0):
+        self.path = path
+        self.daily_budget = daily_budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = max(initial_interval, 1.0)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- stima ---
+
+    def change_rate(self, row) -> float:
+        """Cambiamenti al secondo stimati per la fonte (1/initial_interval senza osservazioni)"""
+        checks = row["checks"] + 1
+        changes = min(row["changes"] + PRIOR_CHANGES, checks)
+        mean_interval = (row["exposure"] + self.initial_interval) / checks
+        return -math.log((checks - changes + 0.5) / (checks + 0.5)) / mean_interval
+
+    def _interval(self, rate: float) -> float:
+        return min(max(1.0 / max(rate, 1e-12), self.min_interval), self.max_interval)
+
+    def change_probability(self, row, now: float) -> float:
+        """Probabilità che la fonte sia cambiata dall'ultima visita (1 se mai scaricata)"""
+        if row["last_fetch_at"] is None:
+            return 1.0
+        return 1.0 - math.exp(-self.change_rate(row) * max(now - row["last_fetch_at"], 0.0))
+
+    # --- fonti ---
+
+    def sync(self, sources: List[Dict]) -> int:
+        """Registra le fonti nuove (dall'ultimo download noto) e aggiorna progetto e URL; ritorna le nuove"""
+        now = time.time()
+        with self._lock:
+            known = {row[0] for row in self._conn.execute("SELECT source_id FROM source_schedule")}
+            new = [s for s in sources if s["id"] not in known]
+            self._conn.execute("BEGIN")
+            for source in new:
+                fetched_at = _timestamp(source.get("fetched_at"))
+                has_content = bool((source.get("content") or "").strip())
+                last_fetch_at = fetched_at if fetched_at is not None or not has_content else now
+                next_due_at = last_fetch_at + self.initial_interval if last_fetch_at is not None else now
+                self._conn.execute(
+                    "INSERT INTO source_schedule (source_id, project_id, url, last_fetch_at, last_hash, "
+                    "next_due_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (source["id"], source.get("project_id"), source.get("url"), last_fetch_at,
+                     source.get("content_hash"), next_due_at, now)
+                )
+            self._conn.executemany(
+                "UPDATE source_schedule SET project_id = ?, url = ? WHERE source_id = ?",
+                [(s.get("project_id"), s.get("url"), s["id"]) for s in sources if s["id"] in known]
+            )
+            self._conn.execute("COMMIT")
+        return len(new)
+
+    def record(self, source_id: int, outcome: str, content_hash: Optional[str] = None):
+        """Registra l'esito di un download e ricalcola stima e prossima scadenza della fonte"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT INTO fetch_history (source_id, fetched_at, outcome, content_hash) VALUES (?, ?, ?, ?)",
+                (source_id, now, outcome, content_hash)
+            )
+            row = self._conn.execute("SELECT * FROM source_schedule WHERE source_id = ?", (source_id,)).fetchone()
+            if row is None:
+                # Fonte mai vista da sync(): da qui parte la sua storia
+                self._conn.execute(
+                    "INSERT INTO source_schedule (source_id, last_fetch_at, last_hash, next_due_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (source_id, now if outcome != FAILED else None, content_hash,
+                     now + (self.initial_interval if outcome != FAILED else self.min_interval), now)
+                )
+            elif outcome == FAILED:
+                # Nessuna informazione sul contenuto: si riprova dopo l'intervallo minimo
+                self._conn.execute(
+                    "UPDATE source_schedule SET failures = failures + 1, next_due_at = ?, updated_at = ? "
+                    "WHERE source_id = ?",
+                    (now + self.min_interval, now, source_id)
+                )
+            else:
+                observed = dict(row)
+                if row["last_fetch_at"] is not None:
+                    # Il primo download non dice nulla sul ritmo: non c'è un contenuto precedente
+                    changed = outcome == CHANGED and not (content_hash and content_hash == row["last_hash"])
+                    observed["checks"] = row["checks"] * DECAY + 1
+                    observed["changes"] = row["changes"] * DECAY + (1 if changed else 0)
+                    observed["exposure"] = row["exposure"] * DECAY + max(now - row["last_fetch_at"], 0.0)
+                next_due_at = now + self._interval(self.change_rate(observed))
+                self._conn.execute(
+                    "UPDATE source_schedule SET checks = ?, changes = ?, exposure = ?, "
+                    "not_modified = not_modified + ?, last_fetch_at = ?, last_hash = COALESCE(?, last_hash), "
+                    "next_due_at = ?, updated_at = ? WHERE source_id = ?",
+                    (observed["checks"], observed["changes"], observed["exposure"],
+                     1 if outcome == NOT_MODIFIED else 0, now, content_hash, next_due_at, now, source_id)
+                )
+            self._conn.execute("COMMIT")
+
+    # --- scadenze ---
+
+    def _budget_left(self) -> int:
+        # Chiamato con il lock già acquisito
+        row = self._conn.execute("SELECT fetched FROM fetch_budget WHERE day = ?", (_today(),)).fetchone()
+        return max(self.daily_budget - (row["fetched"] if row else 0), 0)
+
+    def budget_left(self) -> int:
+        with self._lock:
+            return self._budget_left()
+
+    def due(self, project_ids: Optional[List[int]] = None, limit: Optional[int] = None) -> List[int]:
+        """
+        Fonti scadute da riscaricare ora, le più probabilmente cambiate per prime, entro il budget
+        giornaliero rimasto (che viene consumato). `project_ids` limita ai progetti indicati.
+        Lettura e addebito del budget stanno nella stessa transazione (BEGIN IMMEDIATE, sotto il lock):
+        due chiamate concorrenti, anche da processi diversi sullo stesso file, non lo superano.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                budget = self._budget_left() if limit is None else min(limit, self._budget_left())
+                rows, chosen = [], []
+                if budget > 0:
+                    rows = self._conn.execute(
+                        "SELECT * FROM source_schedule WHERE next_due_at <= ?", (now,)
+                    ).fetchall()
+                    if project_ids is not None:
+                        wanted = set(project_ids)
+                        rows = [row for row in rows if row["project_id"] in wanted]
+                    chosen = heapq.nlargest(budget, rows, key=lambda row: self.change_probability(row, now))
+                if chosen:
+                    self._conn.execute(
+                        "INSERT INTO fetch_budget (day, fetched) VALUES (?, ?) "
+                        "ON CONFLICT (day) DO UPDATE SET fetched = fetched + excluded.fetched",
+                        (_today(), len(chosen))
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if len(rows) > len(chosen):
+            logger.info(f"Budget giornaliero: {len(rows) - len(chosen)} fonti scadute rinviate")
+        return [row["source_id"] for row in chosen]
+
+    def next_due_in(self) -> Optional[float]:
+        """Secondi alla prossima scadenza, None se non ci sono fonti"""
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(next_due_at) FROM source_schedule").fetchone()
+        if row[0] is None:
+            return None
+        return max(row[0] - time.time(), 0.0)
+
+    def history(self, source_id: int, limit: int = 50) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT fetched_at, outcome, content_hash FROM fetch_history WHERE source_id = ? "
+                "ORDER BY fetched_at DESC LIMIT ?",
+                (source_id, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def summary(self, project_ids: Optional[List[int]] = None, top: int = 5) -> Dict:
+        """Fonti per intervallo di re-crawl stimato e quelle che cambiano più spesso"""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM source_schedule").fetchall()
+        if project_ids is not None:
+            wanted = set(project_ids)
+            rows = [row for row in rows if row["project_id"] in wanted]
+        buckets = {"<1h": 0, "<1g": 0, "<7g": 0, "<30g": 0, ">=30g": 0}
+        for row in rows:
+            hours = self._interval(self.change_rate(row)) / 3600
+            if hours < 1:
+                buckets["<1h"] += 1
+            elif hours < 24:
+                buckets["<1g"] += 1
+            elif hours < 24 * 7:
+                buckets["<7g"] += 1
+            elif hours < 24 * 30:
+                buckets["<30g"] += 1
+            else:
+                buckets[">=30g"] += 1
+        fastest = heapq.nlargest(top, (row for row in rows if row["checks"] >= 1), key=self.change_rate)
+        return {
+            "sources": len(rows),
+            "due": sum(1 for row in rows if row["next_due_at"] <= now),
+            "budget_left": self.budget_left(),
+            "intervals": buckets,
+            "not_modified": sum(row["not_modified"] for row in rows),
+            "fastest": [
+                {"source_id": row["source_id"], "url": row["url"],
+                 "interval_hours": round(self._interval(self.change_rate(row)) / 3600, 1)}
+                for row in fastest
+            ],
+        }
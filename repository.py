@@ -0,0 +1,268 @@
+# repository.py
+import logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from utils import APIClient, api_client
+from config import config
+
+logger = logging.getLogger(__name__)
+
+class Repository(ABC):
+    """
+    Accesso ai dati per gli script batch (crawler, importazione, estrazione entità).
+    I metodi restituiscono dict con la forma delle risposte JSON dell'API, oppure None
+    se l'operazione non è riuscita (l'errore viene registrato nel log).
+    """
+    name = ""
+
+    @abstractmethod
+    def check_health(self) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_projects(self, limit: int = 2000) -> Optional[List[Dict]]:
+        """Progetti con id, name, description e created_at (le fonti possono non essere incluse)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_project(self, name: str, description: Optional[str] = None) -> Optional[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_project_sources(self, project_id: int, limit: int = 5000) -> Optional[List[Dict]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_source(self, source_id: int) -> Optional[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_source(self, project_id: int, title: str, url: Optional[str]) -> Optional[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_sources_bulk(self, project_id: int, sources: List[Dict]) -> Optional[List[Dict]]:
+        """Fonti {"title", "url"} del progetto create in un'operazione; ritorna le fonti create"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_source_content(self, source_id: int, content: str,
+                              validators: Optional[Dict] = None) -> Optional[Dict]:
+        """Nuovo contenuto della fonte con i validatori del download (etag, last_modified, ...)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_sources_content_bulk(self, updates: List[Dict]) -> Optional[Dict]:
+        """
+        Aggiornamenti {"id", "content", validatori...} in un'operazione:
+        {"updated": [...], "missing": [...], "duplicates": {id: id originale}}
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_duplicate_clusters(self, project_id: int) -> Optional[List[Dict]]:
+        """Gruppi di quasi-duplicati del progetto: fonte originale con le sue copie"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_entities(self, source_id: int, entities: List[Dict]) -> Optional[int]:
+        """Entità {"text", "label"} della fonte; ritorna quante ne sono state create"""
+        raise NotImplementedError
+
+class HttpRepository(Repository):
+    """Passa dall'API HTTP (APIClient): il percorso di sempre, da qualunque macchina"""
+    name = "api"
+
+    def __init__(self, api: APIClient = api_client):
+        self.api = api
+
+    def check_health(self) -> bool:
+        return self.api.check_health()
+
+    def list_projects(self, limit: int = 2000) -> Optional[List[Dict]]:
+        return self.api.get("/projects/", params={"limit": limit})
+
+    def create_project(self, name: str, description: Optional[str] = None) -> Optional[Dict]:
+        return self.api.post("/projects/", json={"name": name, "description": description})
+
+    def get_project_sources(self, project_id: int, limit: int = 5000) -> Optional[List[Dict]]:
+        return self.api.get(f"/projects/{project_id}/sources/", params={"limit": limit})
+
+    def get_source(self, source_id: int) -> Optional[Dict]:
+        return self.api.get(f"/sources/{source_id}")
+
+    def create_source(self, project_id: int, title: str, url: Optional[str]) -> Optional[Dict]:
+        return self.api.post(f"/projects/{project_id}/sources/", json={"title": title, "url": url})
+
+    def create_sources_bulk(self, project_id: int, sources: List[Dict]) -> Optional[List[Dict]]:
+        return self.api.post(f"/projects/{project_id}/sources/bulk", json=sources)
+
+    def update_source_content(self, source_id: int, content: str,
+                              validators: Optional[Dict] = None) -> Optional[Dict]:
+        return self.api.put(f"/sources/{source_id}", json={"content": content, **(validators or {})})
+
+    def update_sources_content_bulk(self, updates: List[Dict]) -> Optional[Dict]:
+        return self.api.put("/sources/bulk", json=updates)
+
+    def get_duplicate_clusters(self, project_id: int) -> Optional[List[Dict]]:
+        return self.api.get(f"/projects/{project_id}/duplicates")
+
+    def add_entities(self, source_id: int, entities: List[Dict]) -> Optional[int]:
+        result = self.api.post(f"/sources/{source_id}/entities", json=entities)
+        return result["created"] if result else None
+
+class DatabaseRepository(Repository):
+    """
+    Accesso diretto al database (DATABASE_URL) con le funzioni di app/crud.py: niente
+    serializzazione e round trip HTTP, una sessione per operazione. Pensato per gli script
+    che girano accanto al database; con CACHE_BACKEND=memory la cache del processo API
+    non viene invalidata e le sue risposte possono restare vecchie fino al TTL.
+    """
+    name = "database"
+
+    def __init__(self):
+        # Import qui: il modo api non richiede SQLAlchemy né i modelli dell'applicazione
+        from sqlalchemy import text
+        from app import crud
+        from app.core.database import SessionLocal
+        from app.schemas import project as project_schema, source as source_schema, entity as entity_schema
+
+        self._text = text
+        self.crud = crud
+        self.session_factory = SessionLocal
+        self.project_schema = project_schema
+        self.source_schema = source_schema
+        self.entity_schema = entity_schema
+
+    @contextmanager
+    def _session(self):
+        db = self.session_factory()
+        try:
+            yield db
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _run(self, description: str, operation: Callable):
+        """Esegue l'operazione in una sessione; come APIClient, None in caso di errore"""
+        try:
+            with self._session() as db:
+                return operation(db)
+        except Exception as e:
+            logger.error(f"Database: {description} non riuscito: {e}")
+            return None
+
+    def _source_dict(self, source) -> Dict:
+        return self.source_schema.Source.model_validate(source).model_dump(mode="json")
+
+    def check_health(self) -> bool:
+        return self._run("controllo connessione", lambda db: db.execute(self._text("SELECT 1")).scalar() == 1) or False
+
+    def list_projects(self, limit: int = 2000) -> Optional[List[Dict]]:
+        def load(db):
+            return [
+                {"id": p.id, "name": p.name, "description": p.description,
+                 "created_at": p.created_at.isoformat() if p.created_at else None}
+                for p in self.crud.get_projects(db, limit=limit)
+            ]
+        return self._run("lettura progetti", load)
+
+    def create_project(self, name: str, description: Optional[str] = None) -> Optional[Dict]:
+        project = self.project_schema.ProjectCreate(name=name, description=description)
+        return self._run(
+            f"creazione progetto '{name}'",
+            lambda db: self.crud.create_project(db, project).model_dump(mode="json")
+        )
+
+    def get_project_sources(self, project_id: int, limit: int = 5000) -> Optional[List[Dict]]:
+        return self._run(
+            f"lettura fonti del progetto {project_id}",
+            lambda db: [self._source_dict(s) for s in self.crud.get_sources_for_project(db, project_id, limit=limit)]
+        )
+
+    def get_source(self, source_id: int) -> Optional[Dict]:
+        def load(db):
+            source = self.crud.get_source(db, source_id)
+            return self._source_dict(source) if source is not None else None
+        return self._run(f"lettura fonte {source_id}", load)
+
+    def create_source(self, project_id: int, title: str, url: Optional[str]) -> Optional[Dict]:
+        source = self.source_schema.SourceCreate(title=title, url=url)
+
+        def create(db):
+            if self.crud.get_project(db, project_id) is None:
+                logger.error(f"Database: progetto {project_id} non trovato")
+                return None
+            return self.crud.create_project_source(db, source, project_id).model_dump(mode="json")
+        return self._run(f"creazione fonte '{title}'", create)
+
+    def create_sources_bulk(self, project_id: int, sources: List[Dict]) -> Optional[List[Dict]]:
+        items = [self.source_schema.SourceCreate(**source) for source in sources]
+
+        def create(db):
+            if self.crud.get_project(db, project_id) is None:
+                logger.error(f"Database: progetto {project_id} non trovato")
+                return None
+            return [s.model_dump(mode="json") for s in self.crud.create_project_sources_bulk(db, items, project_id)]
+        return self._run(f"creazione di {len(items)} fonti nel progetto {project_id}", create)
+
+    def update_source_content(self, source_id: int, content: str,
+                              validators: Optional[Dict] = None) -> Optional[Dict]:
+        # Lo schema converte i valori come farebbe l'API (es. fetched_at da stringa ISO a datetime)
+        update = self.source_schema.SourceUpdate(content=content, **(validators or {}))
+
+        def save(db):
+            source = self.crud.update_source_content(
+                db, source_id, update.content, validators=update.dict(exclude={"content"}, exclude_unset=True)
+            )
+            return source.model_dump(mode="json") if source is not None else None
+        return self._run(f"aggiornamento fonte {source_id}", save)
+
+    def update_sources_content_bulk(self, updates: List[Dict]) -> Optional[Dict]:
+        items = [self.source_schema.SourceContentUpdate(**update) for update in updates]
+        return self._run(
+            f"aggiornamento di {len(items)} fonti",
+            lambda db: self.crud.update_sources_content_bulk(db, items).model_dump()
+        )
+
+    def get_duplicate_clusters(self, project_id: int) -> Optional[List[Dict]]:
+        return self._run(
+            f"lettura quasi-duplicati del progetto {project_id}",
+            lambda db: [c.model_dump() for c in self.crud.get_near_duplicate_clusters(db, project_id)]
+        )
+
+    def add_entities(self, source_id: int, entities: List[Dict]) -> Optional[int]:
+        items = [self.entity_schema.EntityCreate(**entity) for entity in entities]
+        return self._run(
+            f"salvataggio entità della fonte {source_id}",
+            lambda db: self.crud.create_source_entities_bulk(db, items, source_id)
+        )
+
+REPOSITORIES = {repository.name: repository for repository in (HttpRepository, DatabaseRepository)}
+
+_repository: Optional[Repository] = None
+
+def create_repository(mode: Optional[str] = None) -> Repository:
+    """Repository per il modo richiesto (default DATA_ACCESS_MODE): 'api' o 'database'"""
+    mode = (mode or config.api.data_access).lower()
+    repository = REPOSITORIES.get(mode)
+    if repository is None:
+        logger.warning(f"Modo di accesso ai dati '{mode}' sconosciuto, uso 'api'")
+        repository = HttpRepository
+    try:
+        return repository()
+    except ImportError as e:
+        logger.warning(f"Accesso diretto al database non disponibile ({e}), uso l'API")
+        return HttpRepository()
+
+def get_repository() -> Repository:
+    """Repository condiviso dal processo, creato al primo utilizzo"""
+    global _repository
+    if _repository is None:
+        _repository = create_repository()
+        logger.debug(f"Accesso ai dati: {_repository.name}")
+    return _repository
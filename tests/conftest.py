@@ -0,0 +1,27 @@
+import os
+import sys
+
+# Gli script sono moduli nella radice del repository; l'applicazione legge DATABASE_URL all'import
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(ROOT, "tests", ".test.db"))
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+import pytest
+
+@pytest.fixture
+def db():
+    """Sessione su un database SQLite di prova con le tabelle dell'applicazione, svuotato a fine test"""
+    from app.core.cache import cache
+    from app.core.database import SessionLocal, engine
+    from app.models import project, source, entity  # noqa: F401 (registra i modelli)
+
+    project.Base.metadata.create_all(engine)
+    cache.clear()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        project.Base.metadata.drop_all(engine)
+        cache.clear()
@@ -0,0 +1,75 @@
+import pytest
+
+from app.core.cache import Cache, RedisBackend
+
+class FakeRedis:
+    """Client Redis minimo per RedisBackend: stringhe e set con scadenza in millisecondi simulati"""
+
+    def __init__(self):
+        self.now = 0
+        self.data = {}
+        self.expires = {}
+
+    def advance(self, ms: int):
+        self.now += ms
+        for key, expires_at in list(self.expires.items()):
+            if expires_at <= self.now:
+                self.data.pop(key, None)
+                del self.expires[key]
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        return []
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, px):
+        self.data[key] = value
+        self.expires[key] = self.now + px
+
+    def sadd(self, key, member):
+        self.data.setdefault(key, set()).add(member)
+
+    def pexpire(self, key, ms, nx=False, gt=False):
+        current = self.expires.get(key)
+        if key not in self.data or (nx and current is not None) or (gt and (current is None or self.now + ms <= current)):
+            return False
+        self.expires[key] = self.now + ms
+        return True
+
+    def pttl(self, key):
+        return self.expires[key] - self.now if key in self.expires else -1
+
+    def smembers(self, key):
+        return set(self.data.get(key, ()))
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+@pytest.fixture
+def redis_cache():
+    client = FakeRedis()
+    return client, Cache(RedisBackend(client=client, prefix="test"))
+
+def test_tag_set_expires_with_longest_member(redis_cache):
+    client, cache = redis_cache
+    cache.get_or_set("lungo", lambda: 1, ttl=60, tags=["projects"])
+    cache.get_or_set("breve", lambda: 2, ttl=5, tags=["projects"])
+    # Un membro più breve non accorcia la scadenza del set
+    assert client.pttl("test:tag:projects") == 60_000
+
+    client.advance(30_000)
+    cache.get_or_set("nuovo", lambda: 3, ttl=60, tags=["projects"])
+    assert client.pttl("test:tag:projects") == 60_000
+
+    client.advance(60_000)
+    assert "test:tag:projects" not in client.data
+
+def test_invalidation_removes_tagged_keys(redis_cache):
+    client, cache = redis_cache
+    cache.get_or_set("progetto:1", lambda: "uno", tags=["project:1"])
+    cache.invalidate("project:1")
+    assert cache.get_or_set("progetto:1", lambda: "due", tags=["project:1"]) == "due"
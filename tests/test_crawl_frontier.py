@@ -0,0 +1,56 @@
+from crawl_frontier import DONE, FAILED, PENDING, CrawlFrontier
+
+SOURCES = [{"id": i, "title": f"fonte {i}", "url": f"http://a.test/{i}", "project_id": 1} for i in range(1, 4)]
+
+def make_frontier(tmp_path, **kwargs):
+    return CrawlFrontier(str(tmp_path / "frontier.db"), **kwargs)
+
+def attempts(frontier, run_id, source_id):
+    with frontier._lock:
+        return frontier._conn.execute(
+            "SELECT attempts FROM frontier WHERE run_id = ? AND source_id = ?", (run_id, source_id)
+        ).fetchone()[0]
+
+def test_defer_does_not_consume_attempts(tmp_path):
+    frontier = make_frontier(tmp_path, max_attempts=2, retry_backoff=0.0)
+    run_id = frontier.create_run(1, SOURCES[:1])
+
+    # Circuito aperto molte più volte di max_attempts: la URL resta in coda
+    for _ in range(5):
+        assert [s["id"] for s in frontier.claim(run_id)] == [1]
+        frontier.defer(run_id, 1, 0.0, "circuito aperto")
+    assert frontier.counts(run_id)[PENDING] == 1
+    assert attempts(frontier, run_id, 1) == 0
+
+    # I fallimenti veri consumano i tentativi
+    frontier.claim(run_id)
+    assert frontier.mark_failed(run_id, 1, "timeout") is True
+    frontier.claim(run_id)
+    assert frontier.mark_failed(run_id, 1, "timeout") is False
+    assert frontier.counts(run_id)[FAILED] == 1
+    frontier.close()
+
+def test_deferred_url_waits_for_its_delay(tmp_path):
+    frontier = make_frontier(tmp_path)
+    run_id = frontier.create_run(1, SOURCES)
+    claimed = frontier.claim(run_id)
+    frontier.defer(run_id, claimed[0]["id"], 60.0)
+    for source in claimed[1:]:
+        frontier.mark_done(run_id, source["id"])
+
+    assert frontier.claim(run_id) == []
+    assert 55 < frontier.next_eligible_in(run_id) <= 60
+    assert frontier.counts(run_id)[DONE] == 2
+    frontier.close()
+
+def test_resume_requeues_in_flight_urls(tmp_path):
+    frontier = make_frontier(tmp_path)
+    run_id = frontier.create_run(1, SOURCES)
+    frontier.claim(run_id, limit=2)
+    frontier.close()
+
+    # Processo terminato con due URL in volo: il run riprende da dove era
+    frontier = make_frontier(tmp_path)
+    assert frontier.resume_run(run_id) == 2
+    assert sorted(s["id"] for s in frontier.claim(run_id)) == [1, 2, 3]
+    frontier.close()
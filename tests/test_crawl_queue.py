@@ -0,0 +1,88 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from sqlalchemy import create_engine, text
+
+from crawl_frontier import DONE, FAILED, IN_FLIGHT, PENDING
+
+# La coda condivisa richiede PostgreSQL: i test girano solo con un database di prova dedicato
+DATABASE_URL = os.getenv("CRAWL_QUEUE_TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="CRAWL_QUEUE_TEST_DATABASE_URL non impostato")
+
+def source(i):
+    return {"id": i, "title": f"fonte {i}", "url": f"http://h{i % 3}.test/{i}", "project_id": 1}
+
+@pytest.fixture
+def make_queue():
+    from crawl_queue import SharedCrawlQueue
+
+    engine = create_engine(DATABASE_URL)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS crawl_queue, crawl_queue_runs, crawl_nodes CASCADE"))
+    engine.dispose()
+
+    queues = []
+
+    def make(**kwargs):
+        queue = SharedCrawlQueue(DATABASE_URL, **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        if not queue._stop.is_set():
+            queue.close()
+
+def attempts(queue, run_id, source_id):
+    with queue.engine.connect() as conn:
+        return conn.execute(
+            text("SELECT attempts FROM crawl_queue WHERE run_id = :run AND source_id = :source"),
+            {"run": run_id, "source": source_id}
+        ).scalar()
+
+def test_expired_lease_is_reclaimed_by_another_node(make_queue):
+    node_a = make_queue(lease_seconds=1.0)
+    node_b = make_queue(lease_seconds=1.0)
+    run_id = node_a.create_run(1, [source(i) for i in range(10)], scope="project:1")
+    assert node_b.create_run(1, [source(i) for i in range(10)], scope="project:1") == run_id
+
+    claimed = [s["id"] for s in node_a.claim(run_id, limit=4)]
+    assert claimed == [0, 1, 2, 3]
+
+    # Il nodo A smette di rinnovare le lease (processo bloccato o terminato)
+    node_a._stop.set()
+    node_a._heartbeat.join()
+    assert [s["id"] for s in node_b.claim(run_id)] == [4, 5, 6, 7, 8, 9]
+    time.sleep(1.5)
+
+    reclaimed = [s["id"] for s in node_b.claim(run_id)]
+    assert reclaimed == claimed
+    # La ripresa non conta come tentativo e l'esito tardivo del nodo A non viene registrato
+    assert all(attempts(node_b, run_id, i) == 0 for i in claimed)
+    node_a.mark_done(run_id, 0)
+    assert node_b.counts(run_id)[IN_FLIGHT] == 10
+
+    for i in range(10):
+        node_b.mark_done(run_id, i)
+    assert node_b.counts(run_id)[DONE] == 10
+    assert node_b.next_eligible_in(run_id) is None
+
+def test_defer_does_not_consume_attempts(make_queue):
+    node = make_queue(max_attempts=2, retry_backoff=0.0)
+    run_id = node.create_run(1, [source(1)])
+
+    for _ in range(5):
+        assert [s["id"] for s in node.claim(run_id)] == [1]
+        assert node.defer(run_id, 1, 0.0, "circuito aperto") is True
+    assert node.counts(run_id)[PENDING] == 1
+    assert attempts(node, run_id, 1) == 0
+
+    node.claim(run_id)
+    assert node.mark_failed(run_id, 1, "timeout") is True
+    node.claim(run_id)
+    assert node.mark_failed(run_id, 1, "timeout") is False
+    assert node.counts(run_id)[FAILED] == 1
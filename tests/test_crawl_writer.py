@@ -0,0 +1,37 @@
+import threading
+
+from crawl_writer import BatchWriter, WriteItem, read_dead_letter
+
+def test_submit_blocks_when_queue_is_full():
+    release = threading.Event()
+    saved = []
+
+    def save_batch(items):
+        release.wait()  # database lento
+        return {"updated": [item.source_id for item in items], "missing": []}
+
+    writer = BatchWriter(save_batch, lambda item, ok, error: saved.append(ok),
+                         batch_size=1, flush_interval=0.01, max_queue=2).start()
+    producer = threading.Thread(target=lambda: [writer.submit(WriteItem(i, "testo")) for i in range(6)])
+    producer.start()
+    producer.join(timeout=0.5)
+    # Un elemento nel salvataggio in corso e due in coda: il produttore attende
+    assert producer.is_alive()
+    assert writer.pending <= 4
+
+    release.set()
+    producer.join(timeout=5)
+    writer.close()
+    assert not producer.is_alive()
+    assert saved == [True] * 6
+
+def test_failed_batches_go_to_dead_letter(tmp_path):
+    path = str(tmp_path / "dead_letter.jsonl")
+    errors = []
+    with BatchWriter(lambda items: None, lambda item, ok, error: errors.append(error),
+                     batch_size=2, max_attempts=2, retry_delay=0, dead_letter_path=path) as writer:
+        for i in range(3):
+            writer.submit(WriteItem(i, f"testo {i}", {"etag": "x"}))
+
+    assert len(errors) == 3 and all(errors)
+    assert [(item.source_id, item.metadata) for item in read_dead_letter(path)] == [(i, {"etag": "x"}) for i in range(3)]
@@ -0,0 +1,31 @@
+from app import crud
+from app.core.database import SessionLocal
+from app.schemas import project as project_schema, source as source_schema
+
+def source_counts():
+    # Lettore concorrente: un'altra sessione, come un'altra richiesta all'API
+    reader = SessionLocal()
+    try:
+        return [summary["source_count"] for summary in crud.get_project_summaries_cached(reader)]
+    finally:
+        reader.close()
+
+def test_tags_are_invalidated_after_commit(db):
+    project_id = crud.create_project(db, project_schema.ProjectCreate(name="cache")).id
+    assert source_counts() == [0]
+
+    crud.create_project_source(db, source_schema.SourceCreate(title="a"), project_id, commit=False)
+    # Prima del commit la cache non viene invalidata: un lettore la riempirebbe con il vecchio stato
+    assert db.info[crud.PENDING_TAGS_KEY] >= {crud.PROJECTS_TAG, crud.project_tag(project_id)}
+    assert source_counts() == [0]
+
+    db.commit()
+    assert crud.PENDING_TAGS_KEY not in db.info
+    assert source_counts() == [1]
+
+def test_rollback_discards_pending_tags(db):
+    project_id = crud.create_project(db, project_schema.ProjectCreate(name="cache")).id
+    crud.create_project_source(db, source_schema.SourceCreate(title="a"), project_id, commit=False)
+    db.rollback()
+    assert crud.PENDING_TAGS_KEY not in db.info
+    assert source_counts() == [0]
@@ -0,0 +1,47 @@
+import time
+
+from host_scheduler import HostReadyQueue, HostScheduler
+
+def slow_robots(delay: float, crawl_delay: int = 1):
+    def fetch(robots_url):
+        time.sleep(delay)
+        return f"User-agent: *\nCrawl-delay: {crawl_delay}\n"
+    return fetch
+
+def test_first_request_respects_crawl_delay():
+    scheduler = HostScheduler(min_interval=0.01, burst=3, robots_fetcher=slow_robots(0.05, crawl_delay=1))
+    queue = HostReadyQueue(scheduler)
+    for i in range(2):
+        queue.push(f"http://a.test/{i}", i)
+
+    popped = []
+    while queue:
+        queue.pop()
+        popped.append(time.monotonic())
+
+    gaps = [b - a for a, b in zip(popped, popped[1:])]
+    assert all(gap >= 0.9 for gap in gaps), gaps
+
+def test_robots_loading_does_not_block_other_hosts():
+    slow_hosts = {f"slow{i}.test" for i in range(4)}
+
+    def fetch(robots_url):
+        if any(host in robots_url for host in slow_hosts):
+            time.sleep(0.5)
+        return ""
+
+    scheduler = HostScheduler(min_interval=0.0, robots_fetcher=fetch)
+    queue = HostReadyQueue(scheduler)
+    for host in sorted(slow_hosts):
+        queue.push(f"http://{host}/", host)
+    queue.push("http://fast.test/", "fast.test")
+
+    start = time.monotonic()
+    first = queue.pop()
+    assert first == "fast.test"
+    assert time.monotonic() - start < 0.3
+
+    # Le letture in background procedono in parallelo: gli host lenti seguono dopo una sola attesa
+    rest = [queue.pop() for _ in range(len(slow_hosts))]
+    assert set(rest) == slow_hosts
+    assert time.monotonic() - start < 1.5
@@ -0,0 +1,96 @@
+import random
+
+from sqlalchemy import select, update
+
+from app import crud
+from app.models import source as source_model
+from app.schemas import project as project_schema, source as source_schema
+from app.services import near_duplicates
+
+WORDS = ("archivio comune delibera giunta bilancio consiglio regione provincia verbale seduta "
+         "ordinanza sindaco bando gara appalto lavori pubblici strada scuola ospedale").split()
+
+def article(seed: int, length: int = 120) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) + str(rng.randrange(50)) for _ in range(length))
+
+def modified(text: str, changes: int, offset: int = 10) -> str:
+    words = text.split()
+    for i in range(changes):
+        words[offset + i * 30] = f"modificata{i}"
+    return " ".join(words)
+
+def make_sources(db, count: int):
+    project_id = crud.create_project(db, project_schema.ProjectCreate(name="quasi-duplicati")).id
+    sources = crud.create_project_sources_bulk(
+        db, [source_schema.SourceCreate(title=f"fonte {i}", url=f"https://example.org/{i}") for i in range(count)], project_id
+    )
+    return [source.id for source in sources]
+
+def band_rows(db, source_id: int) -> int:
+    Band = source_model.SourceSimhashBand
+    return len(db.execute(select(Band.band).where(Band.source_id == source_id)).all())
+
+def test_probes_cover_max_distance():
+    rng = random.Random(7)
+    for _ in range(500):
+        signature = rng.getrandbits(64)
+        other = signature
+        for bit in rng.sample(range(64), rng.randint(0, near_duplicates.MAX_DISTANCE)):
+            other ^= 1 << bit
+        assert set(near_duplicates.probes(signature)) & set(near_duplicates.bands(other))
+
+def test_modified_copy_is_detected(db):
+    original_id, copy_id, other_id = make_sources(db, 3)
+    text = article(1)
+    copy = modified(text, 2)
+    assert near_duplicates.hamming(near_duplicates.simhash(text), near_duplicates.simhash(copy)) <= near_duplicates.MAX_DISTANCE
+
+    assert crud.update_source_content(db, original_id, text).duplicate_of is None
+    assert crud.update_source_content(db, copy_id, copy).duplicate_of == original_id
+    assert crud.update_source_content(db, other_id, article(2)).duplicate_of is None
+    # Solo gli originali entrano nell'indice
+    assert [band_rows(db, source_id) for source_id in (original_id, copy_id, other_id)] == [near_duplicates.BANDS, 0, near_duplicates.BANDS]
+
+def test_modified_copy_in_bulk_batch(db):
+    original_id, copy_id = make_sources(db, 2)
+    text = article(3)
+    result = crud.update_sources_content_bulk(db, [
+        source_schema.SourceContentUpdate(id=original_id, content=text),
+        source_schema.SourceContentUpdate(id=copy_id, content=modified(text, 1)),
+    ])
+    assert result.duplicates == {copy_id: original_id}
+
+def test_deleting_original_promotes_copy(db):
+    original_id, first_copy, second_copy = make_sources(db, 3)
+    text = article(4)
+    crud.update_source_content(db, original_id, text)
+    crud.update_source_content(db, first_copy, modified(text, 1))
+    crud.update_source_content(db, second_copy, modified(text, 1, offset=70))
+
+    assert crud.delete_source(db, original_id).id == original_id
+    db.expire_all()
+    assert crud.get_source(db, first_copy).duplicate_of is None
+    assert band_rows(db, first_copy) == near_duplicates.BANDS
+    assert crud.get_source(db, second_copy).duplicate_of == first_copy
+
+def test_orphans_are_reindexed(db):
+    original_id, first_copy, second_copy = make_sources(db, 3)
+    text = article(5)
+    crud.update_source_content(db, original_id, text)
+    crud.update_source_content(db, first_copy, modified(text, 1))
+    crud.update_source_content(db, second_copy, modified(text, 1, offset=70))
+
+    # Originale cancellato direttamente nel database: ON DELETE SET NULL lascia le copie senza originale
+    Source = source_model.Source
+    db.execute(update(Source).where(Source.duplicate_of == original_id).values(duplicate_of=None))
+    db.execute(source_model.SourceSimhashBand.__table__.delete().where(
+        source_model.SourceSimhashBand.source_id == original_id))
+    db.execute(Source.__table__.delete().where(Source.id == original_id))
+    db.commit()
+
+    assert near_duplicates.reindex_orphans(db) == 2
+    db.commit()
+    assert band_rows(db, first_copy) == near_duplicates.BANDS
+    assert crud.get_source(db, second_copy).duplicate_of == first_copy
+    assert near_duplicates.reindex_orphans(db) == 0
@@ -0,0 +1,55 @@
+from app import crud
+from app.core.cache import cache
+from app.models.project import ProjectDeletionJob
+from app.schemas import project as project_schema, source as source_schema
+from app.services import project_deletion
+
+def make_project(db, sources: int) -> int:
+    project_id = crud.create_project(db, project_schema.ProjectCreate(name="da cancellare")).id
+    crud.create_project_sources_bulk(
+        db, [source_schema.SourceCreate(title=f"fonte {i}") for i in range(sources)], project_id
+    )
+    return project_id
+
+def test_status_survives_cache_pressure(db, monkeypatch):
+    monkeypatch.setattr(project_deletion, "DELETE_BATCH_PAUSE", 0)
+    project_id = make_project(db, 25)
+
+    job = project_deletion.start_deletion_job(db, project_id, 25)
+    assert job.status == "pending"
+
+    # Il traffico normale riempie (e svuota) la cache delle letture
+    for i in range(cache.backend.max_entries * 2):
+        cache.get_or_set(f"search:view:{i}", lambda: i, tags=[crud.SEARCH_TAG])
+    cache.clear()
+
+    assert project_deletion.get_deletion_status(db, project_id).status == "pending"
+    # Un secondo worker non può avviare la stessa cancellazione
+    assert project_deletion.start_deletion_job(db, project_id, 25) is None
+
+    project_deletion.run_deletion_job(project_id, batch_size=10)
+    db.expire_all()
+    status = project_deletion.get_deletion_status(db, project_id)
+    assert (status.status, status.deleted_sources, status.progress) == ("completed", 25, 1.0)
+    assert crud.get_project(db, project_id) is None
+
+def test_expired_lease_allows_restart(db):
+    project_id = make_project(db, 3)
+    assert project_deletion.start_deletion_job(db, project_id, 3) is not None
+
+    # Worker terminato durante la cancellazione: la lease scade
+    job = db.get(ProjectDeletionJob, project_id)
+    job.status = "running"
+    job.lease_expires_at = job.lease_expires_at.replace(year=2000)
+    db.commit()
+
+    assert project_deletion.start_deletion_job(db, project_id, 3).status == "pending"
+
+def test_each_batch_refreshes_cached_counts(db):
+    project_id = make_project(db, 5)
+    summaries = lambda: {p["id"]: p["source_count"] for p in crud.get_project_summaries_cached(db)}
+    assert summaries()[project_id] == 5
+
+    assert crud.delete_project_sources_batch(db, project_id, batch_size=2) == 2
+    assert summaries()[project_id] == 3
+    assert crud.get_dashboard_stats(db)["total_sources"] == 3
@@ -0,0 +1,31 @@
+import threading
+
+from recrawl_scheduler import RecrawlScheduler
+
+def test_concurrent_due_never_exceeds_daily_budget(tmp_path):
+    path = str(tmp_path / "schedule.db")
+    # Due processi sullo stesso file, ciascuno con più thread
+    schedulers = [RecrawlScheduler(path, daily_budget=25) for _ in range(2)]
+    schedulers[0].sync([{"id": i, "project_id": 1, "url": f"https://example.org/{i}"} for i in range(200)])
+
+    chosen = []
+    lock = threading.Lock()
+    start = threading.Barrier(8)
+
+    def worker(scheduler):
+        start.wait()
+        for _ in range(5):
+            ids = scheduler.due(limit=3)
+            with lock:
+                chosen.extend(ids)
+
+    threads = [threading.Thread(target=worker, args=(schedulers[i % 2],)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(chosen) == 25
+    assert all(scheduler.budget_left() == 0 for scheduler in schedulers)
+    for scheduler in schedulers:
+        scheduler.close()
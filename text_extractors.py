@@ -0,0 +1,256 @@
+# text_extractors.py
+import logging
+import threading
+from typing import Dict, List, Optional, Type
+
+from bs4 import BeautifulSoup
+from utils import clean_text
+from config import config
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+logger = logging.getLogger(__name__)
+
+# Elementi senza contenuto utile, rimossi prima di estrarre il testo
+SKIP_TAGS = ("script", "style", "nav", "footer", "header", "aside", "iframe")
+
+# Come BeautifulSoup: fuori da pre/textarea un testo di soli spazi ASCII diventa "\n" o " "
+PRESERVE_WHITESPACE_TAGS = frozenset(("pre", "textarea"))
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+# Separatori di riga riconosciuti da str.splitlines(), usata da clean_text
+LINE_BREAKS = "\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029"
+
+# Il parser a eventi riceve l'HTML a blocchi di questa dimensione (caratteri)
+FEED_CHUNK_SIZE = 64 * 1024
+
+def _collapse_whitespace(text: str) -> str:
+    return "\n" if "\n" in text else " "
+
+class TextExtractor:
+    """Estrae da una pagina HTML il testo pulito (semantica di get_text() + clean_text)"""
+    name = ""
+
+    @classmethod
+    def available(cls) -> bool:
+        return True
+
+    def extract(self, html: str) -> str:
+        raise NotImplementedError
+
+class BeautifulSoupExtractor(TextExtractor):
+    """Percorso originale: albero BeautifulSoup completo, decompose() e get_text()"""
+    name = "bs4"
+
+    def extract(self, html: str) -> str:
+        soup = BeautifulSoup(html, 'lxml')
+        for element in soup(list(SKIP_TAGS)):
+            element.decompose()
+        return clean_text(soup.get_text())
+
+class LxmlExtractor(TextExtractor):
+    """
+    Albero lxml.html senza il modello a oggetti di BeautifulSoup. Unica differenza nota:
+    l'albero di libxml2 scarta l'eventuale testo dopo </html>, che BeautifulSoup conserva.
+    """
+    name = "lxml"
+
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def parser(self):
+        # Un parser per thread; si passa da bytes perché lxml rifiuta le stringhe con dichiarazione di encoding
+        if not hasattr(self._local, "parser"):
+            self._local.parser = lxml.html.HTMLParser(encoding="utf-8")
+        return self._local.parser
+
+    @classmethod
+    def available(cls) -> bool:
+        return lxml is not None
+
+    def extract(self, html: str) -> str:
+        try:
+            tree = lxml.html.document_fromstring(html.encode("utf-8", errors="replace"), parser=self.parser)
+        except etree.ParserError:
+            return ""  # Documento vuoto
+        etree.strip_elements(tree, *SKIP_TAGS, with_tail=False)
+        
+        parts = []
+        preserve = 0
+        for event, element in etree.iterwalk(tree, events=("start", "end", "comment", "pi")):
+            if event == "start":
+                if element.tag in PRESERVE_WHITESPACE_TAGS:
+                    preserve += 1
+                text = element.text
+            elif event == "end":
+                if element.tag in PRESERVE_WHITESPACE_TAGS:
+                    preserve -= 1
+                text = element.tail
+            else:
+                # Commenti e processing instruction: conta solo il testo che li segue
+                text = element.tail
+            if text:
+                if not preserve and not text.strip(ASCII_SPACES):
+                    text = _collapse_whitespace(text)
+                parts.append(text)
+        return clean_text("".join(parts))
+
+class SelectolaxExtractor(TextExtractor):
+    """Parser C Lexbor tramite selectolax (pacchetto opzionale)"""
+    name = "selectolax"
+
+    @classmethod
+    def available(cls) -> bool:
+        return LexborHTMLParser is not None
+
+    def extract(self, html: str) -> str:
+        tree = LexborHTMLParser(html)
+        tree.strip_tags(list(SKIP_TAGS))
+        if tree.root is None:
+            return ""
+        
+        parts = []
+        for node in tree.root.traverse(include_text=True):
+            if node.tag != "-text":
+                continue
+            text = node.text_content
+            if text and not text.strip(ASCII_SPACES) and not self._in_preserved(node):
+                text = _collapse_whitespace(text)
+            parts.append(text)
+        return clean_text("".join(parts))
+    
+    @staticmethod
+    def _in_preserved(node) -> bool:
+        parent = node.parent
+        while parent is not None:
+            if parent.tag in PRESERVE_WHITESPACE_TAGS:
+                return True
+            parent = parent.parent
+        return False
+
+class _StreamingTextTarget:
+    """
+    Target per il parser a eventi di lxml: nessun albero in memoria, solo il testo in uscita.
+    Ripete le regole di BeautifulSoup (testi consecutivi uniti fino al prossimo tag, spazi
+    collassati fuori da pre/textarea) e applica clean_text riga per riga mentre il testo arriva.
+    """
+
+    def __init__(self):
+        self._skip_depth = 0
+        self._preserve_depth = 0
+        self._pending: List[str] = []
+        self._line: List[str] = []
+        self._chunks: List[str] = []
+
+    # --- eventi del parser ---
+
+    def start(self, tag, attrib):
+        self._end_data()
+        if self._skip_depth or tag in SKIP_TAGS:
+            self._skip_depth += 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth += 1
+
+    def end(self, tag):
+        self._end_data()
+        if self._skip_depth:
+            self._skip_depth -= 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth -= 1
+
+    def data(self, data):
+        if not self._skip_depth:
+            self._pending.append(data)
+
+    def comment(self, text):
+        self._end_data()
+
+    def pi(self, target, data):
+        self._end_data()
+
+    def doctype(self, *args):
+        self._end_data()
+
+    def close(self) -> str:
+        self._end_data()
+        self._end_line()
+        return "\n".join(self._chunks)
+
+    # --- clean_text in linea ---
+
+    def _end_data(self):
+        if not self._pending:
+            return
+        text = "".join(self._pending)
+        self._pending = []
+        if not self._preserve_depth and not text.strip(ASCII_SPACES):
+            text = _collapse_whitespace(text)
+
+        pieces = text.splitlines()
+        ends_with_break = text[-1] in LINE_BREAKS
+        for i, piece in enumerate(pieces):
+            self._line.append(piece)
+            if i < len(pieces) - 1 or ends_with_break:
+                self._end_line()
+
+    def _end_line(self):
+        line = "".join(self._line).strip()
+        self._line = []
+        for phrase in line.split("  "):
+            phrase = phrase.strip()
+            if phrase:
+                self._chunks.append(phrase)
+
+class StreamingExtractor(TextExtractor):
+    """
+    Parser a eventi di lxml (stesso tokenizer di BeautifulSoup+lxml) senza costruire il DOM:
+    la memoria dipende dal testo estratto, non dalla dimensione della pagina.
+    """
+    name = "stream"
+
+    @classmethod
+    def available(cls) -> bool:
+        return lxml is not None
+
+    def extract(self, html: str) -> str:
+        parser = etree.HTMLParser(target=_StreamingTextTarget(), encoding="utf-8")
+        for start in range(0, len(html), FEED_CHUNK_SIZE):
+            parser.feed(html[start:start + FEED_CHUNK_SIZE].encode("utf-8", errors="replace"))
+        try:
+            return parser.close()
+        except etree.XMLSyntaxError:
+            return ""  # Documento vuoto
+
+EXTRACTORS: Dict[str, Type[TextExtractor]] = {
+    extractor.name: extractor
+    for extractor in (BeautifulSoupExtractor, LxmlExtractor, SelectolaxExtractor, StreamingExtractor)
+}
+
+# Ordine di preferenza per "auto", dal più veloce (vedi benchmark_extractors.py): stream
+# costa un po' di velocità in cambio della memoria, quindi va scelto esplicitamente per le pagine enormi
+AUTO_ORDER = ("selectolax", "lxml", "stream", "bs4")
+
+def available_extractors() -> List[str]:
+    return [name for name, extractor in EXTRACTORS.items() if extractor.available()]
+
+def get_extractor(name: Optional[str] = None) -> TextExtractor:
+    """Crea l'estrattore richiesto (default CRAWLER_EXTRACTOR); 'auto' sceglie il più veloce installato"""
+    name = (name or config.crawler.extractor).lower()
+    if name == "auto":
+        name = next(n for n in AUTO_ORDER if EXTRACTORS[n].available())
+    extractor = EXTRACTORS.get(name)
+    if extractor is None or not extractor.available():
+        logger.warning(f"Estrattore '{name}' non disponibile, uso 'bs4'")
+        extractor = BeautifulSoupExtractor
+    logger.debug(f"Estrattore di testo: {extractor.name}")
+    return extractor()
@@ -1,15 +1,66 @@
 # utils.py
+import re
 import time
+import zlib
+import codecs
+import hashlib
+import sqlite3
+import threading
 import requests
 import logging
-from typing import Optional, Dict, Any, Callable
+from dataclasses import dataclass, replace
+from typing import Optional, Dict, Any, Callable, Iterable, List, Tuple
 from functools import wraps
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, quote, unquote
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from config import config
+from host_scheduler import HostScheduler
+from circuit_breaker import HostCircuitBreaker
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 logger = logging.getLogger(__name__)
 
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Download in streaming: blocchi letti e prefisso esaminato per trovare il charset
+READ_CHUNK_SIZE = 64 * 1024
+ENCODING_SNIFF_BYTES = 4096
+TEXT_CONTENT_TYPES = ("application/xhtml+xml", "application/xml")
+
+_CHARSET_HEADER_RE = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.I)
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?([\w.:-]+)', re.I)
+_BOMS = ((codecs.BOM_UTF8, "utf-8"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+
+# Esiti di un download che indicano un server sovraccarico: il crawler rallenta
+OVERLOAD_ERRORS = frozenset(("timeout", "http_429", "http_5xx"))
+
+# Redirect che il server dichiara definitivi: la URL salvata può essere sostituita
+PERMANENT_REDIRECT_STATUSES = frozenset((301, 308))
+MAX_REDIRECT_HOPS = 10
+
+# Parametri di query che non cambiano la pagina (tracking di campagne e click)
+TRACKING_PARAMS = frozenset((
+    "gclid", "dclid", "fbclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid", "_ga", "_gl", "ref_src"
+))
+TRACKING_PARAM_PREFIXES = ("utm_",)
+
+# Cache HTTP su disco: refresh-if-stale usa le risposte entro il TTL e poi rivalida,
+# offline riproduce solo la cache, refresh riscarica sempre e riscrive la cache
+HTTP_CACHE_MODES = ("off", "refresh-if-stale", "offline", "refresh")
+# Fallimenti che un nuovo download ripeterebbe identici: anche questi vengono riprodotti
+CACHEABLE_FAILURES = frozenset(("non_text", "too_large"))
+CACHEABLE_FAILURE_STATUSES = frozenset((404, 410))
+
 class APIClient:
     """Client API con retry automatico e gestione errori avanzata"""
     
@@ -31,6 +82,12 @@ class APIClient:
         
         # Timeout di default
         self.session.timeout = config.api.timeout
+        
+        # Trasporto binario: msgpack se disponibile, JSON come fallback
+        self.use_msgpack = config.api.use_msgpack and msgpack is not None
+        self.compressor = zstandard.ZstdCompressor(level=3) if config.api.compress_requests and zstandard else None
+        if self.use_msgpack:
+            self.session.headers.update({"Accept": f"{MSGPACK_MEDIA_TYPE}, application/json;q=0.9"})
     
     def get(self, endpoint: str, **kwargs) -> Optional[Dict[Any, Any]]:
         """GET request con gestione errori"""
@@ -48,20 +105,40 @@ class APIClient:
         """DELETE request con gestione errori"""
         return self._request("DELETE", endpoint, **kwargs)
     
+    def _encode_body(self, kwargs: Dict[str, Any]):
+        """Serializza il parametro json in msgpack e comprime i body grandi con zstd"""
+        if "json" not in kwargs or not self.use_msgpack:
+            return
+        headers = dict(kwargs.pop("headers", None) or {})
+        body = msgpack.packb(kwargs.pop("json"), use_bin_type=True)
+        headers["Content-Type"] = MSGPACK_MEDIA_TYPE
+        if self.compressor is not None and len(body) >= config.api.compression_min_bytes:
+            body = self.compressor.compress(body)
+            headers["Content-Encoding"] = "zstd"
+        kwargs["data"] = body
+        kwargs["headers"] = headers
+    
+    def _decode_body(self, response: requests.Response) -> Optional[Dict[Any, Any]]:
+        content_type = response.headers.get("Content-Type", "")
+        if msgpack is not None and content_type.startswith(MSGPACK_MEDIA_TYPE):
+            return msgpack.unpackb(response.content, raw=False)
+        
+        # Prova a decodificare JSON, altrimenti ritorna il testo
+        try:
+            return response.json()
+        except ValueError:
+            return {"text": response.text, "status_code": response.status_code}
+    
     def _request(self, method: str, endpoint: str, **kwargs) -> Optional[Dict[Any, Any]]:
         """Metodo interno per gestire le richieste"""
         url = f"{self.base_url}{endpoint}"
+        self._encode_body(kwargs)
         
         try:
             logger.debug(f"API {method} request to {url}")
             response = self.session.request(method, url, **kwargs)
             response.raise_for_status()
-            
-            # Prova a decodificare JSON, altrimenti ritorna il testo
-            try:
-                return response.json()
-            except ValueError:
-                return {"text": response.text, "status_code": response.status_code}
+            return self._decode_body(response)
                 
         except requests.exceptions.RequestException as e:
             logger.error(f"API {method} request failed for {url}: {e}")
@@ -78,6 +155,124 @@ class APIClient:
         except:
             return False
 
+@dataclass
+class FetchResult:
+    """Esito di un download con i validatori HTTP per le richieste condizionali"""
+    url: str
+    status_code: Optional[int]
+    content: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    error: Optional[str] = None  # categoria del fallimento (vedi FetchEvent), None se riuscito
+    retry_after: Optional[float] = None  # circuito aperto: secondi alla prossima richiesta di prova
+    size: int = 0  # byte del body scaricati
+    moved_to: Optional[str] = None  # nuova URL della pagina (redirect 301/308), da salvare al posto della vecchia
+    from_cache: bool = False  # risposta riprodotta dalla cache HTTP, senza richiesta di rete
+    
+    @property
+    def not_modified(self) -> bool:
+        return self.status_code == 304
+    
+    @classmethod
+    def failed(cls, url: str, status_code: Optional[int], error: str) -> "FetchResult":
+        return cls(url=url, status_code=status_code, error=error)
+
+@dataclass
+class FetchEvent:
+    """Un download concluso, notificato agli osservatori di WebScraper (concorrenza adattiva, metriche)"""
+    url: str
+    status_code: Optional[int]
+    elapsed: float
+    error: Optional[str] = None  # timeout, connection, http_429, http_5xx, http_4xx, non_text, too_large,
+                                 # circuit_open, error
+    size: int = 0  # byte del body scaricati
+    
+    @property
+    def overloaded(self) -> bool:
+        return self.error in OVERLOAD_ERRORS
+
+def http_error_kind(status_code: int) -> str:
+    if status_code == 429:
+        return "http_429"
+    return "http_5xx" if status_code >= 500 else "http_4xx"
+
+def classify_fetch_error(error: Exception) -> str:
+    """Categoria di un errore di requests, per distinguere il sovraccarico dagli altri fallimenti"""
+    if isinstance(error, requests.exceptions.Timeout):
+        return "timeout"
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return http_error_kind(error.response.status_code)
+    if isinstance(error, requests.exceptions.RetryError):
+        # Retry di urllib3 esauriti su uno status di status_forcelist (429 o 5xx)
+        return "http_429" if "429" in str(error) else "http_5xx"
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return "connection"
+    return "error"
+
+def conditional_headers(etag: Optional[str] = None, last_modified: Optional[str] = None) -> Dict[str, str]:
+    """Header If-None-Match / If-Modified-Since a partire dai validatori salvati"""
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+def content_hash(content: str) -> str:
+    """Hash del contenuto scaricato, per riconoscere le pagine invariate senza validatori HTTP"""
+    return hashlib.sha256(content.encode('utf-8', errors='replace')).hexdigest()
+
+def is_text_content_type(content_type: Optional[str]) -> bool:
+    """True per HTML/testo; senza Content-Type si tenta comunque il download"""
+    if not content_type:
+        return True
+    media_type = content_type.split(";")[0].strip().lower()
+    return media_type.startswith("text/") or media_type in TEXT_CONTENT_TYPES
+
+def _valid_encoding(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    try:
+        return codecs.lookup(name.decode("ascii", "ignore") if isinstance(name, bytes) else name).name
+    except LookupError:
+        return None
+
+def detect_encoding(content_type: Optional[str], prefix: bytes) -> str:
+    """
+    Charset di una pagina: BOM, poi charset dell'header, poi <meta> nei primi
+    ENCODING_SNIFF_BYTES byte; se non dichiarato, utf-8 se il prefisso è utf-8 valido.
+    """
+    for bom, encoding in _BOMS:
+        if prefix.startswith(bom):
+            return encoding
+    
+    header_match = _CHARSET_HEADER_RE.search(content_type or "")
+    encoding = _valid_encoding(header_match.group(1)) if header_match else None
+    if encoding:
+        return encoding
+    
+    sniff = prefix[:ENCODING_SNIFF_BYTES]
+    meta_match = _META_CHARSET_RE.search(sniff)
+    encoding = _valid_encoding(meta_match.group(1)) if meta_match else None
+    if encoding:
+        return encoding
+    
+    try:
+        # Un carattere multibyte può essere tagliato a fine prefisso
+        codecs.getincrementaldecoder("utf-8")().decode(sniff)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+def read_capped(chunks: Iterable[bytes], max_length: int) -> tuple:
+    """Legge i blocchi fino a max_length byte; ritorna (body, troncato)"""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= max_length:
+            return bytes(buffer[:max_length]), True
+    return bytes(buffer), False
+
 class WebScraper:
     """Scraper web con retry automatico e rate limiting"""
     
@@ -97,47 +292,237 @@ class WebScraper:
         self.session.mount("http://", adapter)
         self.session.mount("https://", adapter)
         
-        self.last_request_time = 0
+        self.host_scheduler = HostScheduler(
+            min_interval=config.scraping.rate_limit_delay,
+            burst=config.scraping.host_burst,
+            user_agent=config.scraping.user_agent,
+            robots_fetcher=self._fetch_robots if config.scraping.respect_crawl_delay else None,
+            adaptive=config.crawler.adaptive_concurrency
+        )
+        
+        # Host che non rispondono: dopo N timeout/errori di connessione le loro URL falliscono subito
+        self.circuit_breaker = HostCircuitBreaker(
+            threshold=config.scraping.breaker_threshold,
+            cooldown=config.scraping.breaker_cooldown
+        )
+        
+        # Osservatori dei download (es. il controllo di concorrenza del crawler)
+        self.fetch_listeners: List[Callable[[FetchEvent], None]] = []
+        
+        # Redirect permanenti già visti: le URL vecchie vanno subito alla destinazione
+        self.redirects = RedirectMap(config.scraping.redirect_map_path) if config.scraping.redirect_map_path else None
+        
+        # Cache delle risposte su disco per sviluppo e run ripetuti (SCRAPING_HTTP_CACHE_MODE)
+        self.http_cache = create_http_cache()
+    
+    def add_fetch_listener(self, listener: Callable[[FetchEvent], None]):
+        self.fetch_listeners.append(listener)
+    
+    def remove_fetch_listener(self, listener: Callable[[FetchEvent], None]):
+        if listener in self.fetch_listeners:
+            self.fetch_listeners.remove(listener)
+    
+    def notify_fetch(self, event: FetchEvent):
+        """Circuit breaker e back-off per host, poi gli osservatori (usato anche dal motore async)"""
+        self.circuit_breaker.record(event.url, event.error)
+        self.host_scheduler.record_outcome(event.url, event.overloaded)
+        for listener in list(self.fetch_listeners):
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"Errore in un osservatore dei download: {e}")
+    
+    def _fetch_robots(self, robots_url: str) -> Optional[str]:
+        """Scarica robots.txt senza retry: se manca non c'è nessun Crawl-delay da rispettare"""
+        try:
+            response = requests.get(robots_url, timeout=5, headers={'User-Agent': config.scraping.user_agent})
+            if response.status_code == 200:
+                return response.text
+        except requests.exceptions.RequestException as e:
+            logger.debug(f"robots.txt non disponibile ({robots_url}): {e}")
+        return None
+    
+    def scrape_url(self, url: str, wait: bool = True) -> Optional[str]:
+        """
+        Scrape una URL con rate limiting per host e gestione errori.
+        wait=False se lo slot dell'host è già stato prenotato (es. da HostReadyQueue).
+        """
+        return self.fetch(url, wait=wait).content
+    
+    def resolve_redirect(self, url: str) -> Optional[str]:
+        """Destinazione nota di una URL spostata in modo permanente (None se non è spostata)"""
+        return self.redirects.resolve(url) if self.redirects is not None else None
+    
+    def scheduling_url(self, url: str) -> str:
+        """
+        URL che fetch() scaricherà davvero (la destinazione di un redirect permanente noto): è su
+        questa che vanno prenotati gli slot e letto robots.txt, perché l'host può essere diverso
+        """
+        return self.resolve_redirect(url) or url
+    
+    def remember_redirects(self, hops: List[Tuple[int, str]], final_url: str) -> Optional[str]:
+        """
+        Registra i redirect permanenti all'inizio della catena (status, URL) di un download e
+        ritorna la URL a cui portano (None se il primo redirect non è permanente)
+        """
+        targets = [url for _, url in hops[1:]] + [final_url]
+        moved_to = None
+        for (status, url), target in zip(hops, targets):
+            if status not in PERMANENT_REDIRECT_STATUSES:
+                break
+            if self.redirects is not None:
+                self.redirects.add(url, target)
+            moved_to = target
+        return moved_to
+    
+    def serves_from_cache(self, url: str) -> bool:
+        """True se fetch() risponderà per la URL senza rete: i crawler non attendono il rate limit dell'host"""
+        if self.http_cache is None:
+            return False
+        return self.http_cache.answers(self.resolve_redirect(url) or url)
+    
+    def cache_lookup(self, url: str, etag: Optional[str] = None,
+                     last_modified: Optional[str] = None) -> Tuple[Optional[FetchResult], Optional["CachedResponse"]]:
+        """
+        Risposta dalla cache HTTP, se il modo lo consente, e la voce salvata per la URL.
+        Senza risultato la richiesta va in rete (condizionale con i validatori della voce).
+        """
+        if self.http_cache is None:
+            return None, None
+        entry = self.http_cache.get(url)
+        if self.http_cache.mode == "offline":
+            if entry is None:
+                self.http_cache.count("misses")
+                logger.debug(f"Cache HTTP (offline): {url} non presente")
+                return FetchResult.failed(url, None, "cache_miss"), None
+        elif entry is None or not self.http_cache.fresh(entry) or self.http_cache.mode == "refresh":
+            self.http_cache.count("misses")
+            return None, entry
+        self.http_cache.count("hits")
+        return entry.to_result(url, etag, last_modified), entry
     
-    def scrape_url(self, url: str) -> Optional[str]:
-        """Scrape una URL con rate limiting e gestione errori"""
-        # Rate limiting
-        time_since_last = time.time() - self.last_request_time
-        if time_since_last < config.scraping.rate_limit_delay:
-            sleep_time = config.scraping.rate_limit_delay - time_since_last
-            logger.debug(f"Rate limiting: attendo {sleep_time:.2f}s")
-            time.sleep(sleep_time)
+    def cache_response(self, url: str, result: FetchResult, entry: Optional["CachedResponse"],
+                       etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchResult:
+        """
+        Aggiorna la cache con l'esito di un download. Un 304 ottenuto con i validatori della voce
+        (il chiamante non ne aveva) rinnova la voce e ne restituisce il contenuto.
+        """
+        if self.http_cache is None:
+            return result
+        if result.not_modified:
+            if entry is None:
+                return result
+            self.http_cache.touch(url)
+            self.http_cache.count("revalidated")
+            if etag or last_modified:
+                return result
+            revived = entry.to_result(url)
+            revived.moved_to = result.moved_to or revived.moved_to
+            return revived
+        self.http_cache.store(url, result)
+        if result.moved_to:
+            self.http_cache.store(result.moved_to, replace(result, moved_to=None))
+        return result
+    
+    def circuit_open_result(self, url: str) -> FetchResult:
+        """Esito immediato per un host con il circuito aperto"""
+        logger.debug(f"Circuito aperto, richiesta non inviata: {url}")
+        result = FetchResult.failed(url, None, "circuit_open")
+        result.retry_after = self.circuit_breaker.retry_after(url)
+        return result
+    
+    def fetch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+              wait: bool = True) -> FetchResult:
+        """
+        Scarica una URL restituendo contenuto e validatori. Con etag/last_modified la richiesta
+        è condizionale: se la pagina non è cambiata il server risponde 304 senza body.
+        Se il download fallisce il risultato non ha contenuto e `error` ne indica il motivo.
+        Una URL spostata in modo permanente viene scaricata direttamente dalla destinazione
+        (moved_to del risultato): rate limit e robots.txt sono quelli del suo host, e con
+        wait=False il chiamante deve aver prenotato lo slot di scheduling_url(url).
+        """
+        target = self.resolve_redirect(url)
+        if target is not None:
+            logger.debug(f"Redirect permanente noto: {url} -> {target}")
+            url = target
+        
+        cached, entry = self.cache_lookup(url, etag, last_modified)
+        if cached is not None:
+            cached.moved_to = cached.moved_to or target
+            return cached
+        
+        if not self.circuit_breaker.allow(url):
+            return self.circuit_open_result(url)
+        
+        self.host_scheduler.ensure_robots(url)
+        if wait:
+            self.host_scheduler.wait(url)
+        
+        start = time.monotonic()
+        if entry is not None and not (etag or last_modified):
+            result = self._get(url, entry.etag, entry.last_modified)
+        else:
+            result = self._get(url, etag, last_modified)
+        result = self.cache_response(url, result, entry, etag, last_modified)
+        if result.moved_to is None:
+            result.moved_to = target
+        self.notify_fetch(FetchEvent(url=url, status_code=result.status_code, elapsed=time.monotonic() - start,
+                                     error=result.error, size=result.size))
+        return result
+    
+    def _get(self, url: str, etag: Optional[str], last_modified: Optional[str]) -> FetchResult:
+        max_length = config.scraping.max_content_length
         
         try:
             logger.info(f"Scraping URL: {url}")
-            response = self.session.get(
+            # Il context manager chiude la connessione anche quando il body non viene letto
+            with self.session.get(
                 url, 
                 timeout=config.scraping.timeout,
-                stream=True
-            )
-            response.raise_for_status()
-            
-            # Controlla la dimensione del contenuto
-            content_length = response.headers.get('content-length')
-            if content_length and int(content_length) > config.scraping.max_content_length:
-                logger.warning(f"Contenuto troppo grande ({content_length} bytes): {url}")
-                return None
-            
-            # Leggi il contenuto
-            content = response.text
-            if len(content) > config.scraping.max_content_length:
-                logger.warning(f"Contenuto troppo grande dopo il download: {url}")
-                content = content[:config.scraping.max_content_length]
+                stream=True,
+                headers=conditional_headers(etag, last_modified)
+            ) as response:
+                response.raise_for_status()
+                
+                result = FetchResult(
+                    url=url,
+                    status_code=response.status_code,
+                    etag=response.headers.get('etag'),
+                    last_modified=response.headers.get('last-modified'),
+                    moved_to=self.remember_redirects(
+                        [(hop.status_code, hop.url) for hop in response.history], response.url
+                    )
+                )
+                if result.not_modified:
+                    logger.debug(f"Contenuto invariato (304): {url}")
+                    return result
+                
+                # Scarta binari e pagine troppo grandi guardando solo gli header
+                content_type = response.headers.get('content-type')
+                if not is_text_content_type(content_type):
+                    logger.warning(f"Contenuto non testuale ({content_type}): {url}")
+                    return FetchResult.failed(url, result.status_code, "non_text")
+                
+                content_length = response.headers.get('content-length')
+                if content_length and content_length.isdigit() and int(content_length) > max_length:
+                    logger.warning(f"Contenuto troppo grande ({content_length} bytes): {url}")
+                    return FetchResult.failed(url, result.status_code, "too_large")
+                
+                # Legge a blocchi: la memoria per worker resta entro max_content_length
+                body, truncated = read_capped(response.iter_content(READ_CHUNK_SIZE), max_length)
+                if truncated:
+                    logger.warning(f"Contenuto troppo grande, troncato a {max_length} bytes: {url}")
             
-            self.last_request_time = time.time()
-            logger.debug(f"Successfully scraped {len(content)} characters from {url}")
-            return content
+            result.size = len(body)
+            result.content = body.decode(detect_encoding(content_type, body), errors="replace")
+            logger.debug(f"Successfully scraped {len(result.content)} characters from {url}")
+            return result
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to scrape {url}: {e}")
-            return None
-        finally:
-            self.last_request_time = time.time()
+            response = getattr(e, 'response', None)
+            return FetchResult.failed(url, response.status_code if response is not None else None,
+                                      classify_fetch_error(e))
 
 def retry_on_failure(max_attempts: int = 3, delay: float = 1.0, exponential_backoff: bool = True):
     """Decoratore per retry automatico di funzioni"""
@@ -195,7 +580,7 @@ def validate_url(url: str) -> str:
         raise ValueError("URL deve essere una stringa non vuota")
     
     url = url.strip()
-    if not url.startswith(('http://', 'https://')):
+    if not url.lower().startswith(("http://", "https://")):
         url = f"https://{url}"
     
     # Validazione base della URL
@@ -204,6 +589,247 @@ def validate_url(url: str) -> str:
     
     return url
 
+def canonicalize_url(url: str) -> str:
+    """
+    Forma canonica di una URL, per riconoscere le copie della stessa pagina: schema https,
+    host minuscolo senza "www." e senza porta di default, niente frammento, slash doppi o
+    finali, parametri di tracking (utm_*, gclid, ...) rimossi e query ordinata.
+    Serve come chiave: la pagina si scarica comunque dalla URL originale.
+    """
+    parts = urlsplit(validate_url(url))
+    host = (parts.hostname or "").lower().rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port in (None, 80, 443) else f"{host}:{port}"
+    
+    path = quote(unquote(re.sub(r"/{2,}", "/", parts.path)), safe="/:@!$&'()*+,;=~")
+    if len(path) > 1:
+        path = path.rstrip("/")
+    
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PARAM_PREFIXES)
+    )
+    return urlunsplit(("https", netloc, path or "/", urlencode(query), ""))
+
+class RedirectMap:
+    """
+    Redirect permanenti (301/308) osservati dallo scraper, persistiti su SQLite e tenuti in
+    memoria: URL canonica di origine -> URL di destinazione. resolve() segue le catene.
+    Il file viene aperto al primo redirect, non all'import.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._targets: Dict[str, str] = {}
+    
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS redirects ("
+                "source TEXT PRIMARY KEY, target TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._targets = dict(self._conn.execute("SELECT source, target FROM redirects"))
+        return self._conn
+    
+    def __len__(self) -> int:
+        with self._lock:
+            self._connect()
+            return len(self._targets)
+    
+    def resolve(self, url: str) -> Optional[str]:
+        """Destinazione finale della URL, None se non risulta spostata"""
+        try:
+            key = canonicalize_url(url)
+        except ValueError:
+            return None
+        with self._lock:
+            self._connect()
+            target = None
+            for _ in range(MAX_REDIRECT_HOPS):
+                following = self._targets.get(key)
+                if following is None:
+                    break
+                target = following
+                key = canonicalize_url(following)
+        return target
+    
+    def add(self, source_url: str, target_url: str):
+        try:
+            key = canonicalize_url(source_url)
+            if key == canonicalize_url(target_url):
+                return  # es. http -> https: stessa pagina, nessuna riscrittura utile
+        except ValueError:
+            return
+        with self._lock:
+            conn = self._connect()
+            if self._targets.get(key) == target_url:
+                return
+            self._targets[key] = target_url
+            conn.execute(
+                "INSERT INTO redirects (source, target, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (source) DO UPDATE SET target = excluded.target, updated_at = excluded.updated_at",
+                (key, target_url, time.time())
+            )
+        logger.info(f"Redirect permanente: {source_url} -> {target_url}")
+    
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+@dataclass
+class CachedResponse:
+    """Voce della cache HTTP: risposta 200 (testo decodificato) o fallimento riproducibile"""
+    url: str
+    status_code: Optional[int]
+    content: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    error: Optional[str]
+    moved_to: Optional[str]
+    size: int
+    stored_at: float  # ultimo download o rivalidazione
+    
+    def to_result(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchResult:
+        """FetchResult equivalente; 304 se il chiamante ha già la versione in cache (stessi validatori)"""
+        if self.error:
+            result = FetchResult.failed(url, self.status_code, self.error)
+        elif (etag and etag == self.etag) or (last_modified and last_modified == self.last_modified):
+            result = FetchResult(url=url, status_code=304, etag=self.etag, last_modified=self.last_modified)
+        else:
+            result = FetchResult(url=url, status_code=self.status_code, content=self.content, etag=self.etag,
+                                 last_modified=self.last_modified, size=self.size)
+        result.moved_to = self.moved_to
+        result.from_cache = True
+        return result
+
+class HttpCache:
+    """
+    Cache su disco (SQLite) delle risposte dello scraper, per iterare sulle regole di
+    estrazione e ripetere i crawl senza riscaricare le pagine. Chiave: impronta della
+    richiesta (metodo + URL canonica); valore: body compresso, validatori e ora del download.
+    Il file viene aperto al primo utilizzo. Thread-safe.
+    """
+    
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS responses ("
+        "fingerprint TEXT PRIMARY KEY, url TEXT NOT NULL, status_code INTEGER, body BLOB, "
+        "etag TEXT, last_modified TEXT, error TEXT, moved_to TEXT, size INTEGER NOT NULL DEFAULT 0, "
+        "stored_at REAL NOT NULL)"
+    )
+    
+    def __init__(self, path: str, mode: str = "refresh-if-stale", ttl: float = 86400.0):
+        self.path = path
+        self.mode = mode
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._stats = {"hits": 0, "misses": 0, "revalidated": 0, "stored": 0}
+    
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(self.SCHEMA)
+        return self._conn
+    
+    @staticmethod
+    def fingerprint(url: str, method: str = "GET") -> str:
+        """Impronta della richiesta: le varianti della stessa URL (tracking, maiuscole, frammento) coincidono"""
+        try:
+            url = canonicalize_url(url)
+        except ValueError:
+            pass
+        return hashlib.sha256(f"{method} {url}".encode("utf-8")).hexdigest()
+    
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
+    
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+    
+    def fresh(self, entry: CachedResponse) -> bool:
+        """La voce è più giovane del TTL (calcolato alla lettura: cambiare il TTL vale anche per le voci salvate)"""
+        return time.time() - entry.stored_at < self.ttl
+    
+    def get(self, url: str) -> Optional[CachedResponse]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT url, status_code, body, etag, last_modified, error, moved_to, size, stored_at "
+                "FROM responses WHERE fingerprint = ?", (self.fingerprint(url),)
+            ).fetchone()
+        if row is None:
+            return None
+        url, status_code, body, etag, last_modified, error, moved_to, size, stored_at = row
+        content = zlib.decompress(body).decode("utf-8") if body is not None else None
+        return CachedResponse(url, status_code, content, etag, last_modified, error, moved_to, size, stored_at)
+    
+    def answers(self, url: str) -> bool:
+        """True se get() + il modo corrente bastano a rispondere per la URL (anche con un cache_miss offline)"""
+        if self.mode == "offline":
+            return True
+        if self.mode == "refresh":
+            return False
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT stored_at FROM responses WHERE fingerprint = ?", (self.fingerprint(url),)
+            ).fetchone()
+        return row is not None and time.time() - row[0] < self.ttl
+    
+    def store(self, url: str, result: FetchResult):
+        """Salva una risposta 200 con contenuto o un fallimento riproducibile; il resto viene ignorato"""
+        if result.content is not None and not result.error:
+            body = zlib.compress(result.content.encode("utf-8"))
+        elif result.error in CACHEABLE_FAILURES or (
+                result.error == "http_4xx" and result.status_code in CACHEABLE_FAILURE_STATUSES):
+            body = None
+        else:
+            return
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO responses (fingerprint, url, status_code, body, etag, last_modified, "
+                "error, moved_to, size, stored_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.fingerprint(url), url, result.status_code, body, result.etag, result.last_modified,
+                 result.error, result.moved_to, result.size, time.time())
+            )
+            self._stats["stored"] += 1
+    
+    def touch(self, url: str):
+        """Rinnova la scadenza dopo una rivalidazione (304)"""
+        with self._lock:
+            self._connect().execute(
+                "UPDATE responses SET stored_at = ? WHERE fingerprint = ?", (time.time(), self.fingerprint(url))
+            )
+    
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+def create_http_cache() -> Optional[HttpCache]:
+    """Cache HTTP configurata (None con SCRAPING_HTTP_CACHE_MODE=off o senza percorso)"""
+    mode = config.scraping.http_cache_mode.lower()
+    if mode not in HTTP_CACHE_MODES:
+        logger.warning(f"Modo della cache HTTP '{mode}' sconosciuto, cache disattivata")
+        return None
+    if mode == "off" or not config.scraping.http_cache_path:
+        return None
+    logger.info(f"Cache HTTP attiva ({mode}): {config.scraping.http_cache_path}")
+    return HttpCache(config.scraping.http_cache_path, mode, config.scraping.http_cache_ttl_hours * 3600)
+
 def clean_text(text: str) -> str:
     """Pulisce il testo estratto da HTML"""
     if not text: